@@ -2,5 +2,7 @@
 set -o errexit
 
 pip install -r requirements.txt
+# Fall back to system fonts if Google Fonts cannot be reached
+python manage.py build_assets --fonts || python manage.py build_assets
 python manage.py collectstatic --no-input
 python manage.py migrate
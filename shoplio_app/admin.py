@@ -1,7 +1,27 @@
+import datetime
+
 from django.contrib import admin
+from django.db.models import Avg, Count, DurationField, Exists, ExpressionWrapper, F, OuterRef
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from . import exports, price_history, sales_cube, tasks
+from .admin_performance import AutocompleteFilter, LargeTableAdmin
+from .conditional import bump_catalog_version
 from .models import (Category, Merchant, Product, ProductMerchant, ClickTracking, Review, Seller, Banner, Order, OrderItem,
-                    Affiliate, AffiliateClick, Commission)
+                    Affiliate, AffiliateClick, Commission, ProductMatch, SalesCell, Task)
+
+
+def export_as_csv(modeladmin, request, queryset):
+    """Download the selected rows as CSV"""
+    return exports.streaming_response(exports.export_for(modeladmin.model), queryset, 'csv')
+export_as_csv.short_description = "Export selected as CSV"
+
+
+def export_as_ndjson(modeladmin, request, queryset):
+    """Download the selected rows as NDJSON"""
+    return exports.streaming_response(exports.export_for(modeladmin.model), queryset, 'ndjson')
+export_as_ndjson.short_description = "Export selected as NDJSON"
 
 
 @admin.register(Category)
@@ -48,14 +68,33 @@ class SellerAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+class PossibleDuplicateFilter(admin.SimpleListFilter):
+    title = 'possible duplicate'
+    parameter_name = 'duplicate'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(has_duplicates=True)
+        if self.value() == 'no':
+            return queryset.filter(has_duplicates=False)
+        return queryset
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'seller', 'category', 'base_price', 'is_approved', 'is_featured', 'is_active', 'created_at']
+class ProductAdmin(LargeTableAdmin):
+    list_display = ['name', 'seller', 'category', 'base_price', 'is_approved', 'duplicate_flag', 'is_featured',
+                    'is_active', 'created_at']
+    list_select_related = ['seller__user', 'category']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description', 'brand', 'sku', 'seller__company_name']
-    list_filter = ['category', 'is_approved', 'is_featured', 'is_active', 'seller', 'created_at']
+    list_filter = ['category', 'is_approved', PossibleDuplicateFilter, 'is_featured', 'is_active',
+                   ('seller', AutocompleteFilter), 'created_at']
+    autocomplete_fields = ['seller']
     inlines = [ProductMerchantInline, ReviewInline]
-    readonly_fields = ['reviewed_by', 'reviewed_at', 'created_at', 'updated_at']
+    readonly_fields = ['reviewed_by', 'reviewed_at', 'possible_duplicates', 'created_at', 'updated_at']
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'slug', 'description', 'category', 'brand', 'sku', 'seller')
@@ -67,7 +106,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('base_price', 'currency')
         }),
         ('Admin Approval', {
-            'fields': ('is_approved', 'reviewed_by', 'reviewed_at', 'admin_notes'),
+            'fields': ('is_approved', 'possible_duplicates', 'reviewed_by', 'reviewed_at', 'admin_notes'),
             'description': 'Admin must approve products before they are visible to customers.'
         }),
         ('Reviews', {
@@ -82,12 +121,49 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            has_duplicates=Exists(ProductMatch.objects.filter(product=OuterRef('pk')))
+        )
+
+    def duplicate_flag(self, obj):
+        return obj.has_duplicates
+    duplicate_flag.short_description = "Duplicate?"
+    duplicate_flag.boolean = True
+    duplicate_flag.admin_order_field = 'has_duplicates'
+
+    def possible_duplicates(self, obj):
+        matches = ProductMatch.objects.filter(product=obj).select_related('match__seller')[:10] if obj.pk else []
+        if not matches:
+            return 'None found'
+        return format_html('<ul>{}</ul>', format_html_join(
+            '', '<li><a href="{}">{}</a> ({}, {:.0%} similar)</li>',
+            ((reverse('admin:shoplio_app_product_change', args=[match.match_id]), match.match.name,
+              match.match.seller.company_name if match.match.seller else 'no seller', match.similarity)
+             for match in matches),
+        ))
+    possible_duplicates.short_description = "Possible duplicates"
+
     def save_model(self, request, obj, form, change):
         """Auto-set reviewed_by when approving/rejecting"""
         if 'is_approved' in form.changed_data:
             obj.reviewed_by = request.user
             obj.reviewed_at = timezone.now()
         super().save_model(request, obj, form, change)
+        if not change or {'name', 'brand', 'sku', 'description'} & set(form.changed_data):
+            tasks.enqueue('match_products', {'product_ids': [obj.pk]})
+
+    def save_formset(self, request, form, formset, change):
+        """Stamp and record offer prices changed in the inline, as ProductMerchantAdmin.save_model does"""
+        if formset.model is not ProductMerchant:
+            return super().save_formset(request, form, formset, change)
+        now = timezone.now()
+        for offer_form in formset.forms:
+            if offer_form.has_changed() and (offer_form.instance.pk is None or 'price' in offer_form.changed_data):
+                offer_form.instance.last_price_update = now
+        super().save_formset(request, form, formset, change)
+        priced = formset.new_objects + [offer for offer, fields in formset.changed_objects if 'price' in fields]
+        price_history.record([(offer.pk, offer.product_id, offer.price) for offer in priced], at=now)
     
     actions = ['approve_products', 'reject_products']
     
@@ -96,8 +172,10 @@ class ProductAdmin(admin.ModelAdmin):
         updated = queryset.update(
             is_approved=True,
             reviewed_by=request.user,
-            reviewed_at=timezone.now()
+            reviewed_at=timezone.now(),
+            updated_at=timezone.now(),
         )
+        bump_catalog_version()
         self.message_user(request, f'{updated} products approved.')
     approve_products.short_description = "Approve selected products"
     
@@ -106,8 +184,10 @@ class ProductAdmin(admin.ModelAdmin):
         updated = queryset.update(
             is_approved=False,
             reviewed_by=request.user,
-            reviewed_at=timezone.now()
+            reviewed_at=timezone.now(),
+            updated_at=timezone.now(),
         )
+        bump_catalog_version()
         self.message_user(request, f'{updated} products rejected.')
     reject_products.short_description = "Reject selected products"
 
@@ -136,14 +216,25 @@ class ProductMerchantAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        """Stamp last_price_update and record history only when the price itself changes"""
+        price_changed = not change or 'price' in form.changed_data
+        if price_changed:
+            obj.last_price_update = timezone.now()
+        super().save_model(request, obj, form, change)
+        if price_changed:
+            price_history.record([(obj.pk, obj.product_id, obj.price)], at=obj.last_price_update)
+
 
 @admin.register(ClickTracking)
-class ClickTrackingAdmin(admin.ModelAdmin):
+class ClickTrackingAdmin(LargeTableAdmin):
     list_display = ['product_merchant', 'clicked_at', 'ip_address']
+    list_select_related = ['product_merchant__product', 'product_merchant__merchant']
     list_filter = ['clicked_at', 'product_merchant__merchant', 'product_merchant__product__category']
     search_fields = ['product_merchant__product__name', 'product_merchant__merchant__name', 'ip_address']
     readonly_fields = ['product_merchant', 'clicked_at', 'ip_address', 'user_agent', 'referrer']
     date_hierarchy = 'clicked_at'
+    actions = [export_as_csv, export_as_ndjson]
 
 
 @admin.register(Review)
@@ -166,12 +257,14 @@ class OrderItemInline(admin.TabularInline):
     can_delete = False
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['order_id', 'full_name', 'email', 'total_amount', 'affiliate', 'status', 'created_at']
-    list_filter = ['status', 'created_at', 'affiliate']
+    list_select_related = ['affiliate']
+    list_filter = ['status', 'created_at', ('affiliate', AutocompleteFilter)]
     search_fields = ['order_id', 'full_name', 'email']
     inlines = [OrderItemInline]
     readonly_fields = ['order_id', 'user', 'affiliate', 'created_at']
+    actions = [export_as_csv, export_as_ndjson]
 
 
 # ============================================
@@ -179,9 +272,10 @@ class OrderAdmin(admin.ModelAdmin):
 # ============================================
 
 @admin.register(Affiliate)
-class AffiliateAdmin(admin.ModelAdmin):
+class AffiliateAdmin(LargeTableAdmin):
     list_display = ['affiliate_code', 'full_name', 'user', 'total_earnings', 'total_sales', 'total_clicks', 
                    'is_approved', 'is_active', 'created_at']
+    list_select_related = ['user']
     list_filter = ['is_approved', 'is_active', 'payment_method', 'created_at']
     search_fields = ['affiliate_code', 'full_name', 'user__username', 'user__email']
     readonly_fields = ['affiliate_code', 'total_clicks', 'total_sales', 'total_earnings', 
@@ -231,19 +325,22 @@ class AffiliateAdmin(admin.ModelAdmin):
 
 
 @admin.register(AffiliateClick)
-class AffiliateClickAdmin(admin.ModelAdmin):
+class AffiliateClickAdmin(LargeTableAdmin):
     list_display = ['affiliate', 'product', 'converted', 'clicked_at', 'ip_address']
-    list_filter = ['converted', 'clicked_at', 'affiliate']
+    list_select_related = ['affiliate', 'product']
+    list_filter = ['converted', 'clicked_at', ('affiliate', AutocompleteFilter)]
     search_fields = ['affiliate__affiliate_code', 'affiliate__full_name', 'product__name', 'ip_address']
     readonly_fields = ['affiliate', 'product', 'ip_address', 'user_agent', 'referrer', 
                       'converted', 'order', 'clicked_at', 'converted_at']
     date_hierarchy = 'clicked_at'
+    actions = [export_as_csv, export_as_ndjson]
 
 
 @admin.register(Commission)
-class CommissionAdmin(admin.ModelAdmin):
+class CommissionAdmin(LargeTableAdmin):
     list_display = ['affiliate', 'product_name', 'commission_amount', 'status', 'created_at']
-    list_filter = ['status', 'created_at', 'affiliate']
+    list_select_related = ['affiliate']
+    list_filter = ['status', 'created_at', ('affiliate', AutocompleteFilter)]
     search_fields = ['affiliate__affiliate_code', 'affiliate__full_name', 'product_name', 'order__order_id']
     readonly_fields = ['affiliate', 'order', 'product_name', 'product_price', 'commission_rate',
                       'commission_amount', 'created_at', 'updated_at']
@@ -261,7 +358,7 @@ class CommissionAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['approve_commissions', 'mark_as_paid', 'cancel_commissions']
+    actions = ['approve_commissions', 'mark_as_paid', 'cancel_commissions', export_as_csv, export_as_ndjson]
     
     def approve_commissions(self, request, queryset):
         """Bulk approve commissions"""
@@ -289,3 +386,103 @@ class CommissionAdmin(admin.ModelAdmin):
             commission.save()
         self.message_user(request, f'{queryset.count()} commissions cancelled.')
     cancel_commissions.short_description = "Cancel selected commissions"
+
+
+# ============================================
+# SALES REPORTING ADMIN
+# ============================================
+
+@admin.register(SalesCell)
+class SalesCellAdmin(admin.ModelAdmin):
+    list_display = ['day', 'product', 'category', 'city', 'affiliate', 'status', 'orders', 'units', 'revenue']
+    list_select_related = ['product', 'category', 'affiliate']
+    list_filter = ['status', 'category', ('product', AutocompleteFilter), ('affiliate', AutocompleteFilter)]
+    search_fields = ['city']
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        """Group the filtered cells by the dimensions named in ?group_by= above the cell list"""
+        try:
+            group_by = sales_cube.parse_group_by(request.GET.get('group_by')) or ['day']
+        except ValueError:
+            group_by = ['day']
+        # The changelist rejects parameters that are not filters
+        request.GET = request.GET.copy()
+        request.GET.pop('group_by', None)
+        response = super().changelist_view(request, extra_context=extra_context)
+        if not hasattr(response, 'context_data'):
+            return response
+        rows, totals = sales_cube.summarize(response.context_data['cl'].queryset, group_by)
+        columns = [name for dimension in group_by for name, _ in sales_cube.DIMENSIONS[dimension]]
+        query = request.GET.copy()
+        group_links = []
+        for dimension in sales_cube.DIMENSIONS:
+            query['group_by'] = dimension
+            group_links.append((dimension, f'?{query.urlencode()}', group_by == [dimension]))
+        response.context_data.update({
+            'report_columns': columns + list(sales_cube.MEASURES),
+            'report_rows': [[row[column] for column in columns + list(sales_cube.MEASURES)] for row in rows],
+            'report_totals': [totals[measure] for measure in sales_cube.MEASURES],
+            'report_group_links': group_links,
+            'report_group_columns': len(columns),
+        })
+        return response
+
+
+# ============================================
+# BACKGROUND TASKS ADMIN
+# ============================================
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'idempotency_key', 'claimed_by']
+    readonly_fields = ['name', 'payload', 'idempotency_key', 'status', 'attempts', 'max_attempts', 'run_after',
+                      'locked_until', 'claimed_by', 'last_error', 'created_at', 'started_at', 'finished_at']
+    date_hierarchy = 'created_at'
+    
+    actions = ['retry_tasks']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        """Show queue depth and recent task latency above the task list"""
+        extra_context = extra_context or {}
+        extra_context['queue_depth'] = (
+            Task.objects.values('name', 'status').annotate(count=Count('id')).order_by('name', 'status')
+        )
+        since = timezone.now() - datetime.timedelta(hours=1)
+        extra_context['queue_latency'] = (
+            Task.objects.filter(status='done', finished_at__gte=since)
+            .values('name')
+            .annotate(
+                count=Count('id'),
+                avg_wait=Avg(ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField())),
+                avg_run=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())),
+            )
+            .order_by('name')
+        )
+        return super().changelist_view(request, extra_context=extra_context)
+    
+    def retry_tasks(self, request, queryset):
+        """Requeue failed tasks immediately with a fresh attempt budget"""
+        updated = queryset.filter(status='failed').update(
+            status='queued',
+            attempts=0,
+            run_after=timezone.now(),
+            locked_until=None,
+            finished_at=None,
+        )
+        self.message_user(request, f'{updated} tasks requeued.')
+    retry_tasks.short_description = "Retry selected failed tasks"
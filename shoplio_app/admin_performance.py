@@ -0,0 +1,220 @@
+"""
+Changelist helpers for admin pages over large tables.
+
+- `EstimatedCountPaginator` asks the database for its row estimate instead of
+  running COUNT(*) when an unfiltered table is big.
+- `AutocompleteFilter` filters by a foreign key through the admin's select2
+  autocomplete instead of listing every related object in the sidebar.
+- `KeysetChangeList` pages through rows with a "seek" cursor on the ordering
+  columns instead of OFFSET, so page 10,000 costs the same as page 1.
+
+`LargeTableAdmin` combines them; list_select_related still has to be set per
+admin to cover what list_display touches.
+"""
+
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import IS_FACETS_VAR, PAGE_VAR, ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'after'
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATE_THRESHOLD = 100000
+
+CURSOR_SALT = 'shoplio_app.admin.keyset'
+
+
+def estimate_rows(model):
+    """The database's cheap row-count estimate for `model`'s table, or None"""
+    connection = connections[model._default_manager.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        else:
+            # No planner statistics: the highest pk bounds the row count
+            return model._base_manager.aggregate(top=Max('pk'))['top'] or 0
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses a row estimate for large, unfiltered querysets"""
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimate_rows(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    Foreign key filter rendered as an autocomplete box.
+
+    Only the selected object is loaded, never the full list of choices. The
+    related model's admin must define search_fields.
+    """
+
+    template = 'admin/shoplio_app/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.model_admin = model_admin
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        value = self.lookup_val[-1] if self.lookup_val else ''
+        remote_model = self.field.remote_field.model
+        widget = AutocompleteSelect(self.field, self.model_admin.admin_site, attrs={
+            'onchange': 'this.form.submit()',
+            'data-width': '100%',
+        })
+        form_field = forms.ModelChoiceField(
+            queryset=remote_model._default_manager.all(),
+            widget=widget,
+            required=False,
+        )
+        hidden = [
+            (name, item)
+            for name, values in changelist.filter_params.items()
+            if name not in (self.lookup_kwarg, self.lookup_kwarg_isnull, CURSOR_VAR, PAGE_VAR)
+            for item in values
+        ]
+        yield {
+            'selected': not value,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            'display': 'All',
+        }
+        yield {
+            'widget': form_field.widget.render(self.lookup_kwarg, value, attrs={'id': f'filter_{self.lookup_kwarg}'}),
+            'hidden_params': hidden,
+        }
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList paged by a cursor over its ordering columns.
+
+    Works when every ordering column is a non-null field of the model itself
+    (e.g. -created_at, -pk); otherwise it falls back to ordinary page numbers.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset = False
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+        # Links built from here on (sorting, filters) start again from the first page
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+        self.remove_facet_link = self.get_query_string(remove=[IS_FACETS_VAR])
+        self.add_facet_link = self.get_query_string({IS_FACETS_VAR: True})
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def keyset_fields(self, queryset):
+        """[(field, descending)] for the queryset's ordering, or None if unsupported"""
+        fields = []
+        for part in queryset.query.order_by:
+            if not isinstance(part, str) or part == '?':
+                return None
+            name = part.lstrip('-')
+            try:
+                field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation or field.null or not field.concrete:
+                return None
+            fields.append((field, part.startswith('-')))
+        return fields or None
+
+    def seek(self, queryset, fields, values):
+        """Rows strictly after `values` in the (field, descending) ordering"""
+        condition = Q()
+        for position, (field, descending) in enumerate(fields):
+            step = Q(**{f'{field.name}__{"lt" if descending else "gt"}': values[position]})
+            for (earlier, _), value in zip(fields[:position], values):
+                step &= Q(**{earlier.name: value})
+            condition |= step
+        return queryset.filter(condition)
+
+    def get_results(self, request):
+        super().get_results(request)
+        fields = self.keyset_fields(self.queryset)
+        if fields is None or self.show_all:
+            return
+
+        self.keyset = True
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                raw = signing.loads(self.cursor, salt=CURSOR_SALT)
+                if len(raw) != len(fields):
+                    raise ValueError('Cursor does not match the ordering')
+                values = [field.to_python(value) for (field, _), value in zip(fields, raw)]
+            except (signing.BadSignature, ValidationError, TypeError, ValueError):
+                raise IncorrectLookupParameters
+            queryset = self.seek(queryset, fields, values)
+
+        self.result_list = queryset[:self.list_per_page]
+        rows = list(self.result_list)
+        self.multi_page = self.multi_page or bool(self.cursor)
+        if len(rows) == self.list_per_page:
+            last = rows[-1]
+            self.next_cursor = signing.dumps([field.value_to_string(last) for field, _ in fields], salt=CURSOR_SALT)
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, remove=[PAGE_VAR])
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin defaults for tables too big for COUNT(*) and OFFSET paging"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, tuple) and issubclass(list_filter[1], AutocompleteFilter):
+                field = self.model._meta.get_field(list_filter[0])
+                return media + AutocompleteSelect(field, self.admin_site).media
+        return media
@@ -0,0 +1,57 @@
+"""
+Per-product counters behind the seller analytics dashboard.
+
+Counters live in ProductStats and are bumped with a single UPDATE of F()
+expressions, so concurrent requests never lose increments and nothing has to
+read the row first. A product's row is created the first time it is counted.
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from . import tracking
+from .models import Order, ProductStats
+
+# Page views get their own deduplicator so they never crowd click keys out
+# of the click deduplicator or show up in its stats
+_view_deduplicator = tracking.ClickDeduplicator(
+    settings.CLICK_DEDUP_WINDOW_SECONDS,
+    max_keys=settings.CLICK_DEDUP_MAX_KEYS,
+)
+
+
+def increment(product_id, **deltas):
+    """Add `deltas` (field=amount) to the product's counters"""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    stats = ProductStats.objects.filter(product_id=product_id)
+    if stats.update(updated_at=timezone.now(), **updates):
+        return
+    try:
+        with transaction.atomic():
+            ProductStats.objects.create(product_id=product_id, **deltas)
+    except IntegrityError:
+        # Another request created the row first
+        stats.update(updated_at=timezone.now(), **updates)
+
+
+def record_detail_view(request, product):
+    """Count a product page view, ignoring reloads by the same visitor"""
+    if not _view_deduplicator.is_duplicate(tracking.visitor_key(request, f'product-view:{product.pk}')):
+        increment(product.pk, detail_views=1)
+
+
+def record_merchant_click(product_id):
+    increment(product_id, merchant_clicks=1)
+
+
+def record_order(order):
+    """Count an order's items once, however often it is called; returns True if counted"""
+    line_total = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, stats_recorded=False).update(stats_recorded=True):
+            return False
+        for row in order.items.values('product_id').annotate(units=Sum('quantity'), revenue=Sum(line_total)):
+            increment(row['product_id'], orders=1, units_sold=row['units'], revenue=row['revenue'])
+    return True
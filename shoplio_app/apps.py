@@ -5,3 +5,6 @@ class ShoplioAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shoplio_app'
 
+    def ready(self):
+        # Register background task handlers and model signal handlers
+        from . import jobs, signals  # noqa: F401
@@ -0,0 +1,161 @@
+"""
+Static asset helpers: CSS minification, critical CSS and self-hosted fonts.
+
+The build_assets command writes two generated files into static/:
+
+- css/critical.css: the @font-face rules plus the style.css rules needed to
+  paint the page frame (CRITICAL_SELECTORS), minified. base.html inlines it
+  with `{% critical_css %}` and loads the full stylesheet without blocking.
+- fonts/*.woff2 and css/fonts.css: Inter downloaded from Google Fonts, only
+  the FONT_SUBSETS unicode ranges, so pages never call a third-party host.
+
+collectstatic then minifies every stylesheet, adds content hashes and writes
+gzip and Brotli copies (MinifiedManifestStaticFilesStorage).
+"""
+
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+CRITICAL_SOURCE = 'css/style.css'
+CRITICAL_PATH = 'css/critical.css'
+FONTS_PATH = 'css/fonts.css'
+
+# Rules whose selector starts with one of these are inlined in every page
+CRITICAL_SELECTORS = re.compile(
+    r'^(:root|\*|html|body|a|ul|img|main|\.container|\.navbar|\.nav-[\w-]+|\.logo|'
+    r'\.search-[\w-]+|\.seller-btn|\.mt-4)(?![\w-])'
+)
+
+GOOGLE_FONTS_CSS = 'https://fonts.googleapis.com/css2?family=Inter:wght@400..800&display=swap'
+FONT_SUBSETS = {'latin'}
+# Google Fonts only serves woff2 to browsers it knows support it
+FONT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+URL_PATTERN = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+# Path -> inlined stylesheet, kept for the life of the process unless DEBUG
+_inline_cache = {}
+
+
+def minify_css(css):
+    """Drop comments and redundant whitespace; the stylesheet's meaning is unchanged"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def split_rules(css):
+    """Top-level (prelude, body) pairs; a body keeps any nested blocks as text"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    rules = []
+    depth = 0
+    start = 0
+    prelude = ''
+    for position, char in enumerate(css):
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:position].strip()
+                start = position + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude, css[start:position]))
+                start = position + 1
+    return rules
+
+
+def critical_rules(css):
+    """The rules of `css` that match CRITICAL_SELECTORS, as CSS text"""
+    kept = []
+    for prelude, body in split_rules(css):
+        if prelude.startswith('@media'):
+            inner = critical_rules(body)
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@font-face') or prelude.startswith('@import'):
+            kept.append(f'{prelude}{{{body}}}')
+        elif any(CRITICAL_SELECTORS.match(selector.strip()) for selector in prelude.split(',')):
+            kept.append(f'{prelude}{{{body}}}')
+    return '\n'.join(kept)
+
+
+def fetch_fonts(static_root):
+    """
+    Download the FONT_SUBSETS of Inter into static_root/fonts.
+
+    Returns the @font-face rules pointing at the local files, with urls
+    relative to static_root/css.
+    """
+    request = urllib.request.Request(GOOGLE_FONTS_CSS, headers={'User-Agent': FONT_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        css = response.read().decode('utf-8')
+
+    font_dir = Path(static_root) / 'fonts'
+    font_dir.mkdir(parents=True, exist_ok=True)
+    faces = []
+    for subset, face in re.findall(r'/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*{[^}]*})', css):
+        if subset not in FONT_SUBSETS:
+            continue
+        url = URL_PATTERN.search(face).group(2)
+        weight = re.search(r'font-weight:\s*([^;]+);', face).group(1).strip().replace(' ', '-')
+        name = f'inter-{subset}-{weight}.woff2'
+        with urllib.request.urlopen(url, timeout=30) as response:
+            (font_dir / name).write_bytes(response.read())
+        faces.append(face.replace(url, f'../fonts/{name}'))
+    return faces
+
+
+def _read_static(path):
+    """Contents of a static file, collected (hashed) copy first, else the source"""
+    try:
+        name = staticfiles_storage.stored_name(path) if hasattr(staticfiles_storage, 'stored_name') else path
+    except ValueError:
+        # Not collected (or missing from the manifest)
+        name = path
+    if staticfiles_storage.exists(name):
+        with staticfiles_storage.open(name) as fileobj:
+            return fileobj.read().decode('utf-8'), name
+    source = finders.find(path)
+    if source is None:
+        return None, path
+    return Path(source).read_text(encoding='utf-8'), path
+
+
+def inline_stylesheet(path):
+    """
+    A stylesheet's text for a <style> element, with relative url()s made
+    absolute static URLs, or '' if the file does not exist.
+    """
+    if path in _inline_cache and not settings.DEBUG:
+        return _inline_cache[path]
+
+    css, name = _read_static(path)
+    if css is None:
+        css = ''
+    else:
+        base = posixpath.dirname(name)
+
+        def absolute(match):
+            url = match.group(2)
+            if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+                return match.group(0)
+            # Collected stylesheets already point at hashed names
+            return f"url('{settings.STATIC_URL}{posixpath.normpath(posixpath.join(base, url))}')"
+
+        css = URL_PATTERN.sub(absolute, css)
+    _inline_cache[path] = css
+    return css
+
+
+def font_urls(css):
+    """woff2 urls referenced by `css`, for preload links"""
+    return [url for _, url in URL_PATTERN.findall(css) if url.endswith('.woff2')]
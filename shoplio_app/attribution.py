@@ -0,0 +1,80 @@
+"""
+Affiliate conversion attribution.
+
+When a visitor follows an affiliate link, the AffiliateClick id is stored in a
+signed, timestamped cookie. At checkout the cookie is verified and the click
+is fetched by primary key, so attributing a sale never scans the affiliate's
+click history. Cookies older than the attribution window are ignored.
+
+A click converts once: a cookie naming a converted click credits nobody. The
+plain affiliate code cookie, set before click ids existed, is only used when
+there is no click cookie at all.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import Affiliate, AffiliateClick
+
+CLICK_COOKIE = 'affiliate_click'
+AFFILIATE_COOKIE = 'affiliate_code'
+
+_signer = signing.TimestampSigner(salt='shoplio_app.attribution')
+
+
+def attribution_window():
+    return datetime.timedelta(days=settings.AFFILIATE_ATTRIBUTION_WINDOW_DAYS)
+
+
+def set_click_cookie(response, click):
+    """Issue the signed click id for a freshly recorded AffiliateClick"""
+    response.set_cookie(
+        CLICK_COOKIE,
+        _signer.sign(str(click.pk)),
+        max_age=int(attribution_window().total_seconds()),
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def resolve_click(request):
+    """
+    Return the unconverted AffiliateClick named by the request's click cookie,
+    with its affiliate loaded, or None if there is no valid, in-window click.
+    """
+    value = request.COOKIES.get(CLICK_COOKIE)
+    if not value:
+        return None
+    try:
+        click_id = int(_signer.unsign(value, max_age=attribution_window()))
+    except (signing.BadSignature, ValueError):
+        return None
+    return AffiliateClick.objects.select_related('affiliate').filter(
+        pk=click_id,
+        converted=False,
+        affiliate__is_active=True,
+        affiliate__is_approved=True,
+    ).first()
+
+
+def resolve(request):
+    """(click, affiliate) to credit a checkout with; both None when there is nothing to credit"""
+    if CLICK_COOKIE in request.COOKIES:
+        click = resolve_click(request)
+        return (click, click.affiliate) if click else (None, None)
+    code = request.COOKIES.get(AFFILIATE_COOKIE)
+    if not code:
+        return None, None
+    return None, Affiliate.objects.filter(affiliate_code=code, is_active=True, is_approved=True).first()
+
+
+def mark_converted(click, order):
+    """Mark the click converted by primary key; returns False if it already was"""
+    return AffiliateClick.objects.filter(pk=click.pk, converted=False).update(
+        converted=True,
+        order=order,
+        converted_at=timezone.now(),
+    ) == 1
@@ -0,0 +1,258 @@
+"""
+ClickBank marketplace feed import.
+
+The marketplace export (CSV, JSON lines or XML) is streamed in chunks. An offer
+is keyed by its vendor and slug: the row's slug (or id) if it has one, else
+"<vendor>-<name>" slugified. Each chunk's slugs are looked up in one query;
+new offers are inserted with bulk_create, offers whose fields changed are
+written with bulk_update, and unchanged offers only get last_seen_at stamped,
+in one UPDATE per chunk. A slug already used by another vendor's offer is
+reported as an error.
+
+Once the whole file has been read, active offers the run did not see are
+deactivated with a single UPDATE on last_seen_at. A row that fails validation
+still counts as seen when its vendor and slug can be worked out, so one bad
+row never switches an offer off. Pass deactivate_missing=False for partial
+feeds.
+
+Columns: vendor, name (or title), description, category (slug, name or id),
+hoplink (or url, link), price, commission_rate (or commission), and optionally
+slug (or id), estimated_commission (default: price times commission_rate),
+currency, brand and image (or image_url, product_image_url).
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .conditional import bump_catalog_version
+from .feeds import InvalidRow, chunked, iter_records
+from .models import ClickBankProduct
+from .product_import import category_map
+
+CHUNK_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Compared with the stored offer to decide whether a row changes it
+FIELDS = ('name', 'description', 'category_id', 'vendor', 'hoplink', 'product_image_url', 'price', 'currency',
+          'commission_rate', 'estimated_commission', 'brand', 'is_active')
+UPDATE_FIELDS = ['category' if field == 'category_id' else field for field in FIELDS]
+VENDOR = FIELDS.index('vendor')
+
+SLUG_MAX_LENGTH = ClickBankProduct._meta.get_field('slug').max_length
+URL_MAX_LENGTH = ClickBankProduct._meta.get_field('hoplink').max_length
+MAX_PRICE = Decimal('100000000')
+
+
+class ClickBankFeedResult:
+    """Counts and per-row errors from one feed run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deactivated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+def _first(record, *fields):
+    for field in fields:
+        value = str(record.get(field) or '').strip()
+        if value:
+            return value
+    return ''
+
+
+def offer_key(record):
+    """(vendor, slug) identifying a row's offer; either may be empty"""
+    vendor = _first(record, 'vendor')
+    slug = slugify(_first(record, 'slug', 'id'))
+    if not slug and vendor:
+        slug = slugify(f"{vendor} {_first(record, 'name', 'title')}")
+    return vendor, slug[:SLUG_MAX_LENGTH].strip('-')
+
+
+def _decimal(field, value, maximum):
+    try:
+        number = Decimal(value.replace(',', '').lstrip('$'))
+    except InvalidOperation:
+        raise ValueError(f'{field} must be a number')
+    if not number.is_finite() or number < 0 or number >= maximum:
+        raise ValueError(f'{field} must be between 0 and {maximum - Decimal("0.01"):,}')
+    return number.quantize(Decimal('0.01'))
+
+
+def _url(field, value, required=False):
+    if not value:
+        if required:
+            raise ValueError(f'{field} is required')
+        return ''
+    if not value.startswith(('http://', 'https://')):
+        raise ValueError(f'{field} must be an http(s) URL')
+    if len(value) > URL_MAX_LENGTH:
+        raise ValueError(f'{field} is longer than {URL_MAX_LENGTH} characters')
+    return value
+
+
+def _clean(record, categories, vendor):
+    """Return ClickBankProduct field values for a record, or raise ValueError"""
+    def text(value, field, max_length, required=False):
+        if required and not value:
+            raise ValueError(f'{field} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        return value
+
+    name = text(_first(record, 'name', 'title'), 'name', 300, required=True)
+    description = text(_first(record, 'description'), 'description', 100000, required=True)
+
+    category_key = _first(record, 'category').lower()
+    if not category_key:
+        raise ValueError('category is required')
+    category = categories.get(category_key)
+    if category is None:
+        raise ValueError(f'unknown category "{record.get("category")}"')
+
+    price_text = _first(record, 'price')
+    if not price_text:
+        raise ValueError('price is required')
+    price = _decimal('price', price_text, MAX_PRICE)
+    rate_text = _first(record, 'commission_rate', 'commission').rstrip('%')
+    if not rate_text:
+        raise ValueError('commission_rate is required')
+    commission_rate = _decimal('commission_rate', rate_text, Decimal('100.01'))
+    commission_text = _first(record, 'estimated_commission')
+    if commission_text:
+        estimated_commission = _decimal('estimated_commission', commission_text, MAX_PRICE)
+    else:
+        estimated_commission = (price * commission_rate / 100).quantize(Decimal('0.01'))
+
+    return {
+        'name': name,
+        'description': description,
+        'category_id': category.pk,
+        'vendor': text(vendor, 'vendor', 100, required=True),
+        'hoplink': _url('hoplink', _first(record, 'hoplink', 'url', 'link'), required=True),
+        'product_image_url': _url('image', _first(record, 'image', 'image_url', 'product_image_url')),
+        'price': price,
+        'currency': text(_first(record, 'currency').upper() or 'USD', 'currency', 3),
+        'commission_rate': commission_rate,
+        'estimated_commission': estimated_commission,
+        'brand': text(_first(record, 'brand'), 'brand', 100),
+        'is_active': True,
+    }
+
+
+def _write(rows, seen, seen_at, result, dry_run):
+    """
+    Upsert one chunk. `rows` maps (vendor, slug) to (line number, fields) for
+    valid rows; `seen` holds (vendor, slug) for every row whose offer could be
+    identified.
+    """
+    existing = {}
+    slugs = {slug for _, slug in seen}
+    for pk, slug, *values in ClickBankProduct.objects.filter(slug__in=slugs).values_list('pk', 'slug', *FIELDS):
+        existing[slug] = (pk, tuple(values))
+
+    created = {}
+    changed = []
+    for (vendor, slug), (line_number, fields) in rows.items():
+        if slug not in existing:
+            if slug in created:
+                result.add_error(line_number, f'slug "{slug}" belongs to vendor {created[slug].vendor}')
+            else:
+                created[slug] = ClickBankProduct(slug=slug, last_seen_at=seen_at, **fields)
+            continue
+        pk, values = existing[slug]
+        if values[VENDOR] != vendor:
+            result.add_error(line_number, f'slug "{slug}" belongs to vendor {values[VENDOR]}')
+        elif tuple(fields[field] for field in FIELDS) != values:
+            changed.append(ClickBankProduct(pk=pk, updated_at=seen_at, last_seen_at=seen_at, **fields))
+        else:
+            result.unchanged += 1
+    # Unchanged offers, and offers whose row was invalid, only need stamping
+    written = {product.pk for product in changed}
+    stamped = sorted({existing[slug][0] for vendor, slug in seen
+                      if slug in existing and existing[slug][1][VENDOR] == vendor} - written)
+
+    result.created += len(created)
+    result.updated += len(changed)
+    if dry_run:
+        return
+    with transaction.atomic():
+        if created:
+            ClickBankProduct.objects.bulk_create(list(created.values()), batch_size=WRITE_BATCH_SIZE)
+        if changed:
+            ClickBankProduct.objects.bulk_update(
+                changed, UPDATE_FIELDS + ['updated_at', 'last_seen_at'], batch_size=WRITE_BATCH_SIZE,
+            )
+        for start in range(0, len(stamped), WRITE_BATCH_SIZE):
+            ClickBankProduct.objects.filter(pk__in=stamped[start:start + WRITE_BATCH_SIZE]).update(
+                last_seen_at=seen_at,
+            )
+        if created or changed:
+            bump_catalog_version()
+
+
+def deactivate_missing_offers(seen_at, dry_run=False):
+    """Switch off active offers last seen before `seen_at`; returns how many"""
+    missing = ClickBankProduct.objects.filter(is_active=True).filter(
+        Q(last_seen_at__lt=seen_at) | Q(last_seen_at__isnull=True)
+    )
+    if dry_run:
+        return missing.count()
+    with transaction.atomic():
+        count = missing.update(is_active=False, updated_at=timezone.now())
+        if count:
+            bump_catalog_version()
+    return count
+
+
+def import_clickbank_feed(fileobj, fmt, chunk_size=CHUNK_SIZE, deactivate_missing=True, dry_run=False):
+    """Stream `fileobj` into ClickBankProduct, then deactivate offers it no longer lists"""
+    result = ClickBankFeedResult()
+    categories = category_map()
+    seen_at = timezone.now()
+    any_seen = False
+
+    for chunk in chunked(iter_records(fileobj, fmt), chunk_size):
+        # (vendor, slug) -> (line number, fields); a later row for the same offer wins
+        rows = {}
+        seen = []
+        for line_number, record in chunk:
+            result.rows += 1
+            if isinstance(record, InvalidRow):
+                result.add_error(line_number, record.message)
+                continue
+            vendor, slug = offer_key(record)
+            if not vendor:
+                result.add_error(line_number, 'vendor is required')
+                continue
+            if not slug:
+                result.add_error(line_number, 'slug or name is required')
+                continue
+            seen.append((vendor, slug))
+            try:
+                rows[vendor, slug] = (line_number, _clean(record, categories, vendor))
+            except ValueError as e:
+                rows.pop((vendor, slug), None)
+                result.add_error(line_number, str(e))
+        if seen:
+            any_seen = True
+            _write(rows, seen, seen_at, result, dry_run)
+
+    # An empty or unreadable file says nothing about which offers are gone
+    if deactivate_missing and any_seen:
+        result.deactivated = deactivate_missing_offers(seen_at, dry_run=dry_run)
+    return result
@@ -0,0 +1,115 @@
+"""
+Earnings-per-click ranking of ClickBank offers.
+
+ClickBank does not report sales back to us, so an offer's EPC (earnings per
+click) is its estimated commission times CLICKBANK_CONVERSION_RATE. Its
+velocity is its clicks per day with exponential time decay: each click counts
+0.5 ** (age in days / CLICKBANK_HALF_LIFE_DAYS), and the decayed sum is
+divided by the mean lifetime (half-life / ln 2), so a steady r clicks a day
+reads as r.
+An offer's score, EPC times velocity, estimates what it earns per day; offers
+without recent clicks get PRIOR_VELOCITY so new offers rank by commission
+below any offer with traffic.
+
+rank_offers() counts clicks per offer and day of age over the last
+CLICKBANK_RANKING_WINDOW_DAYS in one grouped query and streams the groups, so
+memory depends on the number of offers, never on the number of clicks. The best
+CLICKBANK_RANKING_SIZE offers overall and per category replace the
+ClickBankRanking table in one transaction; pages read their "top earning
+offers" from that table (top_offers()). Run it from cron with the
+rank_clickbank_offers command.
+"""
+
+import datetime
+import heapq
+import math
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .conditional import bump_catalog_version
+from .models import ClickBankClickTracking, ClickBankProduct, ClickBankRanking
+
+PRIOR_VELOCITY = 0.1
+BATCH_SIZE = 500
+
+
+def click_velocities(now):
+    """{offer id: (clicks in the window, decayed clicks per day)} in one grouped query"""
+    half_life = settings.CLICKBANK_HALF_LIFE_DAYS
+    days = settings.CLICKBANK_RANKING_WINDOW_DAYS
+    # One filtered count per day of age; plain comparisons, which every
+    # database evaluates natively, unlike date truncation on SQLite
+    starts = [now - datetime.timedelta(days=age) for age in range(1, days + 1)]
+    counts = {
+        f'age_{age}': Count('id', filter=Q(clicked_at__gte=start))
+        for age, start in enumerate(starts)
+    }
+    groups = (
+        ClickBankClickTracking.objects.filter(clicked_at__gte=starts[-1])
+        .values('clickbank_product_id')
+        .annotate(**counts)
+        .values_list('clickbank_product_id', *counts)
+        .order_by()
+    )
+    # A click in day `age` is on average age + 0.5 days old
+    weights = [0.5 ** ((age + 0.5) / half_life) for age in range(days)]
+    lifetime = half_life / math.log(2)
+    velocities = {}
+    for offer_id, *cumulative in groups.iterator(chunk_size=2000):
+        decayed = 0.0
+        previous = 0
+        for weight, total in zip(weights, cumulative):
+            decayed += weight * (total - previous)
+            previous = total
+        velocities[offer_id] = (previous, decayed / lifetime)
+    return velocities
+
+
+def rank_offers(now=None):
+    """Recompute the ClickBankRanking table; returns the number of rows written"""
+    now = now or timezone.now()
+    size = settings.CLICKBANK_RANKING_SIZE
+    conversion_rate = Decimal(str(settings.CLICKBANK_CONVERSION_RATE))
+    velocities = click_velocities(now)
+
+    # category id (None for overall) -> heap of the best (score, id, clicks, velocity, epc)
+    best = defaultdict(list)
+    offers = ClickBankProduct.objects.filter(is_active=True).values_list('pk', 'category_id', 'estimated_commission')
+    for pk, category_id, commission in offers.order_by().iterator(chunk_size=5000):
+        clicks, velocity = velocities.get(pk, (0, 0.0))
+        epc = (commission * conversion_rate).quantize(Decimal('0.0001'))
+        entry = (float(epc) * max(velocity, PRIOR_VELOCITY), -pk, clicks, velocity, epc)
+        for key in (None, category_id):
+            if len(best[key]) < size:
+                heapq.heappush(best[key], entry)
+            else:
+                heapq.heappushpop(best[key], entry)
+
+    rows = [
+        ClickBankRanking(category_id=category_id, position=position, clickbank_product_id=-negative_pk,
+                         clicks=clicks, velocity=velocity, epc=epc, score=score, computed_at=now)
+        for category_id, heap in best.items()
+        for position, (score, negative_pk, clicks, velocity, epc) in enumerate(sorted(heap, reverse=True), 1)
+    ]
+    with transaction.atomic():
+        ClickBankRanking.objects.all().delete()
+        ClickBankRanking.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        bump_catalog_version()
+    return len(rows)
+
+
+def top_offers(category=None, limit=8):
+    """The best ranked active offers overall or in `category`, with their ranking as `.ranking`"""
+    rankings = ClickBankRanking.objects.filter(
+        category=category, clickbank_product__is_active=True,
+    ).select_related('clickbank_product').order_by('position')[:limit]
+    offers = []
+    for ranking in rankings:
+        ranking.clickbank_product.ranking = ranking
+        offers.append(ranking.clickbank_product)
+    return offers
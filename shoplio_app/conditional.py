@@ -0,0 +1,98 @@
+"""
+Conditional GET for public catalog pages.
+
+Before rendering, a page builds its validators from values it can read
+cheaply: the updated_at of the objects it shows and the catalog version, a
+single-row counter bumped (on commit) whenever a product, offer, category,
+merchant or review changes. A browser or crawler that already has the page
+gets `304 Not Modified` without the page being rendered.
+
+Only anonymous requests with no pending messages are eligible; their
+responses are marked public so a front proxy may cache them too. Everything
+else is rendered as usual and marked private.
+"""
+
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import CatalogVersion
+
+
+def bump_catalog_version():
+    """Invalidate every catalog page's validators once the current transaction commits"""
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, changed_at=now):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1, 'changed_at': now})
+
+
+def catalog_version():
+    """(version, changed_at); one primary key lookup"""
+    row = CatalogVersion.objects.filter(pk=1).values_list('version', 'changed_at').first()
+    return row or (0, None)
+
+
+@functools.lru_cache(maxsize=None)
+def release():
+    """Deploy identifier; without RELEASE_VERSION, the newest template modification time"""
+    if settings.RELEASE_VERSION:
+        return settings.RELEASE_VERSION
+    newest = 0
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+    return str(int(newest))
+
+
+def is_public(request):
+    """Whether the page is the same for every visitor making this request"""
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    return not len(get_messages(request))
+
+
+def respond(request, render, *key, updated_at=()):
+    """
+    The page's response, or 304 if the client's copy is still current.
+
+    `key` identifies what the page shows (the view and its objects) and
+    `updated_at` lists their modification times; the full path, the catalog
+    version and the release are added. `render()` is only called when the
+    page has to be sent.
+    """
+    if not is_public(request):
+        response = render()
+        patch_cache_control(response, private=True)
+        return response
+
+    version, changed_at = catalog_version()
+    stamps = [stamp for stamp in (changed_at, *updated_at) if stamp is not None]
+    last_modified = int(max(stamps).timestamp()) if stamps else None
+    digest = hashlib.sha1(
+        repr((release(), version, request.get_full_path(), *key, *stamps)).encode()
+    ).hexdigest()[:24]
+    etag = quote_etag(digest)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE,
+                        s_maxage=settings.CATALOG_PROXY_MAX_AGE)
+    patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,409 @@
+"""
+Faceted filtering for the product list.
+
+FacetIndex keeps, for every facet value (category, brand, merchant, price
+bucket, rating, in stock), a bitmap of the approved active products that have
+it: a Python int with bit `pk` set. A request ORs the bitmaps of the values
+picked within a facet, ANDs the facets together and counts, for each value,
+how many products it would leave given the other facets' choices, all in
+memory and without touching the database.
+
+The index is per process. `get_index()` refreshes it when the catalog version
+(see conditional.py) moves: only products whose row, offers or merchant
+changed since the last refresh are re-read, and their bits are moved in one
+pass per bitmap. A refresh that finds deleted products, or an index older
+than FACET_INDEX_MAX_AGE, is a full rebuild.
+"""
+
+import bisect
+import datetime
+import threading
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .conditional import catalog_version
+from .models import Category, Merchant, Product, ProductMerchant
+
+FACETS = ['category', 'brand', 'merchant', 'price', 'rating', 'in_stock']
+FACET_TITLES = {
+    'category': 'Categories',
+    'brand': 'Brand',
+    'merchant': 'Store',
+    'price': 'Price',
+    'rating': 'Rating',
+    'in_stock': 'Availability',
+}
+
+# Price bucket lower bounds in PKR; the last bucket is open-ended
+PRICE_BUCKETS = [0, 1000, 5000, 20000, 50000, 100000]
+RATING_FLOORS = [4, 3, 2, 1]
+
+SORT_KEYS = {
+    'newest': lambda row: row[2],
+    'price_low': lambda row: row[0],
+    'price_high': lambda row: row[0],
+    'rating': lambda row: row[1],
+}
+DESCENDING = {'newest', 'price_high', 'rating'}
+
+# Re-read products changed this long before the last refresh too, for
+# transactions that committed after it started
+REFRESH_OVERLAP = datetime.timedelta(seconds=60)
+CHUNK_SIZE = 500
+
+
+def bitmap(pks):
+    """A bitmap with the bits of `pks` set"""
+    pks = list(pks)
+    if not pks:
+        return 0
+    data = bytearray(max(pks) // 8 + 1)
+    for pk in pks:
+        data[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(data, 'little')
+
+
+def members(bits):
+    """The set bits of a bitmap, in increasing order"""
+    return [position for position, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+
+def count(bits):
+    return bin(bits).count('1')
+
+
+def price_bucket(price):
+    """Key of the PRICE_BUCKETS range `price` falls in, e.g. '1000-5000' or '100000-'"""
+    key = None
+    for position, low in enumerate(PRICE_BUCKETS):
+        if price < low:
+            break
+        high = PRICE_BUCKETS[position + 1] if position + 1 < len(PRICE_BUCKETS) else ''
+        key = f'{low}-{high}'
+    return key
+
+
+def parse_price(raw):
+    """A min_price/max_price query value as a Decimal, or None if missing or invalid"""
+    try:
+        price = Decimal((raw or '').replace(',', '').strip())
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def price_label(key):
+    low, high = key.split('-')
+    if not high:
+        return f'PKR {int(low):,}+'
+    if low == '0':
+        return f'Under PKR {int(high):,}'
+    return f'PKR {int(low):,} - {int(high):,}'
+
+
+class FacetResult:
+    """Matching products (a bitmap) and every facet value's count"""
+
+    def __init__(self, index, selected, bits, counts):
+        self.index = index
+        self.selected = selected
+        self.bits = bits
+        self.counts = counts
+
+    def __len__(self):
+        return count(self.bits)
+
+    def ordered_ids(self, sort):
+        """Matching product ids in `sort` order"""
+        matching = set(members(self.bits))
+        return [pk for pk in self.index.order(sort) if pk in matching]
+
+    def groups(self, querydict):
+        """
+        [(facet, title, options)] for the filter sidebar, where each option is
+        a dict with the value's label, count, whether it is picked and the
+        query string that toggles it.
+        """
+        groups = []
+        for facet in FACETS:
+            chosen = self.selected.get(facet, ())
+            options = []
+            for value, total in self.counts[facet].items():
+                if not total and value not in chosen:
+                    continue
+                param = self.index.param(facet, value)
+                query = querydict.copy()
+                query.pop('page', None)
+                picked = [raw for raw in query.getlist(facet) if raw != param]
+                if value not in chosen:
+                    picked.append(param)
+                query.setlist(facet, picked)
+                options.append({
+                    'label': self.index.label(facet, value),
+                    'count': total,
+                    'selected': value in chosen,
+                    'query': query.urlencode(),
+                    'sort_key': (-total, self.index.label(facet, value).lower()),
+                })
+            if facet in ('category', 'brand', 'merchant'):
+                options.sort(key=lambda option: option['sort_key'])
+            if options:
+                groups.append((facet, FACET_TITLES[facet], options))
+        return groups
+
+
+class FacetIndex:
+    def __init__(self):
+        self.version = None
+        self.built_at = None
+        self.refreshed_at = None
+        self.all = 0
+        self.bitmaps = {facet: {} for facet in FACETS}
+        # pk -> ((facet, value), ...) the product's bits are set under
+        self.keys = {}
+        # pk -> (price, rating, created_at), for sorting
+        self.rows = {}
+        self.categories = {}
+        self.merchants = {}
+        self.category_slugs = {}
+        self.merchant_slugs = {}
+        self._orders = {}
+        self._prices = None
+
+    # ---- Building ------------------------------------------------------
+
+    @classmethod
+    def build(cls, version):
+        index = cls()
+        index.version = version
+        index.built_at = index.refreshed_at = timezone.now()
+        index._load_labels()
+        keys, rows = index._read(None)
+        values = defaultdict(list)
+        for pk, product_keys in keys.items():
+            for key in product_keys:
+                values[key].append(pk)
+        for (facet, value), pks in values.items():
+            index.bitmaps[facet][value] = bitmap(pks)
+        index.all = bitmap(keys)
+        index.keys = keys
+        index.rows = rows
+        return index
+
+    def refreshed(self, version):
+        """A copy of the index brought up to date, or a full rebuild"""
+        now = timezone.now()
+        if now - self.built_at > datetime.timedelta(seconds=settings.FACET_INDEX_MAX_AGE):
+            return FacetIndex.build(version)
+
+        since = self.refreshed_at - REFRESH_OVERLAP
+        changed = set(Product.objects.filter(updated_at__gte=since).values_list('pk', flat=True).order_by())
+        changed.update(
+            ProductMerchant.objects
+            .filter(Q(updated_at__gte=since) | Q(merchant__updated_at__gte=since))
+            .values_list('product_id', flat=True)
+            .order_by()
+        )
+
+        index = FacetIndex()
+        index.version = version
+        index.built_at = self.built_at
+        index.refreshed_at = now
+        index._load_labels()
+        index.bitmaps = {facet: dict(bitmaps) for facet, bitmaps in self.bitmaps.items()}
+        index.keys = dict(self.keys)
+        index.rows = dict(self.rows)
+
+        keys, rows = index._read(changed)
+        added = defaultdict(list)
+        removed = defaultdict(list)
+        for pk in changed:
+            old = set(index.keys.pop(pk, ()))
+            new = set(keys.get(pk, ()))
+            for key in old - new:
+                removed[key].append(pk)
+            for key in new - old:
+                added[key].append(pk)
+            index.rows.pop(pk, None)
+        index.keys.update(keys)
+        index.rows.update(rows)
+
+        for key in set(added) | set(removed):
+            facet, value = key
+            bits = index.bitmaps[facet].get(value, 0)
+            bits = (bits & ~bitmap(removed.get(key, ()))) | bitmap(added.get(key, ()))
+            if bits:
+                index.bitmaps[facet][value] = bits
+            else:
+                index.bitmaps[facet].pop(value, None)
+        index.all = (self.all & ~bitmap(changed)) | bitmap(keys)
+
+        # Deleted products leave nothing to find by timestamp
+        if len(index.keys) != Product.objects.filter(is_active=True, is_approved=True).count():
+            return FacetIndex.build(version)
+        return index
+
+    def _load_labels(self):
+        self.categories = {
+            pk: (slug, name) for pk, slug, name in Category.objects.values_list('pk', 'slug', 'name').order_by()
+        }
+        self.merchants = {
+            pk: (slug, name) for pk, slug, name in Merchant.objects.values_list('pk', 'slug', 'name').order_by()
+        }
+        self.category_slugs = {slug: pk for pk, (slug, _) in self.categories.items()}
+        self.merchant_slugs = {slug: pk for pk, (slug, _) in self.merchants.items()}
+
+    def _read(self, pks):
+        """({pk: keys}, {pk: sort row}) for the visible products among `pks` (all when None)"""
+        keys = {}
+        rows = {}
+        offers = defaultdict(list)
+        for batch in self._batches(pks):
+            products = Product.objects.filter(is_active=True, is_approved=True)
+            offer_rows = ProductMerchant.objects.filter(is_active=True, merchant__is_active=True)
+            if batch is not None:
+                products = products.filter(pk__in=batch)
+                offer_rows = offer_rows.filter(product_id__in=batch)
+            for product_id, merchant_id, in_stock in offer_rows.values_list(
+                    'product_id', 'merchant_id', 'in_stock').order_by().iterator(chunk_size=5000):
+                offers[product_id].append((merchant_id, in_stock))
+
+            for pk, category_id, brand, price, rating, created_at in products.values_list(
+                    'pk', 'category_id', 'brand', 'base_price', 'average_rating', 'created_at'
+            ).order_by().iterator(chunk_size=5000):
+                product_keys = [('category', category_id), ('price', price_bucket(price))]
+                brand = brand.strip()
+                if brand:
+                    product_keys.append(('brand', brand))
+                product_keys.extend(('rating', floor) for floor in RATING_FLOORS if rating >= floor)
+                for merchant_id, in_stock in offers.pop(pk, ()):
+                    product_keys.append(('merchant', merchant_id))
+                    if in_stock:
+                        product_keys.append(('in_stock', 'yes'))
+                keys[pk] = tuple(set(product_keys))
+                rows[pk] = (price, rating, created_at)
+            offers.clear()
+        return keys, rows
+
+    @staticmethod
+    def _batches(pks):
+        if pks is None:
+            yield None
+            return
+        pks = sorted(pks)
+        for start in range(0, len(pks), CHUNK_SIZE):
+            yield pks[start:start + CHUNK_SIZE]
+
+    # ---- Querying ------------------------------------------------------
+
+    def value(self, facet, raw):
+        """The bitmap key for a query string value, or None if it is unknown"""
+        if facet == 'category':
+            return self.category_slugs.get(raw)
+        if facet == 'merchant':
+            return self.merchant_slugs.get(raw)
+        if facet == 'rating':
+            return int(raw) if raw.isdigit() and int(raw) in RATING_FLOORS else None
+        return raw if raw in self.bitmaps[facet] else None
+
+    def param(self, facet, value):
+        """The query string value for a bitmap key"""
+        if facet == 'category':
+            return self.categories[value][0]
+        if facet == 'merchant':
+            return self.merchants[value][0]
+        return str(value)
+
+    def label(self, facet, value):
+        if facet == 'category':
+            return self.categories.get(value, ('', 'Unknown'))[1]
+        if facet == 'merchant':
+            return self.merchants.get(value, ('', 'Unknown'))[1]
+        if facet == 'price':
+            return price_label(value)
+        if facet == 'rating':
+            return f'{value}★ & up'
+        if facet == 'in_stock':
+            return 'In stock'
+        return value
+
+    def search(self, selected, within=None):
+        """
+        Products matching every facet in `selected` ({facet: [bitmap keys]}),
+        limited to the `within` bitmap if given, with each facet value's count.
+
+        A facet's counts ignore that facet's own choices, so picking one brand
+        still shows how many products the other brands have.
+        """
+        base = self.all if within is None else self.all & within
+        masks = {}
+        for facet, values in selected.items():
+            mask = 0
+            for value in values:
+                mask |= self.bitmaps[facet].get(value, 0)
+            masks[facet] = mask
+
+        counts = {}
+        for facet in FACETS:
+            others = base
+            for other, mask in masks.items():
+                if other != facet:
+                    others &= mask
+            counts[facet] = {value: count(bits & others) for value, bits in self.bitmaps[facet].items()}
+
+        result = base
+        for mask in masks.values():
+            result &= mask
+        return FacetResult(self, selected, result, counts)
+
+    def price_between(self, low=None, high=None):
+        """Bitmap of the products priced from `low` to `high` (either may be None)"""
+        ordered = self.order('price_low')
+        if self._prices is None:
+            self._prices = [self.rows[pk][0] for pk in ordered]
+        prices = self._prices
+        start = 0 if low is None else bisect.bisect_left(prices, low)
+        end = len(prices) if high is None else bisect.bisect_right(prices, high)
+        return bitmap(ordered[start:end])
+
+    def order(self, sort):
+        """Every indexed product id in `sort` order (newest when unknown)"""
+        if sort not in SORT_KEYS:
+            sort = 'newest'
+        if sort not in self._orders:
+            key = SORT_KEYS[sort]
+            self._orders[sort] = sorted(self.rows, key=lambda pk: key(self.rows[pk]), reverse=sort in DESCENDING)
+        return self._orders[sort]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process's index, refreshed if the catalog changed"""
+    global _index
+    version = catalog_version()[0]
+    if _index is not None and _index.version == version:
+        return _index
+    with _lock:
+        if _index is None:
+            _index = FacetIndex.build(version)
+        elif _index.version != version:
+            _index = _index.refreshed(version)
+        return _index
+
+
+def selection(index, querydict):
+    """{facet: [bitmap keys]} picked in a request's query string"""
+    selected = {}
+    for facet in FACETS:
+        values = [index.value(facet, raw) for raw in querydict.getlist(facet) if raw]
+        values = [value for value in values if value is not None]
+        if values:
+            selected[facet] = values
+    return selected
@@ -0,0 +1,131 @@
+"""
+Streaming readers for uploaded and on-disk data files.
+
+Readers yield `(line_number, record)` pairs one row at a time, so files of any
+size are processed in constant memory. A row that cannot be parsed is yielded
+as an `InvalidRow` instead of a dict, letting callers report it and carry on.
+
+XML files have no usable line numbers, so their records are numbered by
+position instead. A record is any element named in XML_RECORD_TAGS (for example
+`<product>` or an RSS `<item>`); its child elements become the fields.
+"""
+
+import csv
+import io
+import json
+import os
+from itertools import islice
+from xml.etree import ElementTree
+
+FORMATS = ['csv', 'jsonl', 'xml']
+
+XML_RECORD_TAGS = {'item', 'product', 'offer', 'entry', 'row', 'record'}
+
+
+class InvalidRow:
+    """Placeholder for a row the reader could not parse"""
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def detect_format(filename):
+    """Guess the file format from its extension"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    if extension in FORMATS:
+        return extension
+    return 'csv'
+
+
+def _text(fileobj):
+    """Wrap a binary file (or Django upload) as a UTF-8 text stream"""
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(getattr(fileobj, 'file', fileobj), encoding='utf-8-sig', newline='')
+
+
+def _normalize(record):
+    return {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+
+
+def iter_csv(fileobj):
+    reader = csv.DictReader(_text(fileobj))
+    for record in reader:
+        yield reader.line_num, _normalize(record)
+
+
+def iter_jsonl(fileobj):
+    for line_number, line in enumerate(_text(fileobj), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, InvalidRow(f'Invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield line_number, InvalidRow('Expected a JSON object')
+            continue
+        yield line_number, _normalize(record)
+
+
+def _local_name(tag):
+    """Tag without its namespace: '{http://base.google.com/ns/1.0}price' -> 'price'"""
+    return tag.rsplit('}', 1)[-1].lower()
+
+
+def iter_xml(fileobj):
+    stream = getattr(fileobj, 'file', fileobj)
+    # Open elements, so a finished record can be detached from its parent
+    # and the tree never grows beyond the record being read
+    path = []
+    position = 0
+    try:
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                path.append(element)
+                continue
+            path.pop()
+            if _local_name(element.tag) not in XML_RECORD_TAGS or not len(element):
+                continue
+            position += 1
+            record = {_local_name(key): value for key, value in element.attrib.items()}
+            for child in element:
+                record[_local_name(child.tag)] = (child.text or '').strip()
+            if path:
+                path[-1].remove(element)
+            yield position, record
+    except ElementTree.ParseError as e:
+        line, column = e.position
+        yield position + 1, InvalidRow(f'Invalid XML at line {line}, column {column}; rest of file skipped')
+
+
+READERS = {
+    'csv': iter_csv,
+    'jsonl': iter_jsonl,
+    'xml': iter_xml,
+}
+
+
+def iter_records(fileobj, fmt):
+    """Yield (line_number, record) pairs from `fileobj` in the given format"""
+    try:
+        reader = READERS[fmt]
+    except KeyError:
+        raise ValueError(f'Unsupported format: {fmt}')
+    return reader(fileobj)
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from `iterable`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
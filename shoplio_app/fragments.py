@@ -0,0 +1,97 @@
+"""
+Cached rendering of repeated page fragments such as product cards.
+
+A fragment is cached under a key made of a hash of its template source and
+the object's identity and modification stamp, so an edited product or
+template simply misses and nothing ever has to be invalidated. A whole
+listing is fetched with one `get_many` and its misses stored with one
+`set_many`.
+
+Each request collects `FragmentStats`; ServerTimingMiddleware reports them,
+with the render time the cache hits saved, in a Server-Timing header.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+
+# Template name -> (template, version); the template object changes when the
+# loader reloads an edited file
+_versions = {}
+
+# Template name -> moving average of seconds to render one fragment
+_render_costs = {}
+
+
+class FragmentStats:
+    """Fragment cache use during one request"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.render_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def server_timing(self):
+        return (
+            f'fragments;dur={self.render_seconds * 1000:.1f};desc="{self.hits} hits, {self.misses} misses", '
+            f'fragments-saved;dur={self.saved_seconds * 1000:.1f}'
+        )
+
+
+def stats_for(request):
+    """The request's FragmentStats, created on first use"""
+    stats = getattr(request, 'fragment_stats', None)
+    if stats is None:
+        stats = request.fragment_stats = FragmentStats()
+    return stats
+
+
+def template_version(template_name):
+    """(template, short hash of its name and source)"""
+    template = get_template(template_name)
+    cached = _versions.get(template_name)
+    if cached is None or cached[0] is not template:
+        source = f'{template_name}\n{template.template.source}'
+        cached = _versions[template_name] = (template, hashlib.sha1(source.encode()).hexdigest()[:12])
+    return cached
+
+
+def render_many(template_name, items, key_for, context_for, request=None):
+    """
+    Render `template_name` once per item, reusing cached fragments.
+
+    `key_for(item)` must change whenever the rendered output would; the
+    template is rendered without the request, so fragments cannot depend on
+    the visitor or on context processors.
+    """
+    template, version = template_version(template_name)
+    keys = [f'fragment:{version}:{key_for(item)}' for item in items]
+    cached = cache.get_many(keys) if keys else {}
+
+    parts = []
+    rendered = {}
+    started = time.perf_counter()
+    for key, item in zip(keys, items):
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = template.render(context_for(item))
+        parts.append(html)
+    render_seconds = time.perf_counter() - started
+    if rendered:
+        cache.set_many(rendered, settings.PRODUCT_CARD_CACHE_SECONDS)
+        cost = render_seconds / len(rendered)
+        previous = _render_costs.get(template_name)
+        _render_costs[template_name] = cost if previous is None else 0.9 * previous + 0.1 * cost
+
+    if request is not None:
+        stats = stats_for(request)
+        hits = len(keys) - len(rendered)
+        stats.hits += hits
+        stats.misses += len(rendered)
+        stats.render_seconds += render_seconds
+        stats.saved_seconds += hits * _render_costs.get(template_name, 0.0)
+    return ''.join(parts)
@@ -0,0 +1,70 @@
+"""
+Cached identity for logged-in requests.
+
+Sessions use the cached_db backend, so a session is read from the cache and
+only falls back to the database on a miss. CachedModelBackend then loads the
+session's user together with its seller and affiliate profiles in one query
+and keeps the result in the cache for IDENTITY_CACHE_SECONDS, so
+`request.user`, `request.user.seller_profile` and
+`request.user.affiliate_profile` cost no queries on a hit and one on a miss.
+A missing profile is cached too: accessing it raises DoesNotExist as usual.
+
+Saving or deleting a user, seller or affiliate drops the cached entry (see
+signals.py); code changing those rows with update() calls forget() itself.
+Those calls come from the web and worker processes alike, so settings.py only
+enables this backend and cached sessions when the cache is shared (Redis).
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+PROFILES = ('seller_profile', 'affiliate_profile')
+
+
+def _key(user_id):
+    return f'identity:user:{user_id}'
+
+
+def forget(user_id):
+    """Drop a user's cached identity, now and again once the current transaction commits"""
+    key = _key(user_id)
+    cache.delete(key)
+    # A request reading the old row before the commit may have cached it again
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def users():
+    """Users with their role profiles loaded by the same query"""
+    return get_user_model()._default_manager.select_related(*PROFILES)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose users come with their profiles and, per session, from the cache"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = users().get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Hash once anyway so unknown usernames take as long (as ModelBackend does)
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = users().filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(_key(user_id), user, settings.IDENTITY_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
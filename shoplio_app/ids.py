@@ -0,0 +1,173 @@
+"""
+Short, unique, time-ordered codes for orders and affiliates.
+
+A code is 14 Crockford base32 characters: 6 for the seconds since EPOCH and 8
+for a scrambled sequence number. Sequence numbers are handed out hi/lo style:
+a process reserves a block of BLOCK_SIZE numbers by inserting an IdBlock row
+(the database's primary key sequence makes the block number unique) and then
+issues numbers from it in memory. Uniqueness therefore never depends on
+checking the table first, and codes sort by creation time to the second.
+
+Before encoding, the sequence number goes through a keyed permutation (a small
+Feistel network keyed from SECRET_KEY). Being a permutation it keeps numbers
+unique, but neighbouring codes no longer reveal each other, so an order id
+cannot be guessed from another one.
+
+Codes avoid I, L, O and U; `find()` also accepts them typed in lower case or
+with those look-alike letters.
+"""
+
+import datetime
+import functools
+import hashlib
+import hmac
+import os
+import secrets
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+EPOCH = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+TIME_WIDTH = 6   # 32**6 seconds is about 34 years
+SEQUENCE_WIDTH = 8
+CODE_LENGTH = TIME_WIDTH + SEQUENCE_WIDTH
+
+# Changing this would make new blocks overlap old ones
+BLOCK_SIZE = 1024
+
+# The permutation works on SEQUENCE_WIDTH * 5 bits split into two halves
+_HALF_BITS = SEQUENCE_WIDTH * 5 // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+
+def encode(number, width):
+    """Fixed-width Crockford base32 for a non-negative integer"""
+    if number < 0 or number >= 32 ** width:
+        raise ValueError(f'{number} does not fit in {width} base32 characters')
+    chars = []
+    for _ in range(width):
+        number, remainder = divmod(number, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def normalize(code):
+    """Canonical form of a code as typed: upper case, no hyphens or spaces, I/L -> 1, O -> 0"""
+    code = code.strip().upper().replace('-', '').replace(' ', '')
+    return code.replace('I', '1').replace('L', '1').replace('O', '0')
+
+
+def find(queryset, field, code):
+    """
+    The object whose `field` matches a typed code, or None.
+
+    Codes issued before this scheme were random upper-case letters and digits
+    (including I, L and O), so the code as given and upper-cased are tried
+    before the normalized form, in one query.
+    """
+    forms = [code, code.upper(), normalize(code)]
+    matches = {getattr(obj, field): obj for obj in queryset.filter(**{f'{field}__in': forms})}
+    for form in forms:
+        if form in matches:
+            return matches[form]
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _key():
+    # A new SECRET_KEY gives a different permutation; codes stay unique
+    # because their time prefix differs from every code issued before
+    return hashlib.sha256(f'shoplio_app.ids:{settings.SECRET_KEY}'.encode()).digest()
+
+
+def _round_key(number):
+    return hmac.new(_key(), number.to_bytes(8, 'big'), hashlib.sha256).digest()
+
+
+def permute(number):
+    """Keyed bijection on [0, 32 ** SEQUENCE_WIDTH)"""
+    left, right = number >> _HALF_BITS, number & _HALF_MASK
+    for round_number in range(_ROUNDS):
+        digest = _round_key((round_number << _HALF_BITS) | right)
+        left, right = right, left ^ (int.from_bytes(digest[:4], 'big') & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+
+class IdAllocator:
+    """Issues sequence numbers from reserved IdBlocks; safe across threads and forks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._block = None
+        self._owner = ''
+        self._next = self._end = 0
+        self._confirmed = True
+
+    def _reserve_block(self):
+        from .models import IdBlock
+
+        # The nonce tells this reservation apart from any other row that later
+        # gets the same pk (see _usable)
+        owner = f'{socket.gethostname()[:60]}:{os.getpid()}:{secrets.token_hex(8)}'
+        block = IdBlock.objects.create(owner=owner)
+        self._block = block.pk
+        self._owner = owner
+        self._next = block.pk * BLOCK_SIZE
+        self._end = self._next + BLOCK_SIZE
+        # If the block was reserved inside a transaction that later rolls back,
+        # some databases (SQLite) can hand the same block number out again
+        self._confirmed = not connection.in_atomic_block
+        if not self._confirmed:
+            transaction.on_commit(lambda pk=block.pk: self._confirm(pk))
+
+    def _confirm(self, pk):
+        if self._block == pk:
+            self._confirmed = True
+
+    def _usable(self):
+        if self._block is None or self._next >= self._end:
+            return False
+        if self._confirmed:
+            return True
+        from .models import IdBlock
+
+        # The reserving transaction is still open, was rolled back, or was
+        # committed by a connection other than the one checking. The row only
+        # still carries our owner and nonce if it was not rolled back; after a
+        # rollback its pk may already belong to another process's block.
+        if not IdBlock.objects.filter(pk=self._block, owner=self._owner).exists():
+            return False
+        if not connection.in_atomic_block:
+            # Visible outside any transaction of ours, so it was committed
+            self._confirmed = True
+        return True
+
+    def next_sequence(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked child must not reuse its parent's block
+                self._reset()
+            if not self._usable():
+                self._reserve_block()
+            number = self._next
+            self._next += 1
+            return number
+
+
+_allocator = IdAllocator()
+
+
+def next_id():
+    """A new, globally unique code"""
+    seconds = max(int(time.time()) - EPOCH, 0)
+    return encode(seconds, TIME_WIDTH) + encode(permute(_allocator.next_sequence()), SEQUENCE_WIDTH)
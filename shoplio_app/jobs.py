@@ -0,0 +1,104 @@
+"""
+Task handlers for work deferred out of the request cycle.
+
+Handlers must be safe to run more than once for the same payload.
+"""
+
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from . import analytics, identity, product_matching, sales_cube
+from .conditional import bump_catalog_version
+from .models import Affiliate, Commission, Order, Product
+from .tasks import task
+
+
+@task('order_placed')
+def order_placed(order_id):
+    """Bookkeeping for a new order that checkout does not wait for"""
+    order = Order.objects.select_related('affiliate').get(pk=order_id)
+    analytics.record_order(order)
+    sales_cube.sync_order(order.pk)
+    if order.affiliate_id:
+        record_affiliate_sale(order)
+
+
+def record_affiliate_sale(order):
+    """Create the order's commission and count the sale for its affiliate"""
+    item = order.items.select_related('product').first()
+    if item is None:
+        return
+
+    with transaction.atomic():
+        commission, created = Commission.objects.get_or_create(
+            order=order,
+            defaults={
+                'affiliate': order.affiliate,
+                'product_name': item.product.name,
+                'product_price': order.total_amount,
+                'commission_rate': order.affiliate.commission_rate,
+                'status': 'pending',
+            },
+        )
+        if created:
+            Affiliate.objects.filter(pk=order.affiliate_id).update(
+                total_sales=F('total_sales') + 1,
+                updated_at=timezone.now(),
+            )
+            identity.forget(order.affiliate.user_id)
+
+
+@task('sync_sales_cube')
+def sync_sales_cube(order_id):
+    """Count an order in the sales cube under its current status, affiliate and city"""
+    sales_cube.sync_order(order_id)
+
+
+@task('optimize_product_image')
+def optimize_product_image(product_id):
+    """Downscale and recompress a seller-uploaded product image"""
+    product = Product.objects.get(pk=product_id)
+    if not product.image:
+        return
+
+    with product.image.open('rb') as fh:
+        image = Image.open(fh)
+        image.load()
+    image_format = image.format or 'JPEG'
+    max_size = settings.PRODUCT_IMAGE_MAX_SIZE
+    if max(image.size) <= max_size:
+        return
+
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    else:
+        image.save(buffer, image_format, optimize=True)
+
+    # Save under a new name and switch the product over before deleting the
+    # original, so a failure part way never leaves the product without an image
+    storage = product.image.storage
+    old_name = product.image.name
+    root, extension = os.path.splitext(old_name)
+    new_name = storage.save(f'{root}_{max_size}{extension}', ContentFile(buffer.getvalue()))
+    if Product.objects.filter(pk=product.pk, image=old_name).update(image=new_name, updated_at=timezone.now()):
+        bump_catalog_version()
+        storage.delete(old_name)
+    else:
+        # The seller replaced the image meanwhile; keep theirs
+        storage.delete(new_name)
+
+
+@task('match_products')
+def match_products(product_ids):
+    """Look for existing listings of the same item as new or edited products"""
+    for product_id in product_ids:
+        product_matching.match_product(product_id)
@@ -0,0 +1,40 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.retention import ARCHIVE_TABLES, archive_table, aggregate_archive
+
+
+class Command(BaseCommand):
+    help = 'Move old click rows into compressed daily archive files, or report on archived clicks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CLICK_RETENTION_DAYS,
+                            help='Archive rows older than this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.CLICK_ARCHIVE_BATCH_SIZE,
+                            help='Rows read and deleted per batch')
+        parser.add_argument('--table', action='append', choices=sorted(ARCHIVE_TABLES),
+                            help='Only archive this table (repeatable)')
+        parser.add_argument('--report', metavar='COLUMN', action='append',
+                            help="Instead of archiving, count archived rows grouped by COLUMN (e.g. day, product_id)")
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='Report start day (YYYY-MM-DD)')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Report end day (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        tables = options['table'] or sorted(ARCHIVE_TABLES)
+
+        if options['report']:
+            for table in tables:
+                counts = aggregate_archive(table, options['report'], start=options['start'], end=options['end'])
+                self.stdout.write(self.style.SUCCESS(f'{table}: {sum(counts.values())} archived rows'))
+                for key, count in sorted(counts.items(), key=lambda item: str(item[0])):
+                    self.stdout.write(f"  {', '.join(str(value) for value in key)}: {count}")
+            return
+
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        for table in tables:
+            archived = archive_table(table, older_than_days=options['days'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} rows from {table}'))
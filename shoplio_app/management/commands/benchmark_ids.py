@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from shoplio_app import ids
+
+
+class Command(BaseCommand):
+    help = 'Generate ids from several processes at once, check they are unique and report ids/second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Number of generating processes')
+        parser.add_argument('--count', type=int, default=250000, help='Ids generated per process')
+
+    def handle(self, *args, **options):
+        processes, count = options['processes'], options['count']
+        if processes < 1 or count < 1:
+            raise CommandError('--processes and --count must be at least 1')
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f'{n}.txt') for n in range(processes)]
+
+            # Children must open their own database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            children = [context.Process(target=generate, args=(path, count)) for path in paths]
+            started = time.monotonic()
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+            elapsed = time.monotonic() - started
+            if any(child.exitcode for child in children):
+                raise CommandError('A generating process failed')
+
+            seen = set()
+            total = 0
+            for path in paths:
+                with open(path) as fh:
+                    for line in fh:
+                        seen.add(line.rstrip('\n'))
+                        total += 1
+
+        duplicates = total - len(seen)
+        self.stdout.write(f'{total} ids from {processes} processes in {elapsed:.2f}s '
+                          f'({total / elapsed:,.0f} ids/second)')
+        self.stdout.write(f'{total // ids.BLOCK_SIZE + processes} blocks reserved at most')
+        if duplicates:
+            raise CommandError(f'{duplicates} duplicate ids')
+        self.stdout.write(self.style.SUCCESS('All ids unique'))
+
+
+def generate(path, count):
+    with open(path, 'w') as fh:
+        for _ in range(count):
+            fh.write(ids.next_id())
+            fh.write('\n')
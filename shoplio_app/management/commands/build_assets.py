@@ -0,0 +1,37 @@
+from pathlib import Path
+from urllib.error import URLError
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app import assets
+
+
+class Command(BaseCommand):
+    help = 'Generate the inlined critical CSS and, with --fonts, download the self-hosted fonts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fonts', action='store_true',
+                            help='Download Inter from Google Fonts into static/fonts (needs network access)')
+
+    def handle(self, *args, **options):
+        static_root = Path(settings.STATICFILES_DIRS[0])
+        fonts_file = static_root / assets.FONTS_PATH
+
+        if options['fonts']:
+            try:
+                faces = assets.fetch_fonts(static_root)
+            except (URLError, OSError) as e:
+                raise CommandError(f'Could not download fonts: {e}')
+            if not faces:
+                raise CommandError(f'No {", ".join(sorted(assets.FONT_SUBSETS))} fonts in {assets.GOOGLE_FONTS_CSS}')
+            fonts_file.write_text(assets.minify_css('\n'.join(faces)) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f'Downloaded {len(faces)} font files'))
+
+        source = (static_root / assets.CRITICAL_SOURCE).read_text(encoding='utf-8')
+        fonts = fonts_file.read_text(encoding='utf-8') if fonts_file.exists() else ''
+        critical = assets.minify_css(fonts + assets.critical_rules(source))
+        (static_root / assets.CRITICAL_PATH).write_text(critical + '\n', encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {assets.CRITICAL_PATH}: {len(critical)} bytes inlined of {len(source)} in {assets.CRITICAL_SOURCE}'
+        ))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from django.utils.text import capfirst
+
+from shoplio_app.models import UserAgent, Referrer, ClickTracking, ClickBankClickTracking, AffiliateClick
+
+CLICK_MODELS = [ClickTracking, ClickBankClickTracking, AffiliateClick]
+
+# Bytes per click row for one nullable bigint reference
+REFERENCE_BYTES = 8
+# Bytes per lookup row for its SHA-1 digest
+DIGEST_BYTES = 40
+
+
+class Command(BaseCommand):
+    help = 'Report storage saved by dictionary-encoding click user agents and referrers'
+
+    def handle(self, *args, **options):
+        total_raw = 0
+        total_encoded = 0
+
+        for field, lookup_model in [('user_agent', UserAgent), ('referrer', Referrer)]:
+            dictionary = lookup_model.objects.aggregate(rows=Count('id'), size=Sum(Length('value')))
+            dictionary_rows = dictionary['rows']
+            dictionary_bytes = (dictionary['size'] or 0) + dictionary_rows * DIGEST_BYTES
+
+            references = 0
+            raw_bytes = 0
+            for model in CLICK_MODELS:
+                usage = model.objects.filter(**{f'{field}__isnull': False}).aggregate(
+                    rows=Count('id'), size=Sum(Length(f'{field}__value'))
+                )
+                references += usage['rows']
+                raw_bytes += usage['size'] or 0
+
+            encoded_bytes = dictionary_bytes + references * REFERENCE_BYTES
+            total_raw += raw_bytes
+            total_encoded += encoded_bytes
+
+            self.stdout.write(self.style.SUCCESS(f'{capfirst(lookup_model._meta.verbose_name)}:'))
+            self.stdout.write(f'  distinct values: {dictionary_rows}')
+            self.stdout.write(f'  click references: {references}')
+            self.stdout.write(f'  raw text size: {_format_bytes(raw_bytes)}')
+            self.stdout.write(f'  encoded size: {_format_bytes(encoded_bytes)}')
+
+        saved = total_raw - total_encoded
+        ratio = (saved / total_raw * 100) if total_raw else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {_format_bytes(total_raw)} raw -> {_format_bytes(total_encoded)} encoded '
+            f'({_format_bytes(saved)} saved, {ratio:.1f}%)'
+        ))
+
+
+def _format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(size) < 1024 or unit == 'GB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
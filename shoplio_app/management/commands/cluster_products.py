@@ -0,0 +1,34 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shoplio_app import product_matching
+
+
+class Command(BaseCommand):
+    help = 'Recompute every product signature in a process pool and group likely duplicate listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes computing signatures (default: one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Products per unit of work')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        started = time.monotonic()
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            clusters = product_matching.cluster_catalog(executor, workers, options['chunk_size'], self.stdout)
+        elapsed = time.monotonic() - started
+
+        duplicates = sum(len(cluster) for cluster in clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(clusters)} clusters of likely duplicates covering {duplicates} products ({elapsed:.1f}s)'
+        ))
+        for cluster in sorted(clusters, key=len, reverse=True)[:10]:
+            self.stdout.write(f'  {len(cluster)} listings: ids {", ".join(map(str, cluster[:10]))}')
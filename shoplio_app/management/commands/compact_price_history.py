@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shoplio_app import price_history
+
+
+class Command(BaseCommand):
+    help = 'Merge old daily price buckets into weekly ones and prune old raw price changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='First recompute every series from the raw price changes still kept')
+        parser.add_argument('--keep-raw', action='store_true',
+                            help=f'Do not delete raw price changes older than {settings.PRICE_HISTORY_RAW_DAYS} days')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuilt = price_history.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} price series'))
+
+        compacted = price_history.compact_all()
+        self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} price series'))
+
+        if not options['keep_raw']:
+            pruned = price_history.prune()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {pruned} raw price changes'))
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.exports import EXPORTS, FORMATS, filtered, stream
+from shoplio_app.models import Affiliate
+
+
+class Command(BaseCommand):
+    help = 'Stream orders, commissions or clicks as CSV or NDJSON to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--affiliate', metavar='CODE', help='Only rows of the affiliate with this code')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, help='Rows read and written at a time')
+
+    def handle(self, *args, **options):
+        affiliate = None
+        if options['affiliate']:
+            affiliate = Affiliate.objects.filter(affiliate_code=options['affiliate']).values_list('pk', flat=True).first()
+            if affiliate is None:
+                raise CommandError(f"No affiliate with code {options['affiliate']}")
+        try:
+            queryset = filtered(options['export'], start=options['start'], end=options['end'], affiliate=affiliate)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        pieces = stream(options['export'], queryset, options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as fh:
+            for piece in pieces:
+                fh.write(piece)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['export']} to {options['output']}"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.clickbank_feed import CHUNK_SIZE, import_clickbank_feed
+from shoplio_app.feeds import FORMATS, detect_format
+
+
+class Command(BaseCommand):
+    help = 'Create and update ClickBank offers from a marketplace export (CSV, JSON lines or XML)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Export file')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows compared and written per batch')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='Leave offers the file does not list active (for partial exports)')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_clickbank_feed(fileobj, fmt, chunk_size=options['chunk_size'],
+                                               deactivate_missing=not options['keep_missing'],
+                                               dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line_number, message in result.errors:
+            self.stderr.write(f'line {line_number}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... {result.error_count - len(result.errors)} more errors')
+        rate = result.rows / elapsed if elapsed else 0
+        verb = 'would create' if options['dry_run'] else 'created'
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/second): '
+            f'{verb} {result.created}, updated {result.updated}, {result.unchanged} unchanged, '
+            f'{result.error_count} skipped; deactivated {result.deactivated} missing offers'
+        ))
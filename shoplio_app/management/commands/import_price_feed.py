@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.feeds import FORMATS, detect_format
+from shoplio_app.models import Merchant
+from shoplio_app.price_feeds import CHUNK_SIZE, apply_price_feed
+
+
+class Command(BaseCommand):
+    help = "Update a merchant's offer prices and stock from a CSV, JSON-lines or XML feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file')
+        parser.add_argument('--merchant', required=True, help='Slug of the merchant the feed belongs to')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows compared and written per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without saving them')
+
+    def handle(self, *args, **options):
+        try:
+            merchant = Merchant.objects.get(slug=options['merchant'])
+        except Merchant.DoesNotExist:
+            raise CommandError(f"No merchant with slug {options['merchant']}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = apply_price_feed(fileobj, merchant, fmt, chunk_size=options['chunk_size'],
+                                          dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line_number, message in result.errors:
+            self.stderr.write(f'line {line_number}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... {result.error_count - len(result.errors)} more errors')
+        rate = result.rows / elapsed if elapsed else 0
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/second): '
+            f'{result.matched} matched, {result.unmatched} unmatched, {result.error_count} skipped; '
+            f'{verb} {result.price_changes} prices and {result.stock_changes} stock states'
+        ))
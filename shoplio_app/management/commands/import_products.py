@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.feeds import FORMATS, detect_format
+from shoplio_app.models import Seller
+from shoplio_app.product_import import CHUNK_SIZE, import_products
+
+
+class Command(BaseCommand):
+    help = 'Bulk import products for a seller from a CSV, JSON-lines or XML file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--seller', required=True, help='Username of the seller who owns the products')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows validated and inserted per batch')
+
+    def handle(self, *args, **options):
+        try:
+            seller = Seller.objects.get(user__username=options['seller'])
+        except Seller.DoesNotExist:
+            raise CommandError(f"No seller with username {options['seller']}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_products(fileobj, seller, fmt, chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        for line_number, message in result.errors:
+            self.stderr.write(f'line {line_number}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... {result.error_count - len(result.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.rows} rows in {elapsed:.1f}s: '
+            f'{result.created} products created, {result.error_count} skipped'
+        ))
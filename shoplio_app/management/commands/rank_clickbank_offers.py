@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shoplio_app.clickbank_ranking import rank_offers
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top earning ClickBank offers overall and per category from recent clicks'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rank_offers()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} ranking rows in {time.monotonic() - started:.1f}s'
+        ))
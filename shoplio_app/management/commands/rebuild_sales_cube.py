@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shoplio_app.sales_cube import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the sales reporting cube from all orders (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Orders read and counted per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        counted = rebuild(chunk_size=options['chunk_size'], stdout=self.stdout if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(f'Counted {counted} orders in the sales cube'))
@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shoplio_app import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no task is due')
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            processed = work(options['once'], options['sleep'])
+            self.stdout.write(self.style.SUCCESS(f'Worker stopped after {processed} tasks'))
+            return
+
+        # Children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=work, args=(options['once'], options['sleep']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+
+        def stop(signum, frame):
+            # Workers finish their current task and exit; we wait for them below
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        self.stdout.write(f'Started {len(children)} worker processes')
+        try:
+            for child in children:
+                child.join()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
+
+
+def work(once, sleep):
+    """Worker loop: run due tasks until stopped (or until idle with `once`)"""
+    stopping = []
+    previous = signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    worker = tasks.worker_id()
+    processed = 0
+    try:
+        while not stopping:
+            if tasks.run_next(worker):
+                processed += 1
+                continue
+            tasks.fail_expired()
+            if once:
+                break
+            time.sleep(sleep)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return processed
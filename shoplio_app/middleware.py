@@ -0,0 +1,15 @@
+class ServerTimingMiddleware:
+    """Report fragment cache use (see fragments.py) in a Server-Timing header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        stats = getattr(request, 'fragment_stats', None)
+        if stats is not None:
+            timing = stats.server_timing()
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+        return response
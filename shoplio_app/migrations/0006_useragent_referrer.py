@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0005_affiliate_clickbankproduct_order_affiliate_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField()),
+                ('digest', models.CharField(help_text='SHA-1 of value', max_length=40, unique=True)),
+            ],
+            options={
+                'verbose_name': 'User Agent',
+            },
+        ),
+        migrations.CreateModel(
+            name='Referrer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField()),
+                ('digest', models.CharField(help_text='SHA-1 of value', max_length=40, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='clicktracking',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.useragent'),
+        ),
+        migrations.AddField(
+            model_name='clicktracking',
+            name='referrer_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.referrer'),
+        ),
+        migrations.AddField(
+            model_name='clickbankclicktracking',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.useragent'),
+        ),
+        migrations.AddField(
+            model_name='clickbankclicktracking',
+            name='referrer_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.referrer'),
+        ),
+        migrations.AddField(
+            model_name='affiliateclick',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.useragent'),
+        ),
+        migrations.AddField(
+            model_name='affiliateclick',
+            name='referrer_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shoplio_app.referrer'),
+        ),
+    ]
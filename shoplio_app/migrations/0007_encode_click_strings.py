@@ -0,0 +1,78 @@
+"""
+Re-encode the user_agent and referrer text of existing click rows into the
+UserAgent / Referrer lookup tables, a batch of rows at a time.
+
+The migration is not atomic: each batch commits on its own, so locks and the
+journal stay bounded by the batch size. Re-running it after an interruption
+simply re-encodes the rows from the start.
+"""
+
+import hashlib
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+CACHE_LIMIT = 50000
+CLICK_MODELS = ['ClickTracking', 'ClickBankClickTracking', 'AffiliateClick']
+
+
+def _intern(model, cache, value):
+    if not value:
+        return None
+    if value not in cache:
+        if len(cache) >= CACHE_LIMIT:
+            cache.clear()
+        digest = hashlib.sha1(value.encode('utf-8')).hexdigest()
+        cache[value] = model.objects.get_or_create(digest=digest, defaults={'value': value})[0].pk
+    return cache[value]
+
+
+def encode_strings(apps, schema_editor):
+    UserAgent = apps.get_model('shoplio_app', 'UserAgent')
+    Referrer = apps.get_model('shoplio_app', 'Referrer')
+    agents, referrers = {}, {}
+
+    for model_name in CLICK_MODELS:
+        model = apps.get_model('shoplio_app', model_name)
+        last_pk = 0
+        while True:
+            batch = list(model.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .only('pk', 'user_agent', 'referrer')[:BATCH_SIZE])
+            if not batch:
+                break
+            with transaction.atomic():
+                for click in batch:
+                    click.user_agent_ref_id = _intern(UserAgent, agents, click.user_agent)
+                    click.referrer_ref_id = _intern(Referrer, referrers, click.referrer)
+                model.objects.bulk_update(batch, ['user_agent_ref', 'referrer_ref'])
+            last_pk = batch[-1].pk
+
+
+def decode_strings(apps, schema_editor):
+    for model_name in CLICK_MODELS:
+        model = apps.get_model('shoplio_app', model_name)
+        last_pk = 0
+        while True:
+            batch = list(model.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .select_related('user_agent_ref', 'referrer_ref')[:BATCH_SIZE])
+            if not batch:
+                break
+            for click in batch:
+                click.user_agent = click.user_agent_ref.value if click.user_agent_ref_id else ''
+                click.referrer = click.referrer_ref.value if click.referrer_ref_id else ''
+            with transaction.atomic():
+                model.objects.bulk_update(batch, ['user_agent', 'referrer'])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('shoplio_app', '0006_useragent_referrer'),
+    ]
+
+    operations = [
+        migrations.RunPython(encode_strings, decode_strings),
+    ]
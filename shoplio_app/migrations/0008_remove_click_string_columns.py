@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0007_encode_click_strings'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='clicktracking',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='clicktracking',
+            name='referrer',
+        ),
+        migrations.RemoveField(
+            model_name='clickbankclicktracking',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='clickbankclicktracking',
+            name='referrer',
+        ),
+        migrations.RemoveField(
+            model_name='affiliateclick',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='affiliateclick',
+            name='referrer',
+        ),
+        migrations.RenameField(
+            model_name='clicktracking',
+            old_name='user_agent_ref',
+            new_name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='clicktracking',
+            old_name='referrer_ref',
+            new_name='referrer',
+        ),
+        migrations.RenameField(
+            model_name='clickbankclicktracking',
+            old_name='user_agent_ref',
+            new_name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='clickbankclicktracking',
+            old_name='referrer_ref',
+            new_name='referrer',
+        ),
+        migrations.RenameField(
+            model_name='affiliateclick',
+            old_name='user_agent_ref',
+            new_name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='affiliateclick',
+            old_name='referrer_ref',
+            new_name='referrer',
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-19 00:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0009_task'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='shoplio_app_status_4a5ded_idx',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Enqueueing the same key again returns the existing task', max_length=200, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, help_text='Lease expiry; a running task past this is claimed again', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='max_attempts',
+            field=models.PositiveIntegerField(default=5),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Not claimed before this time (retry backoff)'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_after'], name='shoplio_app_status_0237f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'locked_until'], name='shoplio_app_status_e09838_idx'),
+        ),
+    ]
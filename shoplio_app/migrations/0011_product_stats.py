@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Seed counters from existing orders and merchant link click counts"""
+    Product = apps.get_model('shoplio_app', 'Product')
+    ProductStats = apps.get_model('shoplio_app', 'ProductStats')
+    ProductMerchant = apps.get_model('shoplio_app', 'ProductMerchant')
+    OrderItem = apps.get_model('shoplio_app', 'OrderItem')
+    Order = apps.get_model('shoplio_app', 'Order')
+
+    stats = {pk: ProductStats(product_id=pk) for pk in Product.objects.values_list('pk', flat=True)}
+    line_total = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    for row in OrderItem.objects.values('product_id').annotate(
+        orders=Count('order', distinct=True), units=Sum('quantity'), revenue=Sum(line_total),
+    ):
+        entry = stats[row['product_id']]
+        entry.orders, entry.units_sold, entry.revenue = row['orders'], row['units'], row['revenue']
+    for row in ProductMerchant.objects.values('product_id').annotate(clicks=Sum('click_count')):
+        stats[row['product_id']].merchant_clicks = row['clicks'] or 0
+
+    ProductStats.objects.bulk_create(stats.values(), batch_size=1000)
+    Order.objects.update(stats_recorded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0010_task_retries_and_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='shoplio_app.product')),
+                ('detail_views', models.PositiveIntegerField(default=0)),
+                ('merchant_clicks', models.PositiveIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units_sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product Stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='stats_recorded',
+            field=models.BooleanField(default=False, editable=False, help_text='Counted in product analytics'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 00:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0012_idblock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productmerchant',
+            name='last_price_update',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the price last changed'),
+        ),
+    ]
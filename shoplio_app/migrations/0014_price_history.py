@@ -0,0 +1,68 @@
+# Generated by Django 5.2 on 2026-10-19 00:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_history(apps, schema_editor):
+    """Start each offer's history, and its product's series, at its current price"""
+    ProductMerchant = apps.get_model('shoplio_app', 'ProductMerchant')
+    PriceChange = apps.get_model('shoplio_app', 'PriceChange')
+    PriceSeries = apps.get_model('shoplio_app', 'PriceSeries')
+
+    changes = []
+    buckets = {}
+    offers = ProductMerchant.objects.order_by().values_list('pk', 'product_id', 'price', 'last_price_update')
+    for pk, product_id, price, changed_at in offers.iterator(chunk_size=2000):
+        changes.append(PriceChange(offer_id=pk, price=price, changed_at=changed_at))
+        key = (product_id, timezone.localdate(changed_at).isoformat())
+        low, high = buckets.get(key, (price, price))
+        buckets[key] = (min(low, price), max(high, price))
+        if len(changes) >= 2000:
+            PriceChange.objects.bulk_create(changes)
+            changes = []
+    PriceChange.objects.bulk_create(changes)
+
+    points = {}
+    for (product_id, day), (low, high) in sorted(buckets.items()):
+        points.setdefault(product_id, []).append([day, str(low), str(high)])
+    PriceSeries.objects.bulk_create(
+        [PriceSeries(product_id=product_id, points=series) for product_id, series in points.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0013_productmerchant_last_price_update'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSeries',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='price_series', serialize=False, to='shoplio_app.product')),
+                ('points', models.JSONField(default=list, help_text='[day, low, high] buckets, oldest first; daily, then weekly')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Price series',
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_changes', to='shoplio_app.productmerchant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['offer', 'changed_at'], name='shoplio_app_offer_i_07b824_idx'), models.Index(fields=['changed_at'], name='shoplio_app_changed_658e5c_idx')],
+            },
+        ),
+        migrations.RunPython(seed_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 01:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0015_catalog_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productmerchant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='shoplio_app_updated_b56356_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productmerchant',
+            index=models.Index(fields=['updated_at'], name='shoplio_app_updated_67cddb_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-19 01:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0016_offer_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSignature',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='shoplio_app.product')),
+                ('minhash', models.BinaryField(help_text='Packed unsigned 32-bit minimum hashes')),
+                ('source_hash', models.CharField(help_text='SHA-1 of the text the signature was computed from', max_length=40)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='shoplio_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='shoplio_app_band_cb0d34_idx')],
+                'unique_together': {('product', 'band')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField(help_text='Estimated Jaccard similarity of the two listings')),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shoplio_app.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='shoplio_app.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product matches',
+                'ordering': ['-similarity'],
+                'unique_together': {('product', 'match')},
+            },
+        ),
+    ]
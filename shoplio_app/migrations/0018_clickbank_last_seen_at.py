@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0017_product_matching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clickbankproduct',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
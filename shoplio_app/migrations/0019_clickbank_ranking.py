@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 01:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0018_clickbank_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickBankRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('clicks', models.PositiveIntegerField(help_text='Clicks inside the ranking window')),
+                ('velocity', models.FloatField(help_text='Time-decayed clicks per day')),
+                ('epc', models.DecimalField(decimal_places=4, help_text='Estimated earnings per click', max_digits=10)),
+                ('score', models.FloatField(help_text='Estimated earnings per day')),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shoplio_app.category')),
+                ('clickbank_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='shoplio_app.clickbankproduct')),
+            ],
+            options={
+                'verbose_name': 'ClickBank Ranking',
+                'ordering': ['category', 'position'],
+                'indexes': [models.Index(fields=['category', 'position'], name='shoplio_app_categor_a02421_idx')],
+            },
+        ),
+    ]
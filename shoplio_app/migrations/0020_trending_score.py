@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 01:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0019_clickbank_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='shoplio_app.product')),
+                ('era', models.PositiveIntegerField()),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shoplio_app.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['era', '-score'], name='shoplio_app_era_71c2eb_idx'), models.Index(fields=['category', 'era', '-score'], name='shoplio_app_categor_0b2b19_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-19 01:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoplio_app', '0021_order_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reported_as',
+            field=models.CharField(blank=True, editable=False, help_text='Status, affiliate and city this order is counted under in the sales cube', max_length=150),
+        ),
+        migrations.CreateModel(
+            name='SalesCell',
+            fields=[
+                ('key', models.CharField(editable=False, max_length=200, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('orders', models.IntegerField(default=0, help_text='Orders containing the product')),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('affiliate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shoplio_app.affiliate')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shoplio_app.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shoplio_app.product')),
+            ],
+            options={
+                'verbose_name': 'Sales Report',
+                'verbose_name_plural': 'Sales Report',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='shoplio_app_day_7003c7_idx'), models.Index(fields=['product', 'day'], name='shoplio_app_product_7bc6fd_idx'), models.Index(fields=['category', 'day'], name='shoplio_app_categor_d82141_idx'), models.Index(fields=['city', 'day'], name='shoplio_app_city_f0098a_idx'), models.Index(fields=['affiliate', 'day'], name='shoplio_app_affilia_1ba721_idx')],
+            },
+        ),
+    ]
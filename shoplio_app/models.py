@@ -1,8 +1,9 @@
+from decimal import Decimal
+
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
-import uuid
 
 class Banner(models.Model):
     image = models.ImageField(upload_to='banners/')
@@ -116,6 +117,9 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return self.name
@@ -139,33 +143,59 @@ class ProductMerchant(models.Model):
     click_count = models.IntegerField(default=0, help_text="Number of clicks on affiliate link")
     
     is_active = models.BooleanField(default=True)
-    last_price_update = models.DateTimeField(auto_now=True)
+    last_price_update = models.DateTimeField(default=timezone.now, help_text="When the price last changed")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['product', 'merchant']
         ordering = ['price']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.merchant.name}"
 
     def record_click(self):
         """Record a click on this affiliate link"""
-        self.click_count += 1
-        self.save()
+        ProductMerchant.objects.filter(pk=self.pk).update(click_count=models.F('click_count') + 1)
         ClickTracking.objects.create(
             product_merchant=self,
             clicked_at=timezone.now()
         )
 
 
+class InternedString(models.Model):
+    """A distinct string stored once and referenced by id from click rows"""
+    value = models.TextField()
+    digest = models.CharField(max_length=40, unique=True, help_text="SHA-1 of value")
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return self.value
+
+
+class UserAgent(InternedString):
+    """Distinct User-Agent header seen on tracked clicks"""
+
+    class Meta:
+        verbose_name = "User Agent"
+
+
+class Referrer(InternedString):
+    """Distinct referrer URL seen on tracked clicks"""
+
+
 class ClickTracking(models.Model):
     """Track clicks on affiliate links"""
     product_merchant = models.ForeignKey(ProductMerchant, on_delete=models.CASCADE, related_name='clicks')
     clicked_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
-    referrer = models.URLField(blank=True)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    referrer = models.ForeignKey(Referrer, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
     class Meta:
         ordering = ['-clicked_at']
@@ -223,10 +253,36 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    stats_recorded = models.BooleanField(default=False, editable=False,
+                                         help_text="Counted in product analytics")
+    reported_as = models.CharField(max_length=150, blank=True, editable=False,
+                                   help_text="Status, affiliate and city this order is counted under in the sales cube")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at']),
+        ]
     
+    # Written only with update(), by analytics.record_order() and sales_cube
+    BOOKKEEPING_FIELDS = ('stats_recorded', 'reported_as')
+
     def save(self, *args, **kwargs):
+        """
+        A full save of an existing order writes every column except
+        BOOKKEEPING_FIELDS, which an instance read before a job set them would
+        otherwise reset. As with any save() given update_fields, saving an order
+        whose row has since been deleted raises DatabaseError rather than
+        inserting it again.
+        """
         if not self.order_id:
-            self.order_id = str(uuid.uuid4()).split('-')[0].upper()
+            from .ids import next_id
+            self.order_id = next_id()
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.BOOKKEEPING_FIELDS and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -243,6 +299,23 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
 
+class ProductStats(models.Model):
+    """Running per-product counters for seller analytics, updated with F() increments"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    detail_views = models.PositiveIntegerField(default=0)
+    merchant_clicks = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Product Stats"
+
+    def __str__(self):
+        return f"Stats for {self.product_id}"
+
+
 class ClickBankProduct(models.Model):
     """ClickBank affiliate products"""
     name = models.CharField(max_length=300)
@@ -274,6 +347,8 @@ class ClickBankProduct(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Start of the last feed import that listed this offer (see clickbank_feed.py)
+    last_seen_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -288,8 +363,9 @@ class ClickBankProduct(models.Model):
     
     def record_click(self):
         """Record a click on this ClickBank affiliate link"""
+        # update() rather than save(): a click does not change the listing
+        ClickBankProduct.objects.filter(pk=self.pk).update(click_count=models.F('click_count') + 1)
         self.click_count += 1
-        self.save()
         ClickBankClickTracking.objects.create(
             clickbank_product=self,
             clicked_at=timezone.now()
@@ -301,8 +377,8 @@ class ClickBankClickTracking(models.Model):
     clickbank_product = models.ForeignKey(ClickBankProduct, on_delete=models.CASCADE, related_name='clicks')
     clicked_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
-    referrer = models.URLField(blank=True)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    referrer = models.ForeignKey(Referrer, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
     class Meta:
         ordering = ['-clicked_at']
@@ -380,13 +456,8 @@ class Affiliate(models.Model):
     def save(self, *args, **kwargs):
         # Generate unique affiliate code if not set
         if not self.affiliate_code:
-            import random
-            import string
-            while True:
-                code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-                if not Affiliate.objects.filter(affiliate_code=code).exists():
-                    self.affiliate_code = code
-                    break
+            from .ids import next_id
+            self.affiliate_code = next_id()
         super().save(*args, **kwargs)
 
 
@@ -398,8 +469,8 @@ class AffiliateClick(models.Model):
     
     # Tracking information
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
-    referrer = models.URLField(blank=True, max_length=500)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    referrer = models.ForeignKey(Referrer, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
     
     # Conversion tracking
     converted = models.BooleanField(default=False, help_text="Did this click result in a sale?")
@@ -491,29 +562,271 @@ class Commission(models.Model):
     
     def update_affiliate_earnings(self):
         """Update affiliate's earnings based on commission status"""
-        affiliate = self.affiliate
-        
-        # Recalculate pending earnings
-        pending = Commission.objects.filter(
-            affiliate=affiliate, 
-            status='pending'
-        ).aggregate(total=models.Sum('commission_amount'))['total'] or 0
-        
-        # Recalculate approved but unpaid earnings
-        approved = Commission.objects.filter(
-            affiliate=affiliate, 
-            status='approved'
-        ).aggregate(total=models.Sum('commission_amount'))['total'] or 0
-        
-        # Recalculate paid earnings
-        paid = Commission.objects.filter(
-            affiliate=affiliate, 
-            status='paid'
-        ).aggregate(total=models.Sum('commission_amount'))['total'] or 0
+        # Recalculate pending, approved but unpaid, and paid earnings in one query
+        totals = Commission.objects.filter(affiliate_id=self.affiliate_id).aggregate(
+            pending=models.Sum('commission_amount', filter=models.Q(status='pending')),
+            approved=models.Sum('commission_amount', filter=models.Q(status='approved')),
+            paid=models.Sum('commission_amount', filter=models.Q(status='paid')),
+        )
+        pending = totals['pending'] or 0
+        approved = totals['approved'] or 0
+        paid = totals['paid'] or 0
         
         # Update affiliate
-        affiliate.pending_earnings = pending + approved
-        affiliate.paid_earnings = paid
-        affiliate.total_earnings = pending + approved + paid
-        affiliate.save()
+        Affiliate.objects.filter(pk=self.affiliate_id).update(
+            pending_earnings=pending + approved,
+            paid_earnings=paid,
+            total_earnings=pending + approved + paid,
+            updated_at=timezone.now(),
+        )
+        from .identity import forget
+        forget(self.affiliate.user_id)
+
+
+# ============================================
+# BACKGROUND TASKS
+# ============================================
+
+class Task(models.Model):
+    """Deferred job stored in the database and run by the run_worker command"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, help_text="Registered task handler name")
+    payload = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True,
+                                       help_text="Enqueueing the same key again returns the existing task")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    # Retry and lease bookkeeping
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time (retry backoff)")
+    locked_until = models.DateTimeField(null=True, blank=True,
+                                        help_text="Lease expiry; a running task past this is claimed again")
+    claimed_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
 
+# ============================================
+# ID ALLOCATION
+# ============================================
+
+class IdBlock(models.Model):
+    """A range of ids reserved by one process (see shoplio_app/ids.py); the pk is the block number"""
+    owner = models.CharField(max_length=100, blank=True, help_text="Process that reserved the block")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Id block {self.pk}"
+
+
+# ============================================
+# HTTP CACHING
+# ============================================
+
+class CatalogVersion(models.Model):
+    """Single row counting catalog changes; public catalog pages use it in their ETags"""
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+# ============================================
+# PRICE HISTORY
+# ============================================
+
+class PriceChange(models.Model):
+    """An offer's price from changed_at on; rows are only ever appended (see shoplio_app/price_history.py)"""
+    offer = models.ForeignKey(ProductMerchant, on_delete=models.CASCADE, related_name='price_changes')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['offer', 'changed_at']),
+            models.Index(fields=['changed_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.offer_id}: {self.price} at {self.changed_at}"
+
+
+class PriceSeries(models.Model):
+    """Offer prices for one product, downsampled into [day, low, high] buckets for charts"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='price_series')
+    points = models.JSONField(default=list, help_text="[day, low, high] buckets, oldest first; daily, then weekly")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Price series"
+
+    def __str__(self):
+        return f"Price series for {self.product_id}"
+
+    def range_since(self, day):
+        """(lowest, highest) price in buckets starting on or after `day`, or None"""
+        start = day.isoformat()
+        buckets = [(Decimal(low), Decimal(high)) for bucket_day, low, high in self.points if bucket_day >= start]
+        if not buckets:
+            return None
+        return min(low for low, _ in buckets), max(high for _, high in buckets)
+
+
+# ============================================
+# PRODUCT MATCHING
+# ============================================
+
+class ProductSignature(models.Model):
+    """A product's MinHash signature and LSH band buckets (see shoplio_app/product_matching.py)"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.BinaryField(help_text="Packed unsigned 32-bit minimum hashes")
+    source_hash = models.CharField(max_length=40, help_text="SHA-1 of the text the signature was computed from")
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Signature for {self.product_id}"
+
+
+class ProductBand(models.Model):
+    """One LSH band of a product's signature; products sharing a (band, bucket) are match candidates"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bands')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ['product', 'band']
+        indexes = [
+            models.Index(fields=['band', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} band {self.band}"
+
+
+class ProductMatch(models.Model):
+    """`product` looks like a duplicate of `match`; stored in both directions"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='matches')
+    match = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField(help_text="Estimated Jaccard similarity of the two listings")
+    detected_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['product', 'match']
+        ordering = ['-similarity']
+        verbose_name_plural = "Product matches"
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.match_id} ({self.similarity:.0%})"
+
+
+# ============================================
+# CLICKBANK RANKING
+# ============================================
+
+class ClickBankRanking(models.Model):
+    """
+    Precomputed top earning ClickBank offers, overall (no category) and per
+    category; replaced as a whole by clickbank_ranking.rank_offers()
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    position = models.PositiveSmallIntegerField()
+    clickbank_product = models.ForeignKey(ClickBankProduct, on_delete=models.CASCADE, related_name='rankings')
+    clicks = models.PositiveIntegerField(help_text="Clicks inside the ranking window")
+    velocity = models.FloatField(help_text="Time-decayed clicks per day")
+    epc = models.DecimalField(max_digits=10, decimal_places=4, help_text="Estimated earnings per click")
+    score = models.FloatField(help_text="Estimated earnings per day")
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['category', 'position']
+        verbose_name = "ClickBank Ranking"
+        indexes = [
+            models.Index(fields=['category', 'position']),
+        ]
+
+    def __str__(self):
+        return f"#{self.position} {self.clickbank_product_id} in {self.category_id or 'all'}"
+
+
+# ============================================
+# TRENDING
+# ============================================
+
+class TrendingScore(models.Model):
+    """
+    A product's recent clicks with exponential time decay (see trending.py).
+    `score` is relative to the start of `era`, so rows of the same era keep
+    their order as time passes and need no rewriting.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    era = models.PositiveIntegerField()
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['era', '-score']),
+            models.Index(fields=['category', 'era', '-score']),
+        ]
+
+    def __str__(self):
+        return f"Trending {self.product_id}: {self.score:.3g} in era {self.era}"
+
+
+# ============================================
+# SALES REPORTING
+# ============================================
+
+class SalesCell(models.Model):
+    """
+    Order totals for one day, product, city, affiliate and status (see
+    sales_cube.py). `key` names those dimensions; `category` is the product's
+    category when the cell was last written.
+    """
+    key = models.CharField(max_length=200, primary_key=True, editable=False)
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    city = models.CharField(max_length=100, blank=True)
+    affiliate = models.ForeignKey(Affiliate, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0, help_text="Orders containing the product")
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = "Sales Report"
+        verbose_name_plural = "Sales Report"
+        indexes = [
+            models.Index(fields=['day']),
+            models.Index(fields=['product', 'day']),
+            models.Index(fields=['category', 'day']),
+            models.Index(fields=['city', 'day']),
+            models.Index(fields=['affiliate', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id} {self.city} {self.status}: {self.revenue}"
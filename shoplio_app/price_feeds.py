@@ -0,0 +1,213 @@
+"""
+Bulk price and stock updates for one merchant's offers from a feed file.
+
+The feed (CSV, JSON lines or XML) is streamed in chunks and each row is matched
+to one of the merchant's ProductMerchant offers through an in-memory index by
+product SKU and by product URL. Rows are compared with the offer's current
+price, stock flag and availability text, and only offers that actually change
+are written, with bulk updates per chunk. New prices are also appended to the
+price history (see price_history.py).
+
+Columns: sku (or id) and/or url (or product_url, link), price, and optionally
+in_stock and availability. Fields a row leaves out keep their current value.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import price_history
+from .conditional import bump_catalog_version
+from .feeds import InvalidRow, chunked, iter_records
+from .models import ProductMerchant
+
+CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+AVAILABILITY_MAX_LENGTH = ProductMerchant._meta.get_field('availability_text').max_length
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'f'}
+IN_STOCK_TEXTS = {'in stock', 'in_stock', 'instock', 'available', 'limited availability', 'preorder', 'pre-order'}
+
+# The first number in a price such as "1,299.00 PKR" or "PKR 1299"
+PRICE_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+class PriceFeedResult:
+    """Counts and per-row errors from one feed run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.price_changes = 0
+        self.stock_changes = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+def _url_key(url):
+    return url.strip().rstrip('/').lower()
+
+
+class OfferIndex:
+    """
+    The merchant's offers keyed by SKU and URL, with their current state.
+
+    Only the columns needed to match and compare are loaded, as plain tuples,
+    so an index over a few hundred thousand offers stays small.
+    """
+
+    def __init__(self, merchant):
+        self.state = {}
+        self.products = {}
+        self.by_sku = {}
+        self.by_url = {}
+        offers = ProductMerchant.objects.filter(merchant=merchant).order_by().values_list(
+            'pk', 'product_id', 'product__sku', 'product_url', 'price', 'in_stock', 'availability_text',
+        )
+        for pk, product_id, sku, url, price, in_stock, availability_text in offers.iterator(chunk_size=CHUNK_SIZE):
+            self.state[pk] = (price, in_stock, availability_text)
+            self.products[pk] = product_id
+            if sku:
+                self.by_sku[sku.strip().lower()] = pk
+            if url:
+                self.by_url[_url_key(url)] = pk
+
+    def __len__(self):
+        return len(self.state)
+
+    def match(self, sku, url):
+        """The offer id for a row's SKU or URL, or None"""
+        if sku and sku.lower() in self.by_sku:
+            return self.by_sku[sku.lower()]
+        if url:
+            return self.by_url.get(_url_key(url))
+        return None
+
+
+def _parse_price(value):
+    match = PRICE_PATTERN.search(str(value or ''))
+    if match is None:
+        raise ValueError('price is required')
+    try:
+        price = Decimal(match.group().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError('price must be a number')
+    if price <= 0 or price >= Decimal('100000000'):
+        raise ValueError('price must be between 0 and 99,999,999.99')
+    return price.quantize(Decimal('0.01'))
+
+
+def _parse_stock(record, current_in_stock, current_text):
+    """(in_stock, availability_text) for a row, keeping what it does not mention"""
+    flag = str(record.get('in_stock') or '').strip().lower()
+    text = str(record.get('availability') or record.get('availability_text') or '').strip()
+
+    if flag in TRUE_VALUES:
+        in_stock = True
+    elif flag in FALSE_VALUES:
+        in_stock = False
+    elif flag:
+        raise ValueError(f'in_stock must be true or false, not "{record.get("in_stock")}"')
+    elif text:
+        in_stock = text.lower() in IN_STOCK_TEXTS
+    else:
+        return current_in_stock, current_text
+
+    if not text:
+        text = current_text if in_stock == current_in_stock else ('In Stock' if in_stock else 'Out of Stock')
+    elif text.replace('_', ' ').lower() == current_text.lower():
+        text = current_text
+    elif text.lower() == text or '_' in text:
+        # Feed codes such as "out_of_stock" read better as "Out of stock"
+        text = text.replace('_', ' ').capitalize()
+    return in_stock, text[:AVAILABILITY_MAX_LENGTH]
+
+
+def _apply(index, price_changes, stock_changes):
+    """Write one chunk's changed offers and bring the index up to date"""
+    now = timezone.now()
+    priced = [
+        ProductMerchant(pk=pk, price=price, in_stock=in_stock, availability_text=text, last_price_update=now,
+                        updated_at=now)
+        for pk, (price, in_stock, text) in price_changes.items()
+    ]
+    restocked = [
+        ProductMerchant(pk=pk, in_stock=in_stock, availability_text=text, updated_at=now)
+        for pk, (_, in_stock, text) in stock_changes.items()
+    ]
+    with transaction.atomic():
+        if priced:
+            ProductMerchant.objects.bulk_update(
+                priced, ['price', 'in_stock', 'availability_text', 'last_price_update', 'updated_at'], batch_size=500,
+            )
+        if restocked:
+            ProductMerchant.objects.bulk_update(
+                restocked, ['in_stock', 'availability_text', 'updated_at'], batch_size=500,
+            )
+        price_history.record(
+            [(pk, index.products[pk], price) for pk, (price, _, _) in price_changes.items()],
+            at=now,
+        )
+        bump_catalog_version()
+    index.state.update(price_changes)
+    index.state.update(stock_changes)
+
+
+def apply_price_feed(fileobj, merchant, fmt, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Stream `fileobj` and update the merchant's offers that changed"""
+    result = PriceFeedResult()
+    index = OfferIndex(merchant)
+
+    for chunk in chunked(iter_records(fileobj, fmt), chunk_size):
+        price_changes = {}
+        stock_changes = {}
+        for line_number, record in chunk:
+            result.rows += 1
+            if isinstance(record, InvalidRow):
+                result.add_error(line_number, record.message)
+                continue
+
+            sku = str(record.get('sku') or record.get('id') or '').strip()
+            url = str(record.get('url') or record.get('product_url') or record.get('link') or '').strip()
+            if not sku and not url:
+                result.add_error(line_number, 'sku or url is required')
+                continue
+            pk = index.match(sku, url)
+            if pk is None:
+                result.unmatched += 1
+                continue
+            result.matched += 1
+
+            # A later row for the same offer wins over an earlier one
+            current = price_changes.get(pk) or stock_changes.get(pk) or index.state[pk]
+            try:
+                price = _parse_price(record.get('price'))
+                in_stock, text = _parse_stock(record, current[1], current[2])
+            except ValueError as e:
+                result.add_error(line_number, str(e))
+                continue
+
+            price_changes.pop(pk, None)
+            stock_changes.pop(pk, None)
+            original = index.state[pk]
+            if price != original[0]:
+                price_changes[pk] = (price, in_stock, text)
+            elif (in_stock, text) != original[1:]:
+                stock_changes[pk] = (price, in_stock, text)
+
+        result.price_changes += len(price_changes)
+        result.stock_changes += len(stock_changes)
+        if not dry_run and (price_changes or stock_changes):
+            _apply(index, price_changes, stock_changes)
+
+    return result
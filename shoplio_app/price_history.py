@@ -0,0 +1,177 @@
+"""
+Price history for merchant offers.
+
+Every price an offer takes is appended to PriceChange. Charts never read that
+table: each product also has a PriceSeries, a short JSON list of
+[day, low, high] buckets that `record()` updates as prices change. Buckets are
+daily for settings.PRICE_HISTORY_DAILY_DAYS and are then merged into weekly
+buckets (keyed by the Monday) by `compact()`, which the compact_price_history
+command runs over all series; buckets older than PRICE_HISTORY_KEEP_DAYS are
+dropped, so a series stays at a couple of hundred points at most.
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .conditional import bump_catalog_version
+from .models import PriceChange, PriceSeries
+
+BATCH_SIZE = 500
+
+
+def add_price(points, day, price, high=None):
+    """Fold a price (or a low/high pair) seen on `day` into its daily bucket"""
+    key = day.isoformat()
+    low, high = Decimal(price), Decimal(high if high is not None else price)
+    position = len(points)
+    # Prices nearly always arrive for today, which is the last bucket
+    while position and points[position - 1][0] > key:
+        position -= 1
+    if position and points[position - 1][0] == key:
+        bucket = points[position - 1]
+        bucket[1] = str(min(Decimal(bucket[1]), low))
+        bucket[2] = str(max(Decimal(bucket[2]), high))
+    else:
+        points.insert(position, [key, str(low), str(high)])
+
+
+def compact(points, today=None):
+    """Merge daily buckets older than the daily window into weekly ones and drop expired buckets"""
+    today = today or timezone.localdate()
+    daily_from = today - datetime.timedelta(days=settings.PRICE_HISTORY_DAILY_DAYS)
+    keep_from = today - datetime.timedelta(days=settings.PRICE_HISTORY_KEEP_DAYS)
+
+    compacted = []
+    for key, low, high in points:
+        day = datetime.date.fromisoformat(key)
+        if day < keep_from:
+            continue
+        if day < daily_from:
+            day -= datetime.timedelta(days=day.weekday())
+        add_price(compacted, day, low, high)
+    return compacted
+
+
+def record(changes, at=None):
+    """
+    Append price changes and fold them into their products' series.
+
+    `changes` is a list of (offer_id, product_id, price). Series rows are
+    locked while they are updated, so concurrent writers never drop points.
+    """
+    if not changes:
+        return
+    at = at or timezone.now()
+    day = timezone.localdate(at)
+    prices = defaultdict(list)
+    for _, product_id, price in changes:
+        prices[product_id].append(price)
+
+    with transaction.atomic():
+        PriceChange.objects.bulk_create(
+            [PriceChange(offer_id=offer_id, price=price, changed_at=at) for offer_id, _, price in changes],
+            batch_size=BATCH_SIZE,
+        )
+        PriceSeries.objects.bulk_create(
+            [PriceSeries(product_id=product_id) for product_id in prices],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        series = PriceSeries.objects.select_for_update().in_bulk(list(prices))
+        for product_id, product_prices in prices.items():
+            for price in product_prices:
+                add_price(series[product_id].points, day, price)
+            series[product_id].updated_at = at
+        PriceSeries.objects.bulk_update(series.values(), ['points', 'updated_at'], batch_size=BATCH_SIZE)
+
+
+def _save_rebuilt(rebuilt, keep_before):
+    """Replace the buckets from `keep_before` on in each rebuilt series"""
+    key = keep_before.isoformat()
+    with transaction.atomic():
+        PriceSeries.objects.bulk_create(
+            [PriceSeries(product_id=product_id) for product_id in rebuilt],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        series = PriceSeries.objects.select_for_update().in_bulk(list(rebuilt))
+        for product_id, points in rebuilt.items():
+            kept = [bucket for bucket in series[product_id].points if bucket[0] < key]
+            series[product_id].points = compact(kept + points)
+            series[product_id].updated_at = timezone.now()
+        PriceSeries.objects.bulk_update(series.values(), ['points', 'updated_at'], batch_size=BATCH_SIZE)
+        bump_catalog_version()
+
+
+def rebuild():
+    """
+    Recompute every series from the PriceChange rows still kept.
+
+    One grouped query returns a low/high per product per day, read in product
+    order, so memory holds one batch of products at a time. Returns the
+    number of series rebuilt.
+    """
+    keep_before = timezone.localdate() - datetime.timedelta(days=settings.PRICE_HISTORY_RAW_DAYS)
+    days = (
+        PriceChange.objects
+        .filter(changed_at__date__gte=keep_before)
+        .annotate(product_id=F('offer__product_id'), day=TruncDate('changed_at'))
+        .values('product_id', 'day')
+        .annotate(low=Min('price'), high=Max('price'))
+        .order_by('product_id', 'day')
+    )
+    rebuilt = {}
+    count = 0
+    for row in days.iterator(chunk_size=5000):
+        if row['product_id'] not in rebuilt and len(rebuilt) >= BATCH_SIZE:
+            _save_rebuilt(rebuilt, keep_before)
+            count += len(rebuilt)
+            rebuilt = {}
+        points = rebuilt.setdefault(row['product_id'], [])
+        add_price(points, row['day'], row['low'], row['high'])
+    if rebuilt:
+        _save_rebuilt(rebuilt, keep_before)
+        count += len(rebuilt)
+    return count
+
+
+def compact_all():
+    """Compact every series; returns the number that changed"""
+    changed = 0
+    last_pk = None
+    while True:
+        batch = PriceSeries.objects.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:BATCH_SIZE])
+        if not batch:
+            return changed
+        last_pk = batch[-1].pk
+        updated = []
+        for series in batch:
+            points = compact(series.points)
+            if points != series.points:
+                series.points = points
+                updated.append(series)
+        PriceSeries.objects.bulk_update(updated, ['points'], batch_size=BATCH_SIZE)
+        if updated:
+            bump_catalog_version()
+        changed += len(updated)
+
+
+def prune(batch_size=5000):
+    """Delete PriceChange rows older than PRICE_HISTORY_RAW_DAYS; returns the number deleted"""
+    cutoff = timezone.now() - datetime.timedelta(days=settings.PRICE_HISTORY_RAW_DAYS)
+    deleted = 0
+    while True:
+        ids = list(PriceChange.objects.filter(changed_at__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += PriceChange.objects.filter(pk__in=ids).delete()[0]
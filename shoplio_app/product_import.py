@@ -0,0 +1,178 @@
+"""
+Bulk product import for sellers.
+
+A CSV, JSON-lines or XML file is streamed in chunks. Each chunk is validated row by
+row, gets unique slugs from one lookup per few hundred names, and is inserted with
+`bulk_create`. Invalid rows are reported with their line number and skipped;
+they never abort the rest of the file.
+
+Columns: name, description, category (slug, name or id), base_price,
+and optionally brand, sku and currency.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from . import tasks
+from .conditional import bump_catalog_version
+from .feeds import InvalidRow, chunked, iter_records
+from .models import Category, Product
+
+CHUNK_SIZE = 500
+# Names checked per slug query; keeps each query's pattern a reasonable size
+SLUG_QUERY_BATCH = 200
+MAX_REPORTED_ERRORS = 1000
+
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+# Leave room for a "-<n>" suffix
+SLUG_BASE_LENGTH = SLUG_MAX_LENGTH - 10
+
+
+class ImportResult:
+    """Counts and per-row errors from one import run"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+
+
+def category_map():
+    """Categories keyed by id, slug and lower-cased name, loaded in one query"""
+    lookup = {}
+    for category in Category.objects.all():
+        lookup[str(category.pk)] = category
+        lookup[category.slug.lower()] = category
+        lookup[category.name.lower()] = category
+    return lookup
+
+
+def _clean(record, categories):
+    """Return Product field values for a record, or raise ValueError"""
+    def text(field, max_length, required=False):
+        value = str(record.get(field) or '').strip()
+        if required and not value:
+            raise ValueError(f'{field} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        return value
+
+    name = text('name', 300, required=True)
+    description = str(record.get('description') or '').strip()
+    if not description:
+        raise ValueError('description is required')
+
+    category_key = str(record.get('category') or '').strip().lower()
+    if not category_key:
+        raise ValueError('category is required')
+    category = categories.get(category_key)
+    if category is None:
+        raise ValueError(f'unknown category "{record.get("category")}"')
+
+    try:
+        base_price = Decimal(str(record.get('base_price') or '').replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError('base_price must be a number')
+    if not base_price.is_finite() or base_price <= 0 or base_price >= Decimal('100000000'):
+        raise ValueError('base_price must be between 0 and 99,999,999.99')
+
+    if not slugify(name):
+        raise ValueError('name must contain letters or digits')
+
+    return {
+        'name': name,
+        'description': description,
+        'category': category,
+        'base_price': base_price.quantize(Decimal('0.01')),
+        'brand': text('brand', 100),
+        'sku': text('sku', 100),
+        'currency': text('currency', 3).upper() or 'PKR',
+    }
+
+
+def _taken_slugs(bases):
+    """Existing slugs equal to one of `bases` or to `<base>-<n>`"""
+    taken = set()
+    bases = sorted(set(bases))
+    for start in range(0, len(bases), SLUG_QUERY_BATCH):
+        # Slugified names only contain [-a-z0-9_], so they need no escaping
+        pattern = r'^(%s)(-[0-9]+)?$' % '|'.join(bases[start:start + SLUG_QUERY_BATCH])
+        taken.update(Product.objects.filter(slug__regex=pattern).values_list('slug', flat=True))
+    return taken
+
+
+def allocate_slugs(names):
+    """
+    Unique slugs for a batch of product names.
+
+    Follows the single-product rule of appending -1, -2, ... to the slugified
+    name until it is free, but checks the whole batch against existing slugs
+    (and against each other) with one query per SLUG_QUERY_BATCH names.
+    """
+    bases = [slugify(name)[:SLUG_BASE_LENGTH] for name in names]
+    taken = _taken_slugs(bases)
+
+    slugs = []
+    for base in bases:
+        slug = base
+        counter = 1
+        while slug in taken:
+            slug = f'{base}-{counter}'
+            counter += 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def _insert(rows, seller):
+    """bulk_create one validated chunk; returns the number of products created"""
+    slugs = allocate_slugs([fields['name'] for _, fields in rows])
+    products = [
+        Product(slug=slug, seller=seller, is_approved=False, **fields)
+        for slug, (_, fields) in zip(slugs, rows)
+    ]
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        bump_catalog_version()
+        tasks.enqueue('match_products', {'product_ids': [product.pk for product in products]})
+    return len(products)
+
+
+def import_products(fileobj, seller, fmt, chunk_size=CHUNK_SIZE):
+    """Stream `fileobj` into new, unapproved products owned by `seller`"""
+    result = ImportResult()
+    categories = category_map()
+
+    for chunk in chunked(iter_records(fileobj, fmt), chunk_size):
+        rows = []
+        for line_number, record in chunk:
+            result.rows += 1
+            if isinstance(record, InvalidRow):
+                result.add_error(line_number, record.message)
+                continue
+            try:
+                rows.append((line_number, _clean(record, categories)))
+            except ValueError as e:
+                result.add_error(line_number, str(e))
+
+        if not rows:
+            continue
+        try:
+            result.created += _insert(rows, seller)
+        except IntegrityError:
+            # A concurrent insert took one of our slugs; allocate again once
+            try:
+                result.created += _insert(rows, seller)
+            except IntegrityError as e:
+                for line_number, _ in rows:
+                    result.add_error(line_number, f'could not save: {e}')
+
+    return result
@@ -0,0 +1,272 @@
+"""
+Near-duplicate product detection with MinHash and LSH.
+
+A listing's text is turned into shingles: character SHINGLE_SIZE-grams of its
+name and brand, its SKU as one token, and word pairs from the start of its
+description. NUM_PERM hash functions each keep their smallest value over the
+shingles; the fraction of positions where two signatures agree estimates the
+Jaccard similarity of the two shingle sets.
+
+The signature is cut into BANDS bands of ROWS values. Each band is hashed to a
+bucket and stored in ProductBand, so the candidates for a product are the
+products sharing any (band, bucket) pair: an indexed lookup, however big the
+catalog. With 20 bands of 6 rows, listings more similar than about 0.6 are
+very likely to share a bucket and listings below 0.3 very unlikely to.
+Candidates whose signatures agree on at least DUPLICATE_THRESHOLD of their
+positions are recorded as ProductMatch rows, which the product admin shows.
+
+`match_product()` handles one product (the match_products task runs it for new
+and edited listings); `cluster_catalog()`, behind the cluster_products
+command, recomputes every signature in a process pool and groups the whole
+catalog at once.
+"""
+
+import hashlib
+import random
+import re
+import struct
+from array import array
+from collections import defaultdict, deque
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Product, ProductBand, ProductMatch, ProductSignature
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+DESCRIPTION_WORDS = 60
+DUPLICATE_THRESHOLD = 0.6
+# Buckets shared by more products than this (boilerplate listings) are
+# skipped when clustering rather than compared pairwise
+MAX_BUCKET_SIZE = 200
+BATCH_SIZE = 500
+
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+# Fixed seed: signatures must stay comparable across processes and deploys
+_rng = random.Random(20240611)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD = re.compile(r'[^\W_]+')
+TEXT_FIELDS = ('pk', 'name', 'brand', 'sku', 'description')
+
+
+def shingles(name, brand='', sku='', description=''):
+    """The set of shingles describing a listing"""
+    title = ' '.join(_WORD.findall(f'{brand} {name}'.lower()))
+    found = {title[start:start + SHINGLE_SIZE] for start in range(max(len(title) - SHINGLE_SIZE + 1, 1))}
+    sku = ''.join(_WORD.findall((sku or '').lower()))
+    if sku:
+        found.add(f'sku:{sku}')
+    words = _WORD.findall((description or '').lower())[:DESCRIPTION_WORDS]
+    found.update(f'{first} {second}' for first, second in zip(words, words[1:]))
+    return found
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+
+
+def minhash(found):
+    """NUM_PERM minimum hashes of a shingle set, as an array of unsigned 32-bit ints"""
+    hashes = [_hash(shingle) for shingle in found] or [0]
+    return array('I', [
+        min((a * value + b) % _PRIME for value in hashes) & _MASK
+        for a, b in PERMUTATIONS
+    ])
+
+
+def source_hash(name, brand='', sku='', description=''):
+    return hashlib.sha1('\x1f'.join((name, brand or '', sku or '', description or '')).encode()).hexdigest()
+
+
+def bands(signature):
+    """(band, bucket) pairs for a signature; buckets fit a signed 64-bit column"""
+    pairs = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS}I', *rows), digest_size=8).digest()
+        pairs.append((band, int.from_bytes(digest, 'little') >> 1))
+    return pairs
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def pack(signature):
+    return signature.tobytes()
+
+
+def unpack(data):
+    signature = array('I')
+    signature.frombytes(bytes(data))
+    return signature
+
+
+def signatures_for(rows):
+    """
+    [(pk, packed signature, source hash)] for (pk, name, brand, sku, description)
+    rows. Needs no database access, so it can run in a worker process.
+    """
+    return [
+        (pk, pack(minhash(shingles(name, brand, sku, description))), source_hash(name, brand, sku, description))
+        for pk, name, brand, sku, description in rows
+    ]
+
+
+def _save_signatures(computed, now):
+    """Store signatures and replace their products' band rows"""
+    pks = [pk for pk, _, _ in computed]
+    ProductSignature.objects.filter(pk__in=pks).delete()
+    ProductSignature.objects.bulk_create(
+        [ProductSignature(product_id=pk, minhash=data, source_hash=digest, computed_at=now)
+         for pk, data, digest in computed],
+        batch_size=BATCH_SIZE,
+    )
+    ProductBand.objects.filter(product_id__in=pks).delete()
+    ProductBand.objects.bulk_create(
+        [ProductBand(product_id=pk, band=band, bucket=bucket)
+         for pk, data, _ in computed for band, bucket in bands(unpack(data))],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def _create_matches(pairs, now):
+    """Store (first, second, similarity) pairs in both directions"""
+    ProductMatch.objects.bulk_create(
+        [ProductMatch(product_id=product_id, match_id=match_id, similarity=score, detected_at=now)
+         for first, second, score in pairs
+         for product_id, match_id in ((first, second), (second, first))],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def candidates(pk, signature):
+    """Ids of products sharing at least one LSH bucket with `signature`"""
+    lookup = Q()
+    for band, bucket in bands(signature):
+        lookup |= Q(band=band, bucket=bucket)
+    return set(ProductBand.objects.filter(lookup).exclude(product_id=pk).values_list('product_id', flat=True))
+
+
+def match_product(product_id):
+    """
+    (Re)compute a product's signature and duplicate matches; returns the
+    ProductMatch rows found for it.
+    """
+    row = Product.objects.filter(pk=product_id).values_list(*TEXT_FIELDS).first()
+    if row is None:
+        return []
+    now = timezone.now()
+    (pk, data, digest), = signatures_for([row])
+    signature = unpack(data)
+
+    with transaction.atomic():
+        if not ProductSignature.objects.filter(pk=pk, source_hash=digest).exists():
+            _save_signatures([(pk, data, digest)], now)
+        found = candidates(pk, signature)
+        others = ProductSignature.objects.filter(pk__in=found).values_list('pk', 'minhash')
+        pairs = []
+        for other, other_data in others:
+            score = similarity(signature, unpack(other_data))
+            if score >= DUPLICATE_THRESHOLD:
+                pairs.append((pk, other, score))
+        ProductMatch.objects.filter(Q(product_id=pk) | Q(match_id=pk)).delete()
+        _create_matches(pairs, now)
+    return list(ProductMatch.objects.filter(product_id=pk).select_related('match'))
+
+
+class _Clusters:
+    """Union-find over product ids"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, pk):
+        root = self.parent.setdefault(pk, pk)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while pk != root:
+            self.parent[pk], pk = root, self.parent[pk]
+        return root
+
+    def union(self, first, second):
+        self.parent[self.find(first)] = self.find(second)
+
+    def groups(self):
+        groups = defaultdict(list)
+        for pk in self.parent:
+            groups[self.find(pk)].append(pk)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+def _in_order(executor, func, items, window):
+    """executor.map() that only reads `window` items ahead of the results"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def cluster_catalog(executor, workers, chunk_size=2000, stdout=None):
+    """
+    Recompute every product's signature with `executor`, a pool of `workers`
+    processes, then replace all matches by comparing products that share a
+    bucket. Signatures are kept in memory (480 bytes per product) for the
+    comparison. Returns the clusters of likely duplicates as sorted lists of
+    product ids.
+    """
+    now = timezone.now()
+    signatures = {}
+    buckets = defaultdict(list)
+
+    def chunks():
+        last_pk = 0
+        while True:
+            rows = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list(*TEXT_FIELDS)[:chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield rows
+
+    for computed in _in_order(executor, signatures_for, chunks(), window=workers * 2):
+        with transaction.atomic():
+            _save_signatures(computed, now)
+        for pk, data, _ in computed:
+            signature = unpack(data)
+            signatures[pk] = data
+            for key in bands(signature):
+                buckets[key].append(pk)
+        if stdout:
+            stdout.write(f'{len(signatures)} signatures computed')
+
+    pairs = {}
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+            continue
+        for position, first in enumerate(members):
+            first_signature = None
+            for second in members[position + 1:]:
+                if (first, second) in pairs:
+                    continue
+                first_signature = first_signature or unpack(signatures[first])
+                pairs[first, second] = similarity(first_signature, unpack(signatures[second]))
+
+    clusters = _Clusters()
+    matched = [(first, second, score) for (first, second), score in pairs.items() if score >= DUPLICATE_THRESHOLD]
+    for first, second, _ in matched:
+        clusters.union(first, second)
+    with transaction.atomic():
+        ProductMatch.objects.all().delete()
+        _create_matches(matched, now)
+    return clusters.groups()
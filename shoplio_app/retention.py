@@ -0,0 +1,202 @@
+"""
+Click retention and archival.
+
+Rows older than the retention window are moved out of the live click tables
+into gzip-compressed NDJSON files partitioned by day:
+
+    <CLICK_ARCHIVE_ROOT>/<table>/<YYYY>/<MM>/<YYYY-MM-DD>.ndjson.gz
+
+Each archive run appends a new gzip member to the partition file, so the
+files stay valid after repeated runs. Archived data can still be aggregated
+with `aggregate_archive()`, which only opens the partitions in the requested
+date range.
+"""
+
+import datetime
+import gzip
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClickTracking, ClickBankClickTracking, AffiliateClick
+
+
+# Output column -> ORM lookup for each archived table
+ARCHIVE_TABLES = {
+    'clicks': {
+        'model': ClickTracking,
+        'columns': {
+            'id': 'id',
+            'clicked_at': 'clicked_at',
+            'product_merchant_id': 'product_merchant_id',
+            'product_id': 'product_merchant__product_id',
+            'merchant_id': 'product_merchant__merchant_id',
+            'ip_address': 'ip_address',
+            'user_agent': 'user_agent__value',
+            'referrer': 'referrer__value',
+        },
+    },
+    'clickbank_clicks': {
+        'model': ClickBankClickTracking,
+        'columns': {
+            'id': 'id',
+            'clicked_at': 'clicked_at',
+            'clickbank_product_id': 'clickbank_product_id',
+            'ip_address': 'ip_address',
+            'user_agent': 'user_agent__value',
+            'referrer': 'referrer__value',
+        },
+    },
+    'affiliate_clicks': {
+        'model': AffiliateClick,
+        'columns': {
+            'id': 'id',
+            'clicked_at': 'clicked_at',
+            'affiliate_id': 'affiliate_id',
+            'product_id': 'product_id',
+            'order_id': 'order_id',
+            'converted': 'converted',
+            'converted_at': 'converted_at',
+            'ip_address': 'ip_address',
+            'user_agent': 'user_agent__value',
+            'referrer': 'referrer__value',
+        },
+    },
+}
+
+
+def partition_path(table, day, root=None):
+    """Path of the archive file holding one table's rows for one day"""
+    root = root or settings.CLICK_ARCHIVE_ROOT
+    return os.path.join(root, table, f'{day:%Y}', f'{day:%m}', f'{day:%Y-%m-%d}.ndjson.gz')
+
+
+def _serialize(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _write_partitions(table, rows, root=None):
+    """Append rows to their daily partition files, one gzip member per file"""
+    by_day = defaultdict(list)
+    for row in rows:
+        by_day[timezone.localdate(row['clicked_at'])].append(row)
+
+    for day, day_rows in by_day.items():
+        path = partition_path(table, day, root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = ''.join(
+            json.dumps({key: _serialize(value) for key, value in row.items()}, separators=(',', ':')) + '\n'
+            for row in day_rows
+        )
+        with gzip.open(path, 'at', encoding='utf-8') as fh:
+            fh.write(payload)
+
+
+def archive_table(table, older_than_days=None, batch_size=None, root=None, max_batches=None):
+    """
+    Move rows older than the retention window from one live table into the archive.
+
+    Rows are read and deleted in primary-key batches of `batch_size`, so a run
+    never holds more than one batch in memory or in a single DELETE. Returns the
+    number of rows archived.
+    """
+    config = ARCHIVE_TABLES[table]
+    model = config['model']
+    columns = config['columns']
+    if older_than_days is None:
+        older_than_days = settings.CLICK_RETENTION_DAYS
+    if batch_size is None:
+        batch_size = settings.CLICK_ARCHIVE_BATCH_SIZE
+
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    lookups = list(columns.values())
+    archived = 0
+    batches = 0
+    last_pk = 0
+
+    while max_batches is None or batches < max_batches:
+        values = list(
+            model.objects.filter(clicked_at__lt=cutoff, pk__gt=last_pk)
+            .order_by('pk')
+            .values(*lookups)[:batch_size]
+        )
+        if not values:
+            break
+
+        rows = [{key: row[lookup] for key, lookup in columns.items()} for row in values]
+        pks = [row['id'] for row in rows]
+
+        # Write the archive first; a crash before the delete only means the
+        # batch is archived twice, never lost.
+        _write_partitions(table, rows, root)
+        with transaction.atomic():
+            model.objects.filter(pk__in=pks).delete()
+
+        archived += len(rows)
+        batches += 1
+        last_pk = pks[-1]
+
+    return archived
+
+
+def archive_all(older_than_days=None, batch_size=None, root=None):
+    """Archive every click table, returning {table: rows archived}"""
+    return {
+        table: archive_table(table, older_than_days=older_than_days, batch_size=batch_size, root=root)
+        for table in ARCHIVE_TABLES
+    }
+
+
+def iter_archive(table, start=None, end=None, root=None):
+    """
+    Yield archived rows for `table` whose day falls within [start, end].
+
+    Each row gains a 'day' key naming its partition. Rows written twice by a
+    re-run batch land in the same partition and are skipped here.
+    """
+    root = root or settings.CLICK_ARCHIVE_ROOT
+    table_dir = os.path.join(root, table)
+    if not os.path.isdir(table_dir):
+        return
+
+    for year in sorted(os.listdir(table_dir)):
+        for month in sorted(os.listdir(os.path.join(table_dir, year))):
+            month_dir = os.path.join(table_dir, year, month)
+            for filename in sorted(os.listdir(month_dir)):
+                if not filename.endswith('.ndjson.gz'):
+                    continue
+                day = datetime.date.fromisoformat(filename[:10])
+                if (start and day < start) or (end and day > end):
+                    continue
+                seen = set()
+                with gzip.open(os.path.join(month_dir, filename), 'rt', encoding='utf-8') as fh:
+                    for line in fh:
+                        if not line.strip():
+                            continue
+                        row = json.loads(line)
+                        if row['id'] in seen:
+                            continue
+                        seen.add(row['id'])
+                        row['day'] = filename[:10]
+                        yield row
+
+
+def aggregate_archive(table, group_by, start=None, end=None, root=None):
+    """
+    Count archived rows grouped by one or more columns.
+
+    `group_by` may include the pseudo-column 'day'. Returns a Counter keyed by
+    a tuple of the grouped values, e.g. aggregate_archive('clicks', ['day', 'product_id']).
+    """
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    counts = Counter()
+    for row in iter_archive(table, start=start, end=end, root=root):
+        counts[tuple(row.get(column) for column in group_by)] += 1
+    return counts
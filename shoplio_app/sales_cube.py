@@ -0,0 +1,294 @@
+"""
+Pre-aggregated sales cube behind the sales reports.
+
+SalesCell holds orders, units and revenue per day x product x city x affiliate
+x status, tagged with the product's category. A cell is keyed by
+"<day>:<product>:<status>:<affiliate>:<city>", so changes are applied as one
+bulk insert of the missing cells plus one executemany() of increments by key,
+with no read first; cells that drop to no orders are deleted.
+
+Each order remembers what it is counted as in Order.reported_as
+("<status>:<affiliate>:<city>"). sync_order() moves an order's items from the
+cells it was counted in to the cells it belongs in now. A new order is first
+counted by the order_placed job that checkout already queues, so checkout
+writes no extra task. Saving an existing order whose status, affiliate or city
+differ from what it is counted as queues the sync_sales_cube task in the same
+transaction (see signals.py). Claiming the change is a conditional UPDATE on
+reported_as, so concurrent syncs never count an order twice. Orders created
+some other way are counted on their next change, or by a rebuild. Deleting an
+order takes it out of the cube straight away.
+
+Reports slice the cube instead of scanning orders: `cells()` filters it and
+`summarize()` groups it by any of DIMENSIONS, for the admin report page and
+the sales_report JSON endpoint. rebuild() recomputes everything from the
+orders, for backfill (the rebuild_sales_cube command).
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Affiliate, Category, Order, OrderItem, Product, SalesCell
+
+BATCH_SIZE = 500
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+CENTS = Decimal('0.01')
+
+# Dimension -> (output name, lookup) pairs reported for it
+DIMENSIONS = {
+    'day': (('day', 'day'),),
+    'month': (('month', 'month'),),
+    'product': (('product_id', 'product_id'), ('product_name', 'product__name')),
+    'category': (('category_id', 'category_id'), ('category_name', 'category__name')),
+    'city': (('city', 'city'),),
+    'affiliate': (('affiliate_id', 'affiliate_id'), ('affiliate_code', 'affiliate__affiliate_code')),
+    'status': (('status', 'status'),),
+}
+MEASURES = ('orders', 'units', 'revenue')
+STATUSES = {status for status, _ in Order.STATUS_CHOICES}
+
+
+def normalize_city(city):
+    """Cities as typed at checkout, with spacing and case made consistent"""
+    return ' '.join((city or '').split()).title()[:100]
+
+
+def reported_as(status, affiliate_id, city):
+    return f'{status}:{affiliate_id or 0}:{normalize_city(city)}'
+
+
+def _parse(reported):
+    status, affiliate_id, city = reported.split(':', 2)
+    return status, int(affiliate_id) or None, city
+
+
+def _lines(order_ids):
+    """{order id: [(product id, category id, units, revenue)]} from the orders' items"""
+    line_total = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    lines = {}
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('order_id', 'product_id', 'product__category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(line_total))
+        .values_list('order_id', 'product_id', 'product__category_id', 'units', 'revenue')
+        .order_by()
+    )
+    for order_id, *line in rows:
+        lines.setdefault(order_id, []).append(line)
+    return lines
+
+
+def _add(deltas, day, reported, lines, sign):
+    """Add an order's lines, counted as `reported` on `day`, to `deltas` (key -> cell values)"""
+    status, affiliate_id, city = _parse(reported)
+    for product_id, category_id, units, revenue in lines:
+        key = f'{day:%Y%m%d}:{product_id}:{reported}'
+        cell = deltas.get(key)
+        if cell is None:
+            cell = deltas[key] = {
+                'day': day, 'product_id': product_id, 'category_id': category_id, 'city': city,
+                'affiliate_id': affiliate_id, 'status': status, 'orders': 0, 'units': 0, 'revenue': Decimal('0'),
+            }
+        cell['orders'] += sign
+        cell['units'] += sign * units
+        cell['revenue'] += sign * revenue
+
+
+def _increment_sql(connection):
+    quote = connection.ops.quote_name
+    columns = {field.name: quote(field.column) for field in SalesCell._meta.concrete_fields}
+    measures = ', '.join(f'{columns[measure]} = {columns[measure]} + %s' for measure in MEASURES)
+    return (f"UPDATE {quote(SalesCell._meta.db_table)} SET {measures}, {columns['category']} = %s "
+            f"WHERE {columns['key']} = %s")
+
+
+def _apply(deltas):
+    """Add {key: cell values} to the stored cells"""
+    keys = sorted(key for key, cell in deltas.items() if cell['orders'] or cell['units'] or cell['revenue'])
+    connection = connections[SalesCell.objects.db]
+    sql = _increment_sql(connection)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        # Only cells gaining orders can be new; retracted cells always exist
+        SalesCell.objects.bulk_create(
+            [SalesCell(key=key, **dict(deltas[key], orders=0, units=0, revenue=0))
+             for key in batch if deltas[key]['orders'] > 0],
+            ignore_conflicts=True,
+        )
+        # One prepared UPDATE per cell: bulk_update() would build a CASE
+        # expression over the whole batch for every column
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                [deltas[key][measure] for measure in MEASURES] + [deltas[key]['category_id'], key] for key in batch
+            ])
+        SalesCell.objects.filter(key__in=batch, orders__lte=0).delete()
+
+
+def sync_order(order_id):
+    """Count an order in the cells it belongs in now; returns True if the cube changed"""
+    row = Order.objects.filter(pk=order_id).values_list(
+        'created_at', 'status', 'affiliate_id', 'city', 'reported_as',
+    ).first()
+    if row is None:
+        return False
+    created_at, status, affiliate_id, city, previous = row
+    current = reported_as(status, affiliate_id, city)
+    if previous == current:
+        return False
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order_id, reported_as=previous).update(reported_as=current):
+            # Another process synced the order meanwhile
+            return False
+        day = timezone.localdate(created_at)
+        lines = _lines([order_id]).get(order_id, [])
+        deltas = {}
+        if previous:
+            _add(deltas, day, previous, lines, -1)
+        _add(deltas, day, current, lines, 1)
+        _apply(deltas)
+    return True
+
+
+def retract_order(order):
+    """Take a counted order out of the cube; called before the order is deleted"""
+    if not order.reported_as:
+        return
+    deltas = {}
+    _add(deltas, timezone.localdate(order.created_at), order.reported_as, _lines([order.pk]).get(order.pk, []), -1)
+    _apply(deltas)
+
+
+def rebuild(chunk_size=2000, stdout=None):
+    """Recompute the whole cube from the orders; returns the number of orders counted"""
+    with transaction.atomic():
+        SalesCell.objects.all().delete()
+        Order.objects.exclude(reported_as='').update(reported_as='')
+
+    counted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so a concurrent sync_order() waits and then finds the order counted
+            orders = list(
+                Order.objects.select_for_update().filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'created_at', 'status', 'affiliate_id', 'city', 'reported_as')[:chunk_size]
+            )
+            if not orders:
+                break
+            last_pk = orders[-1][0]
+            pending = [order for order in orders if not order[5]]
+            lines = _lines([order[0] for order in pending])
+            deltas = {}
+            marked = defaultdict(list)  # reported_as -> order ids
+            for pk, created_at, status, affiliate_id, city, _ in pending:
+                current = reported_as(status, affiliate_id, city)
+                _add(deltas, timezone.localdate(created_at), current, lines.get(pk, []), 1)
+                marked[current].append(pk)
+            _apply(deltas)
+            for current, pks in marked.items():
+                Order.objects.filter(pk__in=pks).update(reported_as=current)
+        counted += len(pending)
+        if stdout:
+            stdout.write(f'{counted} orders counted')
+    return counted
+
+
+# ---- Reports -----------------------------------------------------------
+
+def _cents(amount):
+    # Sums come back unscaled from some databases
+    return Decimal(amount or 0).quantize(CENTS)
+
+
+def cells(start=None, end=None, product=None, category=None, city=None, affiliate=None, status=None):
+    """Cells for days start..end (inclusive) and the given dimension values"""
+    queryset = SalesCell.objects.all()
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+    if product is not None:
+        queryset = queryset.filter(product=product)
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if city:
+        queryset = queryset.filter(city=normalize_city(city))
+    if affiliate is not None:
+        queryset = queryset.filter(affiliate=affiliate)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def parse_group_by(value):
+    """Dimensions from a comma separated list; raises ValueError for unknown ones"""
+    group_by = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"unknown dimension {', '.join(unknown)}; choose from {', '.join(DIMENSIONS)}")
+    return group_by
+
+
+def summarize(queryset, group_by, limit=DEFAULT_LIMIT):
+    """
+    ([row], totals) for `queryset` of cells grouped by `group_by`, rows with
+    the most revenue first. Each row holds the dimensions' output names and
+    the summed measures.
+    """
+    names = [name for dimension in group_by for name, _ in DIMENSIONS[dimension]]
+    lookups = [lookup for dimension in group_by for _, lookup in DIMENSIONS[dimension]]
+    queryset = queryset.order_by()
+    if 'month' in group_by:
+        queryset = queryset.annotate(month=TruncMonth('day'))
+    sums = {measure: Sum(measure) for measure in MEASURES}
+    rows = []
+    for *values, orders, units, revenue in (
+        queryset.values(*lookups).annotate(**sums).order_by('-revenue', *lookups)
+        .values_list(*lookups, *MEASURES)[:min(limit, MAX_LIMIT)]
+    ):
+        rows.append(dict(zip(names, values), orders=orders, units=units, revenue=_cents(revenue)))
+    totals = queryset.aggregate(**sums)
+    return rows, {'orders': totals['orders'] or 0, 'units': totals['units'] or 0, 'revenue': _cents(totals['revenue'])}
+
+
+def query_from(params):
+    """
+    (cells, group_by, limit) from request parameters: group_by, start, end
+    (YYYY-MM-DD), product (id or slug), category (id or slug), city, affiliate
+    (code), status and limit. Raises ValueError for bad values.
+    """
+    def day(name):
+        try:
+            return datetime.date.fromisoformat(params[name]) if params.get(name) else None
+        except ValueError:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+
+    def lookup(model, field, name):
+        value = params.get(name)
+        if not value:
+            return None
+        condition = Q(**{field: value}) | Q(pk=value) if value.isdigit() else Q(**{field: value})
+        found = model.objects.filter(condition).values_list('pk', flat=True).first()
+        if found is None:
+            raise ValueError(f'unknown {name} "{value}"')
+        return found
+
+    status = params.get('status') or None
+    if status and status not in STATUSES:
+        raise ValueError(f'unknown status "{status}"')
+    try:
+        limit = max(int(params.get('limit') or DEFAULT_LIMIT), 1)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    queryset = cells(
+        start=day('start'), end=day('end'), status=status, city=params.get('city'),
+        product=lookup(Product, 'slug', 'product'), category=lookup(Category, 'slug', 'category'),
+        affiliate=lookup(Affiliate, 'affiliate_code', 'affiliate'),
+    )
+    return queryset, parse_group_by(params.get('group_by')) or ['day'], limit
@@ -0,0 +1,71 @@
+"""
+Model signal handlers.
+
+Saves and deletes of catalog models bump the catalog version so public pages
+stop answering 304 (see conditional.py). Bulk writes do not send signals;
+code using bulk_create, bulk_update or update() on these models calls
+conditional.bump_catalog_version() itself and stamps updated_at so the
+facet index picks the change up.
+
+Saves and deletes of users and their seller or affiliate profiles drop the
+user's cached identity (see identity.py).
+
+Orders are kept in the sales cube (see sales_cube.py): saving an existing order
+in a way that changes what it is counted as queues a sync, and a delete
+retracts it. New orders are counted by the order_placed job.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import identity, sales_cube, tasks
+from .conditional import bump_catalog_version
+from .models import (Affiliate, Banner, Category, ClickBankProduct, Merchant, Order, Product, ProductMerchant, Review,
+                     Seller)
+
+CATALOG_MODELS = (Banner, Category, ClickBankProduct, Merchant, Product, ProductMerchant, Review)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, **kwargs):
+    if sender in CATALOG_MODELS and not kwargs.get('raw'):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=ProductMerchant)
+def offer_deleted(sender, instance, **kwargs):
+    """Touch the product so the facet index re-reads its offers (see facets.py)"""
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    identity.forget(instance.pk)
+
+
+@receiver(post_save, sender=Seller)
+@receiver(post_delete, sender=Seller)
+@receiver(post_save, sender=Affiliate)
+@receiver(post_delete, sender=Affiliate)
+def profile_changed(sender, instance, **kwargs):
+    identity.forget(instance.user_id)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    # The instance's own reported_as may be stale; save() never writes it
+    counted_as = Order.objects.filter(pk=instance.pk).values_list('reported_as', flat=True).first()
+    if counted_as != sales_cube.reported_as(instance.status, instance.affiliate_id, instance.city):
+        tasks.enqueue('sync_sales_cube', {'order_id': instance.pk})
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    """Runs while the order's items still exist"""
+    sales_cube.retract_order(instance)
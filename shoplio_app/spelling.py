@@ -0,0 +1,251 @@
+"""
+Spelling correction for search and the chatbot (symmetric delete).
+
+The vocabulary is every word of an approved active product's name, brand and
+category, counted once per product, plus the words the chatbot answers to
+(CHATBOT_WORDS) and COMMON_WORDS, so ordinary query words are never
+"corrected" into product names. Each word is stored under every string made
+by deleting up to MAX_EDITS characters from its first PREFIX_LENGTH
+characters. A misspelling generates its own deletes, and any word sharing one
+is a candidate; candidates are checked with the optimal string alignment
+distance and the closest, then most common, wins. No dictionary scan is ever
+needed, so a lookup takes microseconds.
+
+Like the facet and suggestion indexes, the corrector is per process and is
+refreshed when the catalog version moves: only changed products' words are
+recounted.
+"""
+
+import datetime
+import itertools
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .conditional import catalog_version
+from .models import Category, Product
+
+MAX_EDITS = 2
+PREFIX_LENGTH = 7
+# Words shorter than this are never corrected
+MIN_LENGTH = 4
+# Words shorter than this are corrected by one edit at most
+TWO_EDIT_LENGTH = 8
+INCREMENTAL_LIMIT = 2000
+REFRESH_OVERLAP = datetime.timedelta(seconds=60)
+CHUNK_SIZE = 500
+
+_WORD = re.compile(r'[^\W_]+')
+
+# Words the chatbot recognises (see views.chatbot_api)
+CHATBOT_WORDS = (
+    'electronics gadget tech device fashion clothes clothing apparel wear home furniture house sports '
+    'fitness gym exercise outdoor book books education learn study read toy toys game games play kid child '
+    'laptop laptops phone phones smartphone iphone samsung dell apple headphone headphones airpods sony '
+    'wireless bluetooth television shoe shoes sneaker sneakers nike running watch bag messenger sofa lamp '
+    'bike bicycle yoga python programming novel gatsby lego chess puzzle recommend suggest best good cheap '
+    'budget affordable expensive premium luxury popular trending price prices cost compare difference versus '
+    'help pants jeans shirt jacket dress'
+).split()
+
+COMMON_WORDS = (
+    'about after all also and any are ask available back because been before best better between both '
+    'but buy can cheaper cheapest could deal deals delivery did does doing don each even every find for '
+    'from get give going good great have hello here how just know last less like little long look looking '
+    'lowest make many me more most much need new next not now off offer offers one only order other our '
+    'out over please quality really same see sell seller sellers send should show some something still '
+    'store such than thank thanks that the their them then there these they thing think this those through '
+    'today top under until very want was way well were what when where which while who why will with '
+    'without would year you your'
+).split()
+
+
+_FIXED_WORDS = frozenset(CHATBOT_WORDS + COMMON_WORDS)
+
+
+def words(text):
+    return _WORD.findall((text or '').lower())
+
+
+def distance(first, second, limit):
+    """Optimal string alignment distance, or limit + 1 once it is certainly larger"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row] + [0] * len(second)
+        best = row
+        for column, other in enumerate(second, 1):
+            cost = char != other
+            value = min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + cost)
+            if (previous2 is not None and row > 1 and column > 1
+                    and char == second[column - 2] and first[row - 2] == other):
+                value = min(value, previous2[column - 2] + 1)
+            current[column] = value
+            best = min(best, value)
+        if best > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def deletes(word, edits):
+    """Strings made by deleting up to `edits` characters from the start of `word`"""
+    word = word[:PREFIX_LENGTH]
+    found = {word}
+    level = {word}
+    for _ in range(edits):
+        level = {candidate[:position] + candidate[position + 1:]
+                 for candidate in level if len(candidate) > 1 for position in range(len(candidate))}
+        found |= level
+    return found
+
+
+def allowed_edits(word):
+    if len(word) < MIN_LENGTH:
+        return 0
+    return 1 if len(word) < TWO_EDIT_LENGTH else MAX_EDITS
+
+
+class Corrector:
+    def __init__(self):
+        self.version = None
+        self.built_at = None
+        self.refreshed_at = None
+        # word -> number of products using it (0 for CHATBOT_WORDS and COMMON_WORDS)
+        self.counts = Counter()
+        # delete string -> words; tuples are replaced, never changed
+        self.deletes = {}
+        # product pk -> its words
+        self.products = {}
+
+    # ---- Building ------------------------------------------------------
+
+    @classmethod
+    def build(cls, version):
+        corrector = cls()
+        corrector.version = version
+        corrector.built_at = corrector.refreshed_at = timezone.now()
+        for word in _FIXED_WORDS:
+            corrector._add_word(word, 0)
+        categories = dict(Category.objects.values_list('pk', 'name').order_by())
+        for pk, product_words in _product_words(None, categories):
+            corrector._add_product(pk, product_words)
+        return corrector
+
+    def refreshed(self, version):
+        """The corrector with changed products' words recounted, or a full rebuild"""
+        now = timezone.now()
+        if now - self.built_at > datetime.timedelta(seconds=settings.SPELLING_INDEX_MAX_AGE):
+            return Corrector.build(version)
+        since = self.refreshed_at - REFRESH_OVERLAP
+        changed = list(Product.objects.filter(updated_at__gte=since).values_list('pk', flat=True).order_by())
+        if len(changed) > INCREMENTAL_LIMIT or Category.objects.filter(updated_at__gte=since).exists():
+            return Corrector.build(version)
+
+        # Updated in place: lookups running meanwhile see each word either
+        # before or after its change
+        for pk in changed:
+            for word in self.products.pop(pk, ()):
+                self._remove_word(word)
+        categories = dict(Category.objects.values_list('pk', 'name').order_by())
+        for pk, product_words in _product_words(changed, categories):
+            self._add_product(pk, product_words)
+        self.refreshed_at = now
+        self.version = version
+
+        # Deleted products leave nothing to find by timestamp
+        if len(self.products) != Product.objects.filter(is_active=True, is_approved=True).count():
+            return Corrector.build(version)
+        return self
+
+    def _add_product(self, pk, product_words):
+        self.products[pk] = product_words
+        for word in product_words:
+            self._add_word(word, 1)
+
+    def _add_word(self, word, count):
+        if word not in self.counts:
+            for key in deletes(word, MAX_EDITS):
+                self.deletes[key] = self.deletes.get(key, ()) + (word,)
+        self.counts[word] += count
+
+    def _remove_word(self, word):
+        self.counts[word] -= 1
+        if self.counts[word] <= 0 and word not in _FIXED_WORDS:
+            del self.counts[word]
+            for key in deletes(word, MAX_EDITS):
+                remaining = tuple(other for other in self.deletes.get(key, ()) if other != word)
+                if remaining:
+                    self.deletes[key] = remaining
+                else:
+                    self.deletes.pop(key, None)
+
+    # ---- Querying ------------------------------------------------------
+
+    def correct_word(self, word):
+        """The closest, most common known word to `word` (itself if known or nothing is close)"""
+        word = word.lower()
+        edits = allowed_edits(word)
+        if word in self.counts or not edits or word.isdigit():
+            return word
+        best = None
+        for key in deletes(word, edits):
+            for candidate in self.deletes.get(key, ()):
+                if best is not None and abs(len(candidate) - len(word)) > best[0]:
+                    continue
+                found = distance(word, candidate, edits)
+                if found > edits:
+                    continue
+                rank = (found, -self.counts[candidate], candidate)
+                if best is None or rank < best:
+                    best = rank
+        return best[2] if best else word
+
+    def correct(self, text):
+        """`text` lowercased with each misspelled word replaced"""
+        return _WORD.sub(lambda match: self.correct_word(match.group()), (text or '').lower())
+
+
+def _product_words(pks, categories):
+    """(pk, words) of visible products, optionally among `pks`"""
+    products = Product.objects.filter(is_active=True, is_approved=True).order_by()
+    fields = ('pk', 'name', 'brand', 'category_id')
+    if pks is None:
+        rows = products.values_list(*fields).iterator(chunk_size=5000)
+    else:
+        pks = sorted(pks)
+        rows = itertools.chain.from_iterable(
+            products.filter(pk__in=pks[start:start + CHUNK_SIZE]).values_list(*fields)
+            for start in range(0, len(pks), CHUNK_SIZE)
+        )
+    for pk, name, brand, category_id in rows:
+        text = f"{name} {brand} {categories.get(category_id, '')}"
+        yield pk, tuple({word for word in words(text) if not word.isdigit()})
+
+
+_corrector = None
+_lock = threading.Lock()
+
+
+def get_corrector():
+    """This process's corrector, refreshed if the catalog changed"""
+    global _corrector
+    version = catalog_version()[0]
+    if _corrector is not None and _corrector.version == version:
+        return _corrector
+    # While another thread refreshes, serve the previous corrector
+    if not _lock.acquire(blocking=_corrector is None):
+        return _corrector
+    try:
+        if _corrector is None:
+            _corrector = Corrector.build(version)
+        elif _corrector.version != version:
+            _corrector = _corrector.refreshed(version)
+        return _corrector
+    finally:
+        _lock.release()
@@ -0,0 +1,33 @@
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .assets import minify_css
+
+
+# Only the project's own stylesheets; third-party ones (admin) are left as shipped
+MINIFY_PREFIXES = ('css/',)
+
+
+class MinifiedManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """WhiteNoise's hashed, pre-compressed (gzip and Brotli) storage that also minifies stylesheets"""
+
+    def post_process_with_compression(self, files):
+        # Runs after hashing, which reads the unminified source files, and
+        # before compression, so the .gz and .br copies are of minified CSS
+        return super().post_process_with_compression(self._minify(files))
+
+    def _minify(self, files):
+        for name, hashed_name, processed in files:
+            if (hashed_name and name.startswith(MINIFY_PREFIXES) and name.endswith('.css')
+                    and not isinstance(processed, Exception)):
+                for path in {name, hashed_name}:
+                    self._minify_file(path)
+            yield name, hashed_name, processed
+
+    def _minify_file(self, path):
+        with self.open(path) as fileobj:
+            css = fileobj.read().decode('utf-8')
+        minified = minify_css(css)
+        if minified != css:
+            self.delete(path)
+            self.save(path, ContentFile(minified.encode('utf-8')))
@@ -0,0 +1,299 @@
+"""
+Search box suggestions.
+
+SuggestIndex is a sorted array of normalized keys (product names, brands and
+category names, plus every later word of a product name, so "galaxy" finds
+"Samsung Galaxy S23") with a parallel array of entry ids. A prefix is two
+binary searches; the best entries in that range are picked by weight, which
+is the product's offer clicks plus REVIEW_WEIGHT per review (summed over a
+brand's or category's products). The best entries of every prefix up to
+CACHED_PREFIX_LENGTH characters and of every prefix matching more than
+LARGE_RANGE keys are precomputed bottom-up, so no query scans more than
+LARGE_RANGE keys.
+
+Like the facet index, the index is per process and is refreshed when the
+catalog version moves: changed products are removed and re-inserted in place
+(a refresh that finds deleted products rebuilds instead).
+Weights (click counts) only change on a full rebuild, at most
+SUGGEST_INDEX_MAX_AGE seconds apart.
+"""
+
+import bisect
+import datetime
+import heapq
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from .conditional import catalog_version
+from .models import Category, Product, ProductMerchant
+
+TOP_K = 10
+REVIEW_WEIGHT = 5
+CACHED_PREFIX_LENGTH = 2
+LARGE_RANGE = 2000
+# Later words of a product name that are indexed as keys of their own
+MAX_WORDS = 4
+# Above this many changed products a refresh rebuilds the index instead
+INCREMENTAL_LIMIT = 100
+REFRESH_OVERLAP = datetime.timedelta(seconds=60)
+CHUNK_SIZE = 500
+
+_SEPARATORS = re.compile(r'[^\w]+')
+_END = '\U0010ffff'
+
+
+def normalize(text):
+    """Lowercase, accents and punctuation dropped, single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_SEPARATORS.sub(' ', text.lower()).split())
+
+
+def index_keys(label, words=True):
+    """Keys an entry is found under: its normalized label and, if `words`, each later word onwards"""
+    key = normalize(label)
+    if not key:
+        return ()
+    keys = [key]
+    if words:
+        parts = key.split(' ')
+        keys.extend(' '.join(parts[position:]) for position in range(1, min(len(parts), MAX_WORDS)))
+    return tuple(dict.fromkeys(keys))
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.version = None
+        self.built_at = None
+        self.refreshed_at = None
+        self.keys = []
+        self.refs = []
+        # id -> (label, kind, target, weight, keys); target is a slug or brand name
+        self.entries = {}
+        # (kind, identity) -> id
+        self.ids = {}
+        self.next_id = 0
+        self.product_count = 0
+        # prefix -> best ids, for short and for heavily shared prefixes
+        self.top = {}
+
+    # ---- Building ------------------------------------------------------
+
+    @classmethod
+    def from_entries(cls, items):
+        """Index (identity, label, kind, target, weight) tuples"""
+        index = cls()
+        pairs = []
+        for identity, label, kind, target, weight in items:
+            entry_id = index._register(identity, label, kind, target, weight)
+            pairs.extend((key, entry_id) for key in index.entries[entry_id][4])
+        pairs.sort()
+        index.keys = [key for key, _ in pairs]
+        index.refs = [entry_id for _, entry_id in pairs]
+        index._cache_prefixes()
+        return index
+
+    @classmethod
+    def build(cls, version):
+        clicks = defaultdict(int)
+        for product_id, total in (ProductMerchant.objects.filter(is_active=True).values('product_id')
+                                  .annotate(total=Sum('click_count')).values_list('product_id', 'total')
+                                  .order_by()):
+            clicks[product_id] = total or 0
+
+        brands = {}
+        category_weights = defaultdict(int)
+        items = []
+        for pk, name, slug, brand, category_id, reviews in _products(None):
+            weight = clicks[pk] + REVIEW_WEIGHT * reviews
+            items.append((('product', pk), name, 'product', slug, weight))
+            category_weights[category_id] += weight + 1
+            brand = brand.strip()
+            if brand:
+                label, total = brands.get(brand.lower(), (brand, 0))
+                brands[brand.lower()] = (label, total + weight + 1)
+        items.extend((('brand', key), label, 'brand', label, weight) for key, (label, weight) in brands.items())
+        for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug').order_by():
+            items.append((('category', pk), name, 'category', slug, category_weights[pk]))
+
+        index = cls.from_entries(items)
+        index.version = version
+        index.built_at = index.refreshed_at = timezone.now()
+        return index
+
+    def refreshed(self, version):
+        """A copy of the index with changed products and categories re-read, or a full rebuild"""
+        now = timezone.now()
+        if now - self.built_at > datetime.timedelta(seconds=settings.SUGGEST_INDEX_MAX_AGE):
+            return SuggestIndex.build(version)
+        since = self.refreshed_at - REFRESH_OVERLAP
+        changed = list(Product.objects.filter(updated_at__gte=since).values_list('pk', flat=True).order_by())
+        if len(changed) > INCREMENTAL_LIMIT:
+            return SuggestIndex.build(version)
+
+        index = SuggestIndex()
+        index.__dict__.update(self.__dict__)
+        index.keys = list(self.keys)
+        index.refs = list(self.refs)
+        index.entries = dict(self.entries)
+        index.ids = dict(self.ids)
+        index.top = dict(self.top)
+        index.version = version
+        index.refreshed_at = now
+
+        weights = {pk: self.entries[self.ids[('product', pk)]][3] for pk in changed if ('product', pk) in self.ids}
+        for pk in changed:
+            index.remove(('product', pk))
+        for pk, name, slug, brand, _, reviews in _products(changed):
+            # Clicks are only recounted by a rebuild
+            index.add(('product', pk), name, 'product', slug, max(weights.get(pk, 0), REVIEW_WEIGHT * reviews))
+            brand = brand.strip()
+            if brand and ('brand', brand.lower()) not in index.ids:
+                index.add(('brand', brand.lower()), brand, 'brand', brand, 1)
+        for pk, name, slug in Category.objects.filter(updated_at__gte=since).values_list('pk', 'name', 'slug'):
+            weight = index.remove(('category', pk))
+            index.add(('category', pk), name, 'category', slug, weight or 0)
+
+        # Deleted products leave nothing to find by timestamp
+        if index.product_count != Product.objects.filter(is_active=True, is_approved=True).count():
+            return SuggestIndex.build(version)
+        return index
+
+    def _register(self, identity, label, kind, target, weight):
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = (label, kind, target, weight, index_keys(label, words=kind == 'product'))
+        self.ids[identity] = entry_id
+        if kind == 'product':
+            self.product_count += 1
+        return entry_id
+
+    def add(self, identity, label, kind, target, weight):
+        entry_id = self._register(identity, label, kind, target, weight)
+        for key in self.entries[entry_id][4]:
+            position = bisect.bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.refs.insert(position, entry_id)
+            self._forget(key)
+
+    def remove(self, identity):
+        """Drop an entry; returns its weight, or None if it was not indexed"""
+        entry_id = self.ids.pop(identity, None)
+        if entry_id is None:
+            return None
+        entry = self.entries.pop(entry_id)
+        if entry[1] == 'product':
+            self.product_count -= 1
+        for key in entry[4]:
+            position = bisect.bisect_left(self.keys, key)
+            while self.refs[position] != entry_id:
+                position += 1
+            del self.keys[position]
+            del self.refs[position]
+            self._forget(key)
+        return entry[3]
+
+    def _forget(self, key):
+        for length in range(len(key) + 1):
+            self.top.pop(key[:length], None)
+
+    # ---- Querying ------------------------------------------------------
+
+    def _top(self, prefix, start, end):
+        """
+        Best ids among keys[start:end], which all start with `prefix`.
+
+        Large ranges are not scanned: their best ids are picked from the best
+        ids of each one-character-longer prefix, computed the same way, and
+        are kept in self.top along with those of every short prefix.
+        """
+        best = self.top.get(prefix)
+        if best is not None:
+            return best
+        if end - start <= LARGE_RANGE:
+            candidates = self.refs[start:end]
+        else:
+            candidates = []
+            position = start
+            while position < end and len(self.keys[position]) == len(prefix):
+                candidates.append(self.refs[position])
+                position += 1
+            while position < end:
+                child = prefix + self.keys[position][len(prefix)]
+                child_end = bisect.bisect_left(self.keys, child + _END, position, end)
+                candidates.extend(self._top(child, position, child_end))
+                position = child_end
+        entries = self.entries
+        best = heapq.nlargest(TOP_K, set(candidates), key=lambda entry_id: (entries[entry_id][3], -entry_id))
+        if end - start > LARGE_RANGE or len(prefix) <= CACHED_PREFIX_LENGTH:
+            self.top[prefix] = best
+        return best
+
+    def _cache_prefixes(self):
+        self._top('', 0, len(self.keys))
+        position = 0
+        while position < len(self.keys):
+            prefix = self.keys[position][:CACHED_PREFIX_LENGTH]
+            end = bisect.bisect_left(self.keys, prefix + _END, position)
+            self._top(prefix, position, end)
+            position = end
+
+    def suggest(self, text, limit=TOP_K):
+        """The best `limit` entries, as (label, kind, target), whose keys start with `text`"""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + _END, start)
+        return [self.entries[entry_id][:3] for entry_id in self._top(prefix, start, end)[:limit]]
+
+
+def _products(pks):
+    """(pk, name, slug, brand, category_id, review_count) of visible products, optionally among `pks`"""
+    products = Product.objects.filter(is_active=True, is_approved=True).order_by()
+    fields = ('pk', 'name', 'slug', 'brand', 'category_id', 'review_count')
+    if pks is None:
+        yield from products.values_list(*fields).iterator(chunk_size=5000)
+        return
+    pks = sorted(pks)
+    for start in range(0, len(pks), CHUNK_SIZE):
+        yield from products.filter(pk__in=pks[start:start + CHUNK_SIZE]).values_list(*fields)
+
+
+def url_for(kind, target):
+    if kind == 'product':
+        return reverse('shoplio_app:product_detail', kwargs={'slug': target})
+    if kind == 'category':
+        return reverse('shoplio_app:category_detail', kwargs={'slug': target})
+    return f"{reverse('shoplio_app:product_list')}?{urlencode({'brand': target})}"
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process's index, refreshed if the catalog changed"""
+    global _index
+    version = catalog_version()[0]
+    if _index is not None and _index.version == version:
+        return _index
+    # While another thread refreshes, serve the previous index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if _index is None:
+            _index = SuggestIndex.build(version)
+        elif _index.version != version:
+            _index = _index.refreshed(version)
+        return _index
+    finally:
+        _lock.release()
@@ -0,0 +1,150 @@
+"""
+Database-backed background task queue.
+
+Request handlers call `enqueue()` to store a Task row (inside their own
+transaction, so the job is committed together with the data it refers to)
+and return immediately. `run_worker` processes claim queued tasks and run the
+handler registered under the task's name.
+
+Claiming is a single conditional UPDATE, so any number of worker processes
+can share the queue. A claimed task holds a lease for TASK_VISIBILITY_TIMEOUT
+seconds; if its worker dies the lease expires and another worker picks it up.
+Failed tasks are retried with exponential backoff until max_attempts, so
+handlers must be safe to run more than once.
+"""
+
+import datetime
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def task(name):
+    """Register the decorated function as the handler for tasks called `name`"""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Queue a task and return it.
+
+    `payload` must be JSON serializable and is passed to the handler as keyword
+    arguments. If `key` is given and a task with that idempotency key already
+    exists, that task is returned instead of queueing a duplicate.
+    """
+    if name not in _handlers:
+        raise ValueError(f'Unknown task: {name}')
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'run_after': timezone.now() + datetime.timedelta(seconds=delay),
+        'max_attempts': max_attempts or settings.TASK_MAX_ATTEMPTS,
+    }
+    if key is None:
+        return Task.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(idempotency_key=key, **fields)
+    except IntegrityError:
+        return Task.objects.get(idempotency_key=key)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def _claimable(now):
+    """Queued tasks that are due, plus running tasks whose lease has expired"""
+    return (
+        Q(status='queued', run_after__lte=now) |
+        Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+
+def claim(worker, batch=10):
+    """Lease the next due task to `worker`, or return None if nothing is due"""
+    now = timezone.now()
+    candidates = Task.objects.filter(_claimable(now)).order_by('run_after').values_list('pk', flat=True)[:batch]
+    for pk in candidates:
+        claimed = Task.objects.filter(_claimable(now), pk=pk).update(
+            status='running',
+            claimed_by=worker,
+            locked_until=now + datetime.timedelta(seconds=settings.TASK_VISIBILITY_TIMEOUT),
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def fail_expired():
+    """Fail running tasks whose lease expired on their final attempt"""
+    return Task.objects.filter(
+        status='running',
+        locked_until__lt=timezone.now(),
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status='failed',
+        locked_until=None,
+        last_error='Lease expired on the final attempt; the worker probably died',
+        finished_at=timezone.now(),
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds"""
+    delay = min(settings.TASK_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.TASK_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_task(task_obj):
+    """Run one claimed task and record its outcome"""
+    # Only touch the row while we still hold the lease for this attempt
+    lease = Task.objects.filter(pk=task_obj.pk, claimed_by=task_obj.claimed_by, attempts=task_obj.attempts)
+    handler = _handlers.get(task_obj.name)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for {task_obj.name}')
+        handler(**task_obj.payload)
+    except Exception:
+        logger.exception('Task %s failed (attempt %s/%s)', task_obj, task_obj.attempts, task_obj.max_attempts)
+        now = timezone.now()
+        if task_obj.attempts < task_obj.max_attempts:
+            lease.update(
+                status='queued',
+                run_after=now + datetime.timedelta(seconds=retry_delay(task_obj.attempts)),
+                locked_until=None,
+                last_error=traceback.format_exc(),
+            )
+        else:
+            lease.update(status='failed', locked_until=None, last_error=traceback.format_exc(), finished_at=now)
+        return False
+    lease.update(status='done', locked_until=None, finished_at=timezone.now())
+    return True
+
+
+def run_next(worker=None):
+    """Claim and run one due task; returns False when nothing is due"""
+    task_obj = claim(worker or worker_id())
+    if task_obj is None:
+        return False
+    run_task(task_obj)
+    return True
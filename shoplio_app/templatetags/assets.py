@@ -0,0 +1,21 @@
+from django import template
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+
+from shoplio_app import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def critical_css():
+    """Preload links for the self-hosted fonts and the critical CSS in a <style> element"""
+    css = assets.inline_stylesheet(assets.CRITICAL_PATH)
+    if not css:
+        return ''
+    preloads = format_html_join(
+        '\n    ', '<link rel="preload" href="{}" as="font" type="font/woff2" crossorigin>',
+        ((url,) for url in assets.font_urls(css)),
+    )
+    # The stylesheet is our own static file, and escaping would break selectors such as a > b
+    return mark_safe(f'{preloads}\n    <style>{css}</style>')
@@ -0,0 +1,41 @@
+import datetime
+from decimal import Decimal
+
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def price_sparkline(series, width=320, height=64):
+    """Inline SVG of a PriceSeries: a low-high band with the low price as a line"""
+    points = series.points if series else []
+    if len(points) < 2:
+        return ''
+
+    days = [datetime.date.fromisoformat(day) for day, _, _ in points]
+    lows = [Decimal(low) for _, low, _ in points]
+    highs = [Decimal(high) for _, _, high in points]
+    first_day, span = days[0], max((days[-1] - days[0]).days, 1)
+    floor, ceiling = min(lows), max(highs)
+    price_span = (ceiling - floor) or 1
+    pad = 2
+
+    def x(day):
+        return pad + (width - 2 * pad) * (day - first_day).days / span
+
+    def y(price):
+        return pad + (height - 2 * pad) * float((ceiling - price) / price_span)
+
+    low_line = ' '.join(f'{x(day):.1f},{y(low):.1f}' for day, low in zip(days, lows))
+    band = low_line + ' ' + ' '.join(
+        f'{x(day):.1f},{y(high):.1f}' for day, high in reversed(list(zip(days, highs)))
+    )
+    return format_html(
+        '<svg class="price-sparkline" width="{}" height="{}" viewBox="0 0 {} {}" role="img" '
+        'aria-label="Price from {} to {}">'
+        '<polygon points="{}" fill="#FFEDD5"/>'
+        '<polyline points="{}" fill="none" stroke="#FF6B00" stroke-width="2"/></svg>',
+        width, height, width, height, floor, ceiling, band, low_line,
+    )
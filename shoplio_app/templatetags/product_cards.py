@@ -0,0 +1,48 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from shoplio_app import fragments
+
+register = template.Library()
+
+PRODUCT_CARD_TEMPLATE = 'shoplio_app/includes/product_card.html'
+OFFER_CARD_TEMPLATE = 'shoplio_app/includes/offer_card.html'
+CLICKBANK_CARD_TEMPLATE = 'shoplio_app/includes/clickbank_card.html'
+
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, meta='rating'):
+    """Cards for a list of products; `meta` is 'rating' or 'new'"""
+    return mark_safe(fragments.render_many(
+        PRODUCT_CARD_TEMPLATE,
+        list(products),
+        key_for=lambda product: f'product:{product.pk}:{product.updated_at.timestamp()}:{meta}',
+        context_for=lambda product: {'product': product, 'meta': meta},
+        request=context.get('request'),
+    ))
+
+
+@register.simple_tag(takes_context=True)
+def offer_cards(context, product_merchants):
+    """Cards for a merchant's offers (ProductMerchant rows with product and merchant loaded)"""
+    return mark_safe(fragments.render_many(
+        OFFER_CARD_TEMPLATE,
+        list(product_merchants),
+        key_for=lambda pm: (
+            f'offer:{pm.pk}:{pm.price}:{pm.product.updated_at.timestamp()}:{pm.merchant.updated_at.timestamp()}'
+        ),
+        context_for=lambda pm: {'pm': pm},
+        request=context.get('request'),
+    ))
+
+
+@register.simple_tag(takes_context=True)
+def clickbank_cards(context, offers):
+    """Cards for ClickBank offers (ClickBankProduct rows)"""
+    return mark_safe(fragments.render_many(
+        CLICKBANK_CARD_TEMPLATE,
+        list(offers),
+        key_for=lambda offer: f'clickbank:{offer.pk}:{offer.updated_at.timestamp()}',
+        context_for=lambda offer: {'offer': offer},
+        request=context.get('request'),
+    ))
@@ -0,0 +1,1406 @@
+import csv
+import datetime
+import io
+import json
+import math
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (analytics, attribution, clickbank_feed, clickbank_ranking, exports, facets, ids, jobs, price_feeds, price_history,
+               product_import, product_matching, retention, sales_cube, spelling, suggest, tasks, tracking, trending)
+from .models import (Affiliate, AffiliateClick, Category, ClickBankClickTracking, ClickBankProduct, ClickBankRanking,
+                     ClickTracking, Commission, IdBlock, Merchant, Order, OrderItem, PriceSeries, Product, ProductMatch,
+                     ProductMerchant, ProductStats, Referrer, SalesCell, Seller, Task, TrendingScore, UserAgent)
+
+ROWS = 150  # more than one admin page (list_per_page is 100)
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """Large-table changelists run the same number of queries on every page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        category = Category.objects.create(name='Phones', slug='phones')
+
+        users = User.objects.bulk_create([User(username=f'user{n}') for n in range(ROWS)])
+        sellers = Seller.objects.bulk_create([
+            Seller(user=user, company_name=f'Company {n}') for n, user in enumerate(users[:10])
+        ])
+        Product.objects.bulk_create([
+            Product(name=f'Product {n}', slug=f'product-{n}', description='Description',
+                    category=category, seller=sellers[n % len(sellers)], base_price=Decimal('100'))
+            for n in range(ROWS)
+        ])
+        affiliates = Affiliate.objects.bulk_create([
+            Affiliate(user=user, affiliate_code=f'AFF{n:05d}', full_name=f'Affiliate {n}', payment_details='-')
+            for n, user in enumerate(users)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(order_id=f'ORDER{n:05d}', full_name='Customer', email='customer@example.com', phone='1',
+                  address='Street', city='City', total_amount=Decimal('100'), affiliate=affiliates[n % 10])
+            for n in range(ROWS)
+        ])
+        Commission.objects.bulk_create([
+            Commission(affiliate=order.affiliate, order=order, product_name='Product', product_price=Decimal('100'),
+                       commission_rate=Decimal('10'), commission_amount=Decimal('10'))
+            for order in orders
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertConstantQueries(self, model_name, num_queries):
+        """Page 1 and the keyset page after it both take `num_queries` queries"""
+        url = reverse(f'admin:shoplio_app_{model_name}_changelist')
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(url)
+        changelist = response.context['cl']
+        self.assertTrue(changelist.keyset)
+        self.assertEqual(len(changelist.result_list), 100)
+        first_page = {obj.pk for obj in changelist.result_list}
+
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(url + changelist.next_page_url())
+        changelist = response.context['cl']
+        second_page = {obj.pk for obj in changelist.result_list}
+        self.assertEqual(len(second_page), ROWS - 100)
+        self.assertFalse(first_page & second_page)
+
+    def test_product_changelist(self):
+        self.assertConstantQueries('product', 6)
+
+    def test_order_changelist(self):
+        self.assertConstantQueries('order', 5)
+
+    def test_affiliate_changelist(self):
+        self.assertConstantQueries('affiliate', 5)
+
+    def test_commission_changelist(self):
+        self.assertConstantQueries('commission', 5)
+
+
+class PriceFeedTests(TestCase):
+    """Feed rows update only the offers whose price or stock changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://example.com')
+        cls.offers = [
+            ProductMerchant.objects.create(
+                product=Product.objects.create(name=f'Phone {n}', slug=f'phone-{n}', description='-', category=category,
+                                               sku=f'SKU{n}', base_price=Decimal('100')),
+                merchant=cls.merchant, price=Decimal('100'), affiliate_link='https://example.com/a',
+                product_url=f'https://example.com/p/{n}',
+            )
+            for n in range(3)
+        ]
+
+    def apply(self, content, fmt):
+        return price_feeds.apply_price_feed(io.BytesIO(content.encode()), self.merchant, fmt)
+
+    def test_csv_updates_changed_rows_only(self):
+        before = ProductMerchant.objects.get(pk=self.offers[1].pk).last_price_update
+        with self.assertNumQueries(11):  # the index, then offers, history and series in one transaction
+            result = self.apply(
+                'sku,price,availability\n'
+                'sku0,"1,250.00 PKR",in stock\n'
+                'SKU1,100,out_of_stock\n'
+                'SKU2,100,in stock\n'
+                'missing,5,in stock\n',
+                'csv',
+            )
+        self.assertEqual((result.rows, result.matched, result.unmatched), (4, 3, 1))
+        self.assertEqual((result.price_changes, result.stock_changes), (1, 1))
+
+        offers = ProductMerchant.objects.in_bulk([offer.pk for offer in self.offers])
+        self.assertEqual(offers[self.offers[0].pk].price, Decimal('1250.00'))
+        self.assertGreater(offers[self.offers[0].pk].last_price_update, before)
+        self.assertFalse(offers[self.offers[1].pk].in_stock)
+        self.assertEqual(offers[self.offers[1].pk].availability_text, 'Out of stock')
+        self.assertEqual(offers[self.offers[1].pk].last_price_update, before)
+
+    def test_xml_matches_by_url(self):
+        result = self.apply(
+            '<?xml version="1.0"?>'
+            '<rss xmlns:g="http://base.google.com/ns/1.0"><channel>'
+            '<item><g:link>https://example.com/p/2/</g:link><g:price>90.00 PKR</g:price></item>'
+            '<item><g:link>https://example.com/p/9</g:link><g:price>90.00 PKR</g:price></item>'
+            '</channel></rss>',
+            'xml',
+        )
+        self.assertEqual((result.rows, result.matched, result.price_changes), (2, 1, 1))
+        self.assertEqual(ProductMerchant.objects.get(pk=self.offers[2].pk).price, Decimal('90.00'))
+
+
+class PriceHistoryTests(TestCase):
+    """Price changes land in the raw history and in the product's chart series"""
+
+    def test_feed_changes_are_recorded(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://example.com')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         sku='SKU1', base_price=Decimal('100'))
+        offer = ProductMerchant.objects.create(product=product, merchant=merchant, price=Decimal('100'),
+                                               affiliate_link='https://example.com/a', product_url='https://example.com/p')
+        for price in ('90', '120'):
+            price_feeds.apply_price_feed(io.BytesIO(f'sku,price\nSKU1,{price}\n'.encode()), merchant, 'csv')
+
+        self.assertEqual(list(offer.price_changes.order_by('pk').values_list('price', flat=True)),
+                         [Decimal('90'), Decimal('120')])
+        series = PriceSeries.objects.get(product=product)
+        self.assertEqual(series.points, [[timezone.localdate().isoformat(), '90.00', '120.00']])
+
+    def create_offer(self, price):
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://example.com')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         base_price=Decimal('100'), is_approved=True)
+        return ProductMerchant.objects.create(product=product, merchant=self.merchant, price=Decimal(price),
+                                              affiliate_link='https://example.com/a', product_url='https://example.com/p')
+
+    def lowest_badge(self, offer):
+        response = self.client.get(reverse('shoplio_app:product_detail', args=[offer.product.slug]))
+        return response.context['is_lowest_in_90_days']
+
+    def test_lowest_badge_needs_an_earlier_higher_price(self):
+        offer = self.create_offer('90')
+        today = timezone.localdate()
+        # What the 0014 migration seeds for a price that never changed
+        series = PriceSeries.objects.create(product=offer.product, points=[[today.isoformat(), '90.00', '90.00']])
+        self.assertFalse(self.lowest_badge(offer))
+
+        series.points = [[(today - datetime.timedelta(days=10)).isoformat(), '120.00', '120.00'],
+                         [today.isoformat(), '90.00', '90.00']]
+        series.save()
+        cache.clear()
+        self.assertTrue(self.lowest_badge(offer))
+
+    def test_inline_price_edits_are_recorded(self):
+        offer = self.create_offer('100')
+        stamped = offer.last_price_update
+        product_admin = admin.site._registry[Product]
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        inline = next(inline for inline in product_admin.get_inline_instances(request, offer.product)
+                      if inline.model is ProductMerchant)
+        FormSet = inline.get_formset(request, offer.product)
+        prefix = FormSet.get_default_prefix()
+        data = {f'{prefix}-TOTAL_FORMS': '1', f'{prefix}-INITIAL_FORMS': '1', f'{prefix}-0-id': str(offer.pk),
+                f'{prefix}-0-product': str(offer.product.pk), f'{prefix}-0-merchant': str(self.merchant.pk),
+                f'{prefix}-0-price': '80', f'{prefix}-0-affiliate_link': offer.affiliate_link,
+                f'{prefix}-0-product_url': offer.product_url, f'{prefix}-0-in_stock': 'on',
+                f'{prefix}-0-is_active': 'on'}
+        formset = FormSet(data, instance=offer.product, prefix=prefix)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        product_admin.save_formset(request, None, formset, True)
+
+        offer.refresh_from_db()
+        self.assertGreater(offer.last_price_update, stamped)
+        self.assertEqual(list(offer.price_changes.values_list('price', flat=True)), [Decimal('80')])
+        self.assertEqual(Decimal(PriceSeries.objects.get(product=offer.product).points[-1][1]), Decimal('80'))
+
+    def test_compact_merges_old_days_into_weeks(self):
+        today = datetime.date(2026, 6, 30)
+        points = []
+        for day, price in [('2024-01-01', '5'), ('2026-03-02', '10'), ('2026-03-04', '8'), ('2026-06-29', '9')]:
+            price_history.add_price(points, datetime.date.fromisoformat(day), price)
+        self.assertEqual(price_history.compact(points, today), [
+            ['2026-03-02', '8', '10'],
+            ['2026-06-29', '9', '9'],
+        ])
+
+
+class ProductCardCacheTests(TestCase):
+    """Listing pages reuse cached product cards until the product changes"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Phones', slug='phones')
+        self.products = [
+            Product.objects.create(name=f'Phone {n}', slug=f'phone-{n}', description='-', category=category,
+                                   base_price=Decimal('100'), is_approved=True)
+            for n in range(3)
+        ]
+
+    def test_cards_are_cached_and_follow_updates(self):
+        url = reverse('shoplio_app:product_list')
+        self.assertIn('0 hits, 3 misses', self.client.get(url)['Server-Timing'])
+        self.assertIn('3 hits, 0 misses', self.client.get(url)['Server-Timing'])
+
+        self.products[0].name = 'Renamed phone'
+        self.products[0].save()
+        response = self.client.get(url)
+        self.assertIn('2 hits, 1 misses', response['Server-Timing'])
+        self.assertContains(response, 'Renamed phone')
+
+
+class ConditionalGetTests(TestCase):
+    """Anonymous catalog pages answer 304 until the catalog changes"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones', slug='phones')
+        self.product = Product.objects.create(name='Phone', slug='phone', description='-', category=self.category,
+                                              base_price=Decimal('100'), is_approved=True)
+        self.url = self.product.get_absolute_url()
+
+    def test_not_modified_until_catalog_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('public', response['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.description = 'Smartphones'
+            self.category.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_pages_are_private(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        response = self.client.get(self.url)
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+
+
+class FacetIndexTests(TestCase):
+    """Facet counts come from the bitmap index and follow catalog changes"""
+
+    def setUp(self):
+        # The index is per process; catalog versions restart in every test
+        facets._index = None
+        phones = Category.objects.create(name='Phones', slug='phones')
+        laptops = Category.objects.create(name='Laptops', slug='laptops')
+        self.store = Merchant.objects.create(name='Store', slug='store', website_url='https://store.example.com')
+        self.products = [
+            Product.objects.create(name=f'Product {n}', slug=f'product-{n}', description='-',
+                                   category=phones if n < 3 else laptops, brand='Acme' if n % 2 else 'Zen',
+                                   base_price=Decimal(500 * (n + 1)), is_approved=True)
+            for n in range(5)
+        ]
+        ProductMerchant.objects.create(product=self.products[0], merchant=self.store, price=Decimal('500'),
+                                       affiliate_link='https://store.example.com/a', product_url='https://store.example.com/p')
+
+    def search(self, **selected):
+        index = facets.get_index()
+        return index.search({facet: [index.value(facet, raw) for raw in values] for facet, values in selected.items()})
+
+    def test_counts_ignore_own_facet(self):
+        result = self.search(category=['phones'], brand=['Acme'])
+        self.assertEqual(len(result), 1)
+        index = result.index
+        self.assertEqual(result.counts['brand'], {'Acme': 1, 'Zen': 2})
+        self.assertEqual(result.counts['category'][index.value('category', 'laptops')], 1)
+        self.assertEqual(result.counts['in_stock'], {'yes': 0})
+
+    def test_refresh_follows_changes(self):
+        self.assertEqual(len(self.search(merchant=['store'])), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].brand = 'Acme'
+            self.products[1].save()
+            ProductMerchant.objects.all().delete()
+            self.products[4].delete()
+        result = self.search(brand=['Acme'])
+        self.assertEqual(sorted(facets.members(result.bits)), [self.products[1].pk, self.products[3].pk])
+        self.assertEqual(len(self.search(merchant=['store'])), 0)
+
+    def test_product_list_filters(self):
+        response = self.client.get(reverse('shoplio_app:product_list'), {'brand': 'Zen', 'max_price': '1000'})
+        self.assertEqual(response.context['result_count'], 1)
+        self.assertContains(response, 'Product 0')
+        self.assertNotContains(response, 'Product 2')
+
+
+class SearchSuggestionTests(TestCase):
+    """Typeahead suggestions come from the prefix index, most popular first"""
+
+    def setUp(self):
+        suggest._index = None
+        self.category = Category.objects.create(name='Phones', slug='phones')
+        for n, reviews in enumerate([1, 9]):
+            Product.objects.create(name=f'Samsung Galaxy S{n}', slug=f'galaxy-s{n}', description='-', brand='Samsung',
+                                   category=self.category, base_price=Decimal('100'), review_count=reviews,
+                                   is_approved=True)
+
+    def labels(self, query):
+        response = self.client.get(reverse('shoplio_app:search_suggestions'), {'q': query})
+        return [suggestion['label'] for suggestion in response.json()['suggestions']]
+
+    def test_prefix_and_word_matches(self):
+        self.assertEqual(self.labels('sams'), ['Samsung', 'Samsung Galaxy S1', 'Samsung Galaxy S0'])
+        self.assertEqual(self.labels('GALAXY s0'), ['Samsung Galaxy S0'])
+        self.assertEqual(self.labels('pho'), ['Phones'])
+
+    def test_index_follows_product_changes(self):
+        self.labels('s')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Pixel 9', slug='pixel-9', description='-', category=self.category,
+                                   base_price=Decimal('100'), is_approved=True)
+            Product.objects.filter(slug='galaxy-s0').get().delete()
+        self.assertEqual(self.labels('pix'), ['Pixel 9'])
+        self.assertEqual(self.labels('galaxy'), ['Samsung Galaxy S1'])
+
+
+class SpellingTests(TestCase):
+    """Misspelled searches and chatbot messages are corrected from the catalog vocabulary"""
+
+    def setUp(self):
+        spelling._corrector = None
+        category = Category.objects.create(name='Phones', slug='phones')
+        Product.objects.create(name='Galaxy S24', slug='galaxy-s24', description='-', brand='Samsung',
+                               category=category, base_price=Decimal('100'), is_approved=True)
+
+    def test_did_you_mean_for_empty_search(self):
+        response = self.client.get(reverse('shoplio_app:product_list'), {'q': 'samsng galxy'})
+        self.assertEqual(response.context['did_you_mean'], 'samsung galaxy')
+        response = self.client.get(reverse('shoplio_app:product_list'), {'q': 'samsung'})
+        self.assertIsNone(response.context['did_you_mean'])
+
+    def test_corrections_follow_catalog_changes(self):
+        corrector = spelling.get_corrector()
+        self.assertEqual(corrector.correct('show me pents'), 'show me pants')
+        self.assertEqual(corrector.correct_word('pixl'), 'pixl')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Pixel 9', slug='pixel-9', description='-', category=Category.objects.get(),
+                                   base_price=Decimal('100'), is_approved=True)
+        self.assertEqual(spelling.get_corrector().correct_word('pixl'), 'pixel')
+
+    def test_chatbot_corrects_message(self):
+        response = self.client.post(reverse('shoplio_app:chatbot_api'), {'message': 'samsng please'})
+        self.assertIn('Galaxy S24', response.json()['response'])
+
+
+class ProductMatchingTests(TestCase):
+    """Listings of the same item from different sellers are flagged as likely duplicates"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones', slug='phones')
+
+    def create(self, name, sku='', description='Flagship phone with a 6.2 inch display and triple camera'):
+        return Product.objects.create(name=name, slug=f'product-{Product.objects.count()}', brand='Samsung', sku=sku,
+                                      description=description, category=self.category, base_price=Decimal('100'))
+
+    def test_near_duplicate_is_matched(self):
+        original = self.create('Galaxy S24 Ultra 256GB Titanium Black', sku='SM-S928B')
+        different = self.create('Galaxy Buds 3 Pro', description='Wireless earbuds with noise cancelling')
+        product_matching.match_product(original.pk)
+        product_matching.match_product(different.pk)
+        copy = self.create('Samsung Galaxy S24 Ultra 256 GB Titanium Black', sku='SM-S928B')
+
+        matches = product_matching.match_product(copy.pk)
+        self.assertEqual([match.match_id for match in matches], [original.pk])
+        self.assertTrue(ProductMatch.objects.filter(product=original, match=copy).exists())
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:shoplio_app_product_changelist'), {'duplicate': 'yes'})
+        self.assertEqual({product.pk for product in response.context['cl'].result_list}, {original.pk, copy.pk})
+
+    def test_cluster_catalog(self):
+        for n in range(3):
+            self.create(f'Galaxy S24 Ultra 256GB Titanium Black {"" if n else "New"}', sku='SM-S928B')
+        self.create('Pixel 9 Pro', description='Google phone')
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            clusters = product_matching.cluster_catalog(executor, 2, chunk_size=2)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(len(clusters[0]), 3)
+        self.assertEqual(ProductMatch.objects.count(), 6)
+
+
+class ClickBankFeedTests(TestCase):
+    """The marketplace export upserts offers by vendor and slug and switches off the ones it drops"""
+
+    HEADER = 'vendor,slug,name,description,category,hoplink,price,commission_rate\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Health', slug='health')
+
+    def import_feed(self, rows, **kwargs):
+        content = self.HEADER + ''.join(f'{row}\n' for row in rows)
+        return clickbank_feed.import_clickbank_feed(io.BytesIO(content.encode()), 'csv', **kwargs)
+
+    def test_upsert_and_deactivate(self):
+        self.import_feed([
+            'keto,keto-plan,Keto Plan,Meal plan,health,https://hop.clickbank.net/?vendor=keto,37.00,75',
+            'yoga,yoga-burn,Yoga Burn,Videos,Health,https://hop.clickbank.net/?vendor=yoga,49.00,50',
+            'sleep,,Deep Sleep,Audio,health,https://hop.clickbank.net/?vendor=sleep,19.00,60',
+        ])
+        self.assertEqual(ClickBankProduct.objects.filter(is_active=True).count(), 3)
+        self.assertEqual(ClickBankProduct.objects.get(slug='keto-plan').estimated_commission, Decimal('27.75'))
+        self.assertTrue(ClickBankProduct.objects.filter(slug='sleep-deep-sleep', vendor='sleep').exists())
+
+        result = self.import_feed([
+            'keto,keto-plan,Keto Plan,Meal plan,health,https://hop.clickbank.net/?vendor=keto,37.00,75',
+            'yoga,yoga-burn,Yoga Burn,Videos,health,https://hop.clickbank.net/?vendor=yoga,39.00,50',
+            'other,keto-plan,Keto Copy,Meal plan,health,https://hop.clickbank.net/?vendor=other,5.00,10',
+            'sleep,,Deep Sleep,Audio,health,not-a-url,19.00,60',
+        ])
+        self.assertEqual((result.created, result.updated, result.unchanged, result.deactivated), (0, 1, 1, 0))
+        self.assertEqual(result.error_count, 2)
+        self.assertEqual(ClickBankProduct.objects.get(slug='yoga-burn').price, Decimal('39.00'))
+        self.assertEqual(ClickBankProduct.objects.get(slug='keto-plan').vendor, 'keto')
+
+        result = self.import_feed([
+            'yoga,yoga-burn,Yoga Burn,Videos,health,https://hop.clickbank.net/?vendor=yoga,39.00,50',
+        ])
+        self.assertEqual(result.deactivated, 2)
+        self.assertEqual(list(ClickBankProduct.objects.filter(is_active=True).values_list('slug', flat=True)),
+                         ['yoga-burn'])
+
+    def test_listing_and_detail_pages(self):
+        self.import_feed([
+            f'vendor{n},offer-{n},Offer {n},Description,health,https://hop.clickbank.net/?vendor=v{n},{10 + n}.00,50'
+            for n in range(30)
+        ])
+        response = self.client.get(reverse('shoplio_app:clickbank_product_list'), {'sort': 'price_high', 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result_count'], 30)
+        self.assertEqual([offer.slug for offer in response.context['offers']][:2], ['offer-5', 'offer-4'])
+
+        offer = ClickBankProduct.objects.get(slug='offer-3')
+        response = self.client.get(offer.get_absolute_url())
+        self.assertContains(response, 'Offer 3')
+        self.assertEqual(self.client.get(offer.get_absolute_url(), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(reverse('shoplio_app:track_clickbank_click', args=[offer.slug]))
+        self.assertRedirects(response, offer.hoplink, fetch_redirect_response=False)
+        self.assertEqual(ClickBankProduct.objects.get(pk=offer.pk).click_count, 1)
+
+
+class ClickBankRankingTests(TestCase):
+    """Offers are ranked by estimated commission times decayed click velocity"""
+
+    def setUp(self):
+        self.health = Category.objects.create(name='Health', slug='health')
+        self.fitness = Category.objects.create(name='Fitness', slug='fitness')
+
+    def create(self, slug, commission, category):
+        return ClickBankProduct.objects.create(
+            name=slug, slug=slug, description='-', category=category, vendor=slug, hoplink='https://hop.example.com',
+            price=Decimal('50'), commission_rate=Decimal('50'), estimated_commission=Decimal(commission),
+        )
+
+    def click(self, offer, count, days_ago):
+        ClickBankClickTracking.objects.bulk_create(ClickBankClickTracking(clickbank_product=offer) for _ in range(count))
+        # clicked_at is auto_now_add
+        ClickBankClickTracking.objects.filter(clickbank_product=offer).update(
+            clicked_at=timezone.now() - datetime.timedelta(days=days_ago),
+        )
+
+    def test_recent_clicks_outrank_old_ones(self):
+        recent = self.create('recent', '20', self.health)
+        stale = self.create('stale', '20', self.health)
+        rich = self.create('rich', '200', self.fitness)
+        unclicked = self.create('unclicked', '30', self.fitness)
+        self.click(recent, 10, days_ago=0)
+        self.click(stale, 10, days_ago=9)
+        self.click(rich, 2, days_ago=1)
+        self.click(self.create('expired', '20', self.health), 50, days_ago=60)
+
+        clickbank_ranking.rank_offers()
+        self.assertEqual([offer.slug for offer in clickbank_ranking.top_offers(limit=4)],
+                         ['rich', 'recent', 'stale', 'unclicked'])
+        self.assertEqual([offer.slug for offer in clickbank_ranking.top_offers(self.health)][:2], ['recent', 'stale'])
+        ranking = ClickBankRanking.objects.get(category=None, clickbank_product=recent)
+        self.assertEqual((ranking.clicks, ranking.epc), (10, Decimal('0.2000')))
+        # Counted as half a day old
+        self.assertAlmostEqual(ranking.velocity, 10 * 0.5 ** (0.5 / 3) * math.log(2) / 3)
+        self.assertEqual(ClickBankRanking.objects.get(category=None, clickbank_product=unclicked).clicks, 0)
+
+        response = self.client.get(reverse('shoplio_app:category_detail', args=['fitness']))
+        self.assertEqual([offer.slug for offer in response.context['top_offers']], ['rich', 'unclicked'])
+
+
+class TrendingTests(TestCase):
+    """Clicks feed a decayed leaderboard that is written in batches and served from memory"""
+
+    def setUp(self):
+        trending._pending = {}
+        trending._leaderboards.clear()
+        self.phones = Category.objects.create(name='Phones', slug='phones')
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.products = {
+            name: Product.objects.create(name=name, slug=name, description='-', category=category,
+                                         base_price=Decimal('100'), is_approved=True)
+            for name, category in (('old-hit', self.phones), ('new-hit', self.phones), ('novel', self.books))
+        }
+
+    def click(self, name, count, hours_ago):
+        at = timezone.now() - datetime.timedelta(hours=hours_ago)
+        for _ in range(count):
+            trending.record_click(self.products[name].pk, now=at)
+
+    def test_recent_clicks_rank_first(self):
+        with self.settings(TRENDING_FLUSH_SECONDS=3600):
+            self.click('old-hit', 8, hours_ago=48)
+            self.click('new-hit', 3, hours_ago=1)
+            self.click('novel', 1, hours_ago=0)
+            self.assertFalse(TrendingScore.objects.exists())
+        trending.flush()
+
+        self.assertEqual([product.slug for product in trending.top()], ['new-hit', 'novel', 'old-hit'])
+        self.assertEqual([product.slug for product in trending.top(self.phones)], ['new-hit', 'old-hit'])
+        self.assertAlmostEqual(trending.top()[2].trending_score, 8 / 16, places=3)
+        with self.assertNumQueries(0):
+            trending.top(limit=2)
+
+    def test_scores_carry_over_into_the_next_era(self):
+        now = timezone.now()
+        era = trending.era_of(now)
+        trending.persist(era - 1, {self.products['old-hit'].pk: 2.0 ** trending.ERA_HALF_LIVES})
+        trending.persist(era, {self.products['novel'].pk: 0.5})
+
+        row = TrendingScore.objects.get(pk=self.products['old-hit'].pk)
+        self.assertEqual((row.era, row.score), (era, 1.0))
+
+    def test_clicks_are_recorded_from_views(self):
+        merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://example.com')
+        offer = ProductMerchant.objects.create(product=self.products['novel'], merchant=merchant, price=Decimal('100'),
+                                               affiliate_link='https://shop.example.com/a')
+        with self.settings(TRENDING_FLUSH_SECONDS=0):
+            self.client.get(reverse('shoplio_app:track_click', args=[offer.pk]))
+        self.assertTrue(TrendingScore.objects.filter(pk=self.products['novel'].pk, category=self.books).exists())
+        response = self.client.get(reverse('shoplio_app:home'))
+        self.assertEqual([product.slug for product in response.context['trending_products']], ['novel'])
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['shoplio_app.identity.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend'],
+)
+class IdentityCacheTests(TestCase):
+    """With a shared cache, logged-in requests read the session, user and role profile from it"""
+
+    IDENTITY_TABLES = ('"django_session"', '"auth_user"', '"shoplio_app_seller"', '"shoplio_app_affiliate"')
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('shop', password='secret-password')
+        self.seller = Seller.objects.create(user=user, company_name='Shop One')
+
+    def identity_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if any(table in query['sql'] for table in self.IDENTITY_TABLES)]
+
+    def test_dashboard_needs_no_identity_queries_once_cached(self):
+        response = self.client.post(reverse('shoplio_app:seller_login'),
+                                    {'username': 'shop', 'password': 'secret-password'})
+        self.assertRedirects(response, reverse('shoplio_app:seller_dashboard'), fetch_redirect_response=False)
+
+        url = reverse('shoplio_app:seller_dashboard')
+        self.assertEqual(len(self.identity_queries(url)), 1)  # user and profiles in one query
+        self.assertEqual(self.identity_queries(url), [])
+
+        self.seller.company_name = 'Shop Two'
+        self.seller.save()
+        self.assertEqual(len(self.identity_queries(url)), 1)
+        self.assertContains(self.client.get(url), 'Shop Two')
+
+    def test_sessions_from_model_backend_stay_logged_in(self):
+        self.client.force_login(self.seller.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertContains(self.client.get(reverse('shoplio_app:seller_dashboard')), 'Shop One')
+
+
+class ExportTests(TestCase):
+    """Exports stream filtered rows as CSV or NDJSON from the admin and the command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.affiliates = Affiliate.objects.bulk_create([
+            Affiliate(user=User.objects.create(username=f'affiliate{n}'), affiliate_code=f'AFF{n}',
+                      full_name=f'Affiliate {n}', payment_details='-')
+            for n in range(2)
+        ])
+        cls.orders = []
+        for n in range(5):
+            order = Order.objects.create(
+                full_name='=HYPERLINK("x")' if n == 0 else f'Customer {n}', email='customer@example.com',
+                phone='1', address='Street', city='City', total_amount=Decimal('10.50'),
+                affiliate=cls.affiliates[n % 2],
+            )
+            cls.orders.append(order)
+        # created_at is auto_now_add; spread the orders over five days
+        for n, order in enumerate(cls.orders):
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - datetime.timedelta(days=n))
+
+    def read_csv(self, text):
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def test_filters_and_formats(self):
+        today = timezone.localdate()
+        queryset = exports.filtered('orders', start=today - datetime.timedelta(days=2), end=today,
+                                    affiliate=self.affiliates[0])
+        rows = self.read_csv(''.join(exports.stream('orders', queryset, 'csv', chunk_size=1)))
+        self.assertEqual([row['order_id'] for row in rows], [self.orders[0].order_id, self.orders[2].order_id])
+        self.assertEqual(rows[0]['full_name'], '\'=HYPERLINK("x")')
+        self.assertEqual((rows[0]['affiliate_code'], rows[0]['total_amount'], rows[0]['username']),
+                         ('AFF0', '10.50', ''))
+
+        lines = ''.join(exports.stream('orders', queryset, 'ndjson')).splitlines()
+        self.assertEqual(json.loads(lines[1])['order_id'], self.orders[2].order_id)
+        self.assertEqual(json.loads(lines[1])['total_amount'], '10.50')
+
+        empty = exports.filtered('orders', start=today + datetime.timedelta(days=1))
+        self.assertEqual(''.join(exports.stream('orders', empty)).strip(), ','.join(exports.EXPORTS['orders']['columns']))
+        with self.assertRaises(ValueError):
+            exports.filtered('clicks', affiliate=self.affiliates[0])
+
+    def test_admin_action_streams_selection(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:shoplio_app_order_changelist'), {
+            'action': 'export_as_csv', '_selected_action': [order.pk for order in self.orders[1:3]],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = self.read_csv(b''.join(response.streaming_content).decode())
+        self.assertEqual([row['order_id'] for row in rows], [order.order_id for order in self.orders[1:3]])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_data', 'orders', '--affiliate', 'AFF1', '--format', 'ndjson', stdout=out)
+        self.assertEqual([json.loads(line)['order_id'] for line in out.getvalue().splitlines()],
+                         [self.orders[1].order_id, self.orders[3].order_id])
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'orders', '--affiliate', 'NOPE', stdout=out)
+
+
+class SalesCubeTests(TestCase):
+    """The sales cube follows orders as they are placed, change and go, and matches a rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.phones = Category.objects.create(name='Phones', slug='phones')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', description='-', category=cls.phones,
+                                           base_price=Decimal('100'))
+        cls.book = Product.objects.create(name='Book', slug='book', description='-', category=cls.books,
+                                          base_price=Decimal('20'))
+        cls.affiliate = Affiliate.objects.create(user=User.objects.create(username='affiliate'), affiliate_code='AFF1',
+                                                 full_name='Affiliate', payment_details='-')
+
+    def place(self, product, quantity, city, affiliate=None):
+        order = Order.objects.create(full_name='Customer', email='customer@example.com', phone='1', address='Street',
+                                     city=city, total_amount=product.base_price * quantity, affiliate=affiliate)
+        OrderItem.objects.create(order=order, product=product, price=product.base_price, quantity=quantity)
+        tasks.enqueue('order_placed', {'order_id': order.pk})  # as checkout does
+        self.run_tasks()
+        return order
+
+    def run_tasks(self):
+        while tasks.run_next():
+            pass
+
+    def cube(self):
+        return sorted(SalesCell.objects.values_list('product_id', 'city', 'affiliate_id', 'status', 'orders', 'units',
+                                                    'revenue'), key=str)
+
+    def test_incremental_updates_match_rebuild(self):
+        first = self.place(self.phone, 1, 'lahore ')
+        self.place(self.phone, 2, 'Lahore', affiliate=self.affiliate)
+        self.place(self.phone, 1, 'LAHORE')
+        self.place(self.book, 3, 'Karachi')
+        self.assertEqual(self.cube(), sorted([
+            (self.phone.pk, 'Lahore', None, 'pending', 2, 2, Decimal('200')),
+            (self.phone.pk, 'Lahore', self.affiliate.pk, 'pending', 1, 2, Decimal('200')),
+            (self.book.pk, 'Karachi', None, 'pending', 1, 3, Decimal('60')),
+        ], key=str))
+
+        first.status = 'delivered'
+        first.save()
+        self.run_tasks()
+        self.assertIn((self.phone.pk, 'Lahore', None, 'pending', 1, 1, Decimal('100')), self.cube())
+        self.assertIn((self.phone.pk, 'Lahore', None, 'delivered', 1, 1, Decimal('100')), self.cube())
+        self.assertFalse(sales_cube.sync_order(first.pk))
+
+        Order.objects.get(city='Karachi').delete()
+        incremental = self.cube()
+        self.assertEqual(len(incremental), 3)
+        self.assertEqual(sales_cube.rebuild(chunk_size=2), 3)
+        self.assertEqual(self.cube(), incremental)
+
+        rows, totals = sales_cube.summarize(sales_cube.cells(category=self.phones.pk), ['status'])
+        self.assertEqual([(row['status'], row['revenue']) for row in rows],
+                         [('pending', Decimal('300')), ('delivered', Decimal('100'))])
+        self.assertEqual(totals, {'orders': 3, 'units': 4, 'revenue': Decimal('400')})
+
+    def test_new_orders_are_counted_by_order_placed(self):
+        order = Order.objects.create(full_name='Customer', email='customer@example.com', phone='1', address='Street',
+                                     city='Lahore', total_amount=Decimal('100'))
+        OrderItem.objects.create(order=order, product=self.phone, price=Decimal('100'), quantity=1)
+        self.assertFalse(Task.objects.exists())
+        jobs.order_placed(order.pk)
+        self.assertEqual(self.cube(), [(self.phone.pk, 'Lahore', None, 'pending', 1, 1, Decimal('100'))])
+
+        # Saves that change nothing the cube counts queue nothing either
+        order.full_name = 'Renamed'
+        order.save()
+        self.assertFalse(Task.objects.exists())
+
+    def test_saving_a_stale_order_keeps_its_bookkeeping(self):
+        order = self.place(self.phone, 1, 'Lahore')
+        stale = Order.objects.get(pk=order.pk)
+        Order.objects.filter(pk=order.pk).update(status='delivered')
+        self.assertTrue(sales_cube.sync_order(order.pk))
+
+        stale.full_name = 'Renamed'
+        stale.save()
+        order.refresh_from_db()
+        self.assertEqual((order.full_name, order.status, order.reported_as),
+                         ('Renamed', 'pending', 'delivered:0:Lahore'))
+        self.run_tasks()
+        self.assertEqual(self.cube(), [(self.phone.pk, 'Lahore', None, 'pending', 1, 1, Decimal('100'))])
+
+    def test_saving_a_deleted_order(self):
+        order = self.place(self.phone, 1, 'Lahore')
+        Order.objects.filter(pk=order.pk).delete()
+        self.assertEqual(self.cube(), [])
+
+        # Not inserted again with bookkeeping that no longer holds
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            order.save()
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+
+    def test_json_endpoint_and_admin_report(self):
+        self.place(self.phone, 1, 'Lahore', affiliate=self.affiliate)
+        self.place(self.book, 2, 'Karachi')
+        url = reverse('shoplio_app:sales_report')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'group_by': 'category,city', 'start': timezone.localdate().isoformat()})
+        self.assertEqual(response.json()['rows'], [
+            {'category_id': self.phones.pk, 'category_name': 'Phones', 'city': 'Lahore',
+             'orders': 1, 'units': 1, 'revenue': '100.00'},
+            {'category_id': self.books.pk, 'category_name': 'Books', 'city': 'Karachi',
+             'orders': 1, 'units': 2, 'revenue': '40.00'},
+        ])
+        response = self.client.get(url, {'group_by': 'affiliate', 'affiliate': 'AFF1'})
+        self.assertEqual(response.json()['totals'], {'orders': 1, 'units': 1, 'revenue': '100.00'})
+        self.assertEqual(self.client.get(url, {'group_by': 'weather'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'category': 'missing'}).status_code, 400)
+
+        response = self.client.get(reverse('admin:shoplio_app_salescell_changelist'), {'group_by': 'city'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report_rows'], [['Lahore', 1, 1, Decimal('100.00')],
+                                                          ['Karachi', 1, 2, Decimal('40.00')]])
+
+
+def _write_ids(path, count):
+    with open(path, 'w') as fh:
+        fh.writelines(ids.next_id() + '\n' for _ in range(count))
+
+
+class IdAllocatorTests(TransactionTestCase):
+    """Sequence numbers stay unique across forked processes and rolled-back reservations"""
+
+    def test_forked_children_issue_unique_ids(self):
+        issued = [ids.next_id() for _ in range(10)]  # the parent holds a partly used block
+        count = ids.BLOCK_SIZE + 100
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f'{n}.txt') for n in range(3)]
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            children = [context.Process(target=_write_ids, args=(path, count)) for path in paths]
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+            self.assertEqual([child.exitcode for child in children], [0, 0, 0])
+            for path in paths:
+                with open(path) as fh:
+                    issued += fh.read().split()
+        issued += [ids.next_id() for _ in range(10)]
+
+        self.assertEqual(len(issued), 3 * count + 20)
+        self.assertEqual(len(set(issued)), len(issued))
+
+    def test_rolled_back_block_is_not_reused(self):
+        allocator = ids.IdAllocator()
+        with transaction.atomic():
+            with transaction.atomic():
+                first = allocator.next_sequence()
+                transaction.set_rollback(True)
+            # SQLite hands the rolled-back block number to the next reservation
+            other = IdBlock.objects.create(owner='another process')
+            self.assertEqual(other.pk, first // ids.BLOCK_SIZE)
+            number = allocator.next_sequence()
+        self.assertNotEqual(number // ids.BLOCK_SIZE, other.pk)
+        self.assertTrue(IdBlock.objects.filter(pk=number // ids.BLOCK_SIZE).exists())
+
+
+_flaky_failures = []
+
+
+@tasks.task('test_flaky')
+def _flaky(fail_times):
+    """Fails the first `fail_times` runs"""
+    _flaky_failures.append(True)
+    if len(_flaky_failures) <= fail_times:
+        raise RuntimeError('flaky')
+
+
+class CheckoutTests(TestCase):
+    """Checkout writes one order and one task; the deferred bookkeeping runs once however often the task does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                             base_price=Decimal('100'), is_approved=True)
+        cls.affiliate = Affiliate.objects.create(user=User.objects.create(username='affiliate'), affiliate_code='AFF1',
+                                                 full_name='Affiliate', payment_details='-', is_approved=True)
+
+    def test_checkout_queues_bookkeeping_once(self):
+        self.client.cookies['affiliate_code'] = 'AFF1'
+        response = self.client.post(reverse('shoplio_app:checkout', args=['phone']), {
+            'full_name': 'Customer', 'email': 'customer@example.com', 'phone': '1', 'address': 'Street',
+            'city': 'Lahore', 'quantity': '2',
+        })
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('shoplio_app:order_confirmation', args=[order.order_id]))
+        self.assertEqual(order.affiliate, self.affiliate)
+        self.assertEqual(order.total_amount, Decimal('200'))
+        self.assertEqual(order.items.get().quantity, 2)
+        task = Task.objects.get(name='order_placed')
+        self.assertEqual(task.payload, {'order_id': order.pk})
+        self.assertFalse(Commission.objects.exists())
+
+        self.assertTrue(tasks.run_next())
+        jobs.order_placed(order.pk)  # a retried or re-leased run
+        commission = Commission.objects.get()
+        self.assertEqual((commission.order, commission.affiliate), (order, self.affiliate))
+        self.affiliate.refresh_from_db()
+        self.assertEqual(self.affiliate.total_sales, 1)
+
+    def test_one_task_per_idempotency_key(self):
+        first = tasks.enqueue('test_flaky', {'fail_times': 0}, key='flaky:1')
+        self.assertEqual(tasks.enqueue('test_flaky', {'fail_times': 0}, key='flaky:1'), first)
+        tasks.enqueue('test_flaky', {'fail_times': 0}, key='flaky:2')
+        self.assertEqual(Task.objects.filter(name='test_flaky').count(), 2)
+        with self.assertRaises(ValueError):
+            tasks.enqueue('no_such_task')
+
+
+class TaskQueueTests(TestCase):
+    """Leases, retries with backoff and expiry of the task queue"""
+
+    def setUp(self):
+        _flaky_failures.clear()
+
+    def expire(self, task):
+        Task.objects.filter(pk=task.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_claimed_task_is_not_claimed_again(self):
+        task = tasks.enqueue('test_flaky', {'fail_times': 0})
+        self.assertEqual(tasks.claim('worker-a'), task)
+        self.assertIsNone(tasks.claim('worker-b'))
+
+    def test_expired_lease_is_run_again(self):
+        tasks.enqueue('test_flaky', {'fail_times': 0})
+        first = tasks.claim('worker-a')
+        self.expire(first)
+        second = tasks.claim('worker-b')
+        self.assertEqual((second.pk, second.attempts, second.claimed_by), (first.pk, 2, 'worker-b'))
+        self.assertTrue(tasks.run_task(second))
+        # The first worker finishing late no longer holds the lease and changes nothing
+        Task.objects.filter(pk=first.pk).update(finished_at=None)
+        self.assertTrue(tasks.run_task(first))
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.finished_at), ('done', None))
+
+    @override_settings(TASK_RETRY_BASE_DELAY=10, TASK_RETRY_MAX_DELAY=60)
+    def test_failures_are_retried_with_backoff(self):
+        self.assertTrue(8 <= tasks.retry_delay(1) <= 12)
+        self.assertTrue(16 <= tasks.retry_delay(2) <= 24)
+        self.assertTrue(48 <= tasks.retry_delay(5) <= 72)
+
+        task = tasks.enqueue('test_flaky', {'fail_times': 2}, max_attempts=3)
+        before = timezone.now()
+        with self.assertLogs('shoplio_app.tasks', 'ERROR'):
+            self.assertTrue(tasks.run_next())
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: flaky', task.last_error)
+        self.assertGreaterEqual(task.run_after, before + datetime.timedelta(seconds=8))
+        self.assertFalse(tasks.run_next())  # not due yet
+
+        with self.assertLogs('shoplio_app.tasks', 'ERROR') as logs:
+            for _ in range(2):
+                Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+                self.assertTrue(tasks.run_next())
+        self.assertEqual(len(logs.records), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('done', 3))
+
+        failing = tasks.enqueue('test_flaky', {'fail_times': 10}, max_attempts=1)
+        with self.assertLogs('shoplio_app.tasks', 'ERROR'):
+            self.assertTrue(tasks.run_next())
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('failed', 1))
+
+    def test_fail_expired(self):
+        last_try = tasks.enqueue('test_flaky', {'fail_times': 0}, max_attempts=1)
+        retryable = tasks.enqueue('test_flaky', {'fail_times': 0}, max_attempts=2)
+        for _ in range(2):
+            self.expire(tasks.claim('worker-a'))
+
+        self.assertEqual(tasks.fail_expired(), 1)
+        last_try.refresh_from_db()
+        self.assertEqual(last_try.status, 'failed')
+        self.assertIn('Lease expired', last_try.last_error)
+        self.assertEqual(tasks.claim('worker-b'), retryable)
+        self.assertIsNone(tasks.claim('worker-b'))
+
+
+def _claim_and_close(worker):
+    try:
+        task = tasks.claim(worker)
+        return task and task.pk
+    finally:
+        connection.close()
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    """Workers racing for the same task: exactly one wins"""
+
+    def test_concurrent_claims_return_the_task_once(self):
+        task = tasks.enqueue('test_flaky', {'fail_times': 0})
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            claimed = list(executor.map(_claim_and_close, [f'worker-{n}' for n in range(8)]))
+        self.assertEqual([pk for pk in claimed if pk], [task.pk])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('running', 1))
+
+
+@tasks.task('test_stop_worker')
+def _stop_worker():
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+class WorkerTests(TransactionTestCase):
+    """run_worker runs due tasks and stops cleanly on SIGTERM, taking its worker processes with it"""
+
+    def test_once_runs_due_tasks_then_exits(self):
+        for n in range(3):
+            tasks.enqueue('test_flaky', {'fail_times': 0})
+        tasks.enqueue('test_flaky', {'fail_times': 0}, delay=60)
+        out = io.StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        self.assertIn('after 3 tasks', out.getvalue())
+        self.assertEqual(Task.objects.filter(status='done').count(), 3)
+        self.assertEqual(Task.objects.filter(status='queued').count(), 1)
+
+    def test_sigterm_stops_the_loop_after_the_current_task(self):
+        previous = signal.getsignal(signal.SIGTERM)
+        tasks.enqueue('test_stop_worker')
+        tasks.enqueue('test_flaky', {'fail_times': 0}, delay=1)
+        out = io.StringIO()
+        call_command('run_worker', '--sleep', '0.01', stdout=out)
+        self.assertIn('after 1 tasks', out.getvalue())
+        self.assertEqual(Task.objects.get(name='test_stop_worker').status, 'done')
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+    def test_sigterm_stops_worker_processes(self):
+        previous = signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM))
+        timer.start()
+        out = io.StringIO()
+        try:
+            call_command('run_worker', '--processes', '2', '--sleep', '0.05', stdout=out)
+        finally:
+            timer.cancel()
+        self.assertIn('Workers stopped', out.getvalue())
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+
+class AttributionTests(TestCase):
+    """Sales are credited through the signed click cookie, once per click"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                               base_price=Decimal('100'), is_approved=True)
+        cls.affiliate = Affiliate.objects.create(user=User.objects.create(username='affiliate'), affiliate_code='AFF1',
+                                                 full_name='Affiliate', payment_details='-', is_approved=True)
+
+    def setUp(self):
+        self.user_agent = f'{self._testMethodName} browser'
+
+    def follow_link(self):
+        return self.client.get(reverse('shoplio_app:track_affiliate_click', args=['aff1']), {'product': 'phone'},
+                               HTTP_USER_AGENT=self.user_agent)
+
+    def checkout(self):
+        self.client.post(reverse('shoplio_app:checkout', args=['phone']), {
+            'full_name': 'Customer', 'email': 'customer@example.com', 'phone': '1', 'address': 'Street',
+            'city': 'Lahore', 'quantity': '1',
+        })
+        return Order.objects.latest('pk')
+
+    def resolve(self, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return attribution.resolve(request)
+
+    def test_click_cookie_round_trip(self):
+        self.follow_link()
+        self.follow_link()  # a repeat hit inside the dedup window
+        click = AffiliateClick.objects.get()
+        self.affiliate.refresh_from_db()
+        self.assertEqual(self.affiliate.total_clicks, 1)
+        cookie = self.client.cookies[attribution.CLICK_COOKIE].value
+        self.assertEqual(self.resolve(**{attribution.CLICK_COOKIE: cookie}), (click, self.affiliate))
+
+        order = self.checkout()
+        self.assertEqual(order.affiliate, self.affiliate)
+        click.refresh_from_db()
+        self.assertEqual((click.converted, click.order), (True, order))
+
+        # The click is spent; the plain affiliate code cookie must not credit it again
+        self.assertIn(attribution.AFFILIATE_COOKIE, self.client.cookies)
+        self.assertIsNone(self.checkout().affiliate)
+
+    def test_tampered_cookie_credits_nobody(self):
+        self.follow_link()
+        click_id, signature = self.client.cookies[attribution.CLICK_COOKIE].value.split(':', 1)
+        other = AffiliateClick.objects.create(affiliate=self.affiliate)
+        self.assertEqual(self.resolve(**{attribution.CLICK_COOKIE: f'{other.pk}:{signature}',
+                                         attribution.AFFILIATE_COOKIE: 'AFF1'}), (None, None))
+        self.assertEqual(self.resolve(**{attribution.CLICK_COOKIE: str(other.pk)}), (None, None))
+
+    @override_settings(AFFILIATE_ATTRIBUTION_WINDOW_DAYS=30)
+    def test_expired_cookie_credits_nobody(self):
+        click = AffiliateClick.objects.create(affiliate=self.affiliate)
+        for days, expected in ((29, (click, self.affiliate)), (31, (None, None))):
+            response = HttpResponse()
+            with mock.patch('time.time', return_value=time.time() - days * 86400):
+                attribution.set_click_cookie(response, click)
+            cookie = response.cookies[attribution.CLICK_COOKIE].value
+            self.assertEqual(self.resolve(**{attribution.CLICK_COOKIE: cookie}), expected)
+
+    def test_affiliate_code_cookie_without_click_cookie(self):
+        self.assertEqual(self.resolve(**{attribution.AFFILIATE_COOKIE: 'AFF1'}), (None, self.affiliate))
+        self.assertEqual(self.resolve(**{attribution.AFFILIATE_COOKIE: 'NOPE'}), (None, None))
+        self.assertEqual(self.resolve(), (None, None))
+
+
+class ClickRetentionTests(TestCase):
+    """Old clicks move to daily archive files once, and stay countable there"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         base_price=Decimal('100'))
+        merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://example.com')
+        cls.offer = ProductMerchant.objects.create(product=product, merchant=merchant, price=Decimal('100'),
+                                                   affiliate_link='https://example.com/a',
+                                                   product_url='https://example.com/p')
+        now = timezone.now()
+        cls.old_days = [timezone.localdate(now - datetime.timedelta(days=days)) for days in (100, 100, 101)]
+        for days in (100, 100, 101, 1):
+            click = ClickTracking.objects.create(product_merchant=cls.offer, ip_address='10.0.0.1')
+            ClickTracking.objects.filter(pk=click.pk).update(clicked_at=now - datetime.timedelta(days=days))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def test_archive_moves_old_rows_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            archived = retention.archive_table('clicks', older_than_days=90, batch_size=2, root=self.root)
+        self.assertEqual(archived, 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 2)
+        self.assertEqual(ClickTracking.objects.count(), 1)
+        for day in set(self.old_days):
+            self.assertTrue(os.path.exists(retention.partition_path('clicks', day, self.root)))
+        self.assertEqual(retention.archive_table('clicks', older_than_days=90, root=self.root), 0)
+
+        counts = retention.aggregate_archive('clicks', ['day', 'product_id'], root=self.root)
+        self.assertEqual(counts, {(self.old_days[0].isoformat(), self.offer.product_id): 2,
+                                  (self.old_days[2].isoformat(), self.offer.product_id): 1})
+        only_first = retention.aggregate_archive('clicks', 'ip_address', start=self.old_days[0], root=self.root)
+        self.assertEqual(only_first, {('10.0.0.1',): 2})
+
+    def test_rows_archived_twice_count_once(self):
+        # A run that crashes between writing a batch and deleting it
+        with mock.patch('django.db.models.QuerySet.delete', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                retention.archive_table('clicks', older_than_days=90, batch_size=1, root=self.root)
+        self.assertEqual(ClickTracking.objects.count(), 4)
+
+        self.assertEqual(retention.archive_table('clicks', older_than_days=90, root=self.root), 3)
+        self.assertEqual(sum(retention.aggregate_archive('clicks', 'day', root=self.root).values()), 3)
+
+    def test_command(self):
+        out = io.StringIO()
+        with override_settings(CLICK_ARCHIVE_ROOT=self.root):
+            call_command('archive_clicks', '--table', 'clicks', '--days', '90', stdout=out)
+            call_command('archive_clicks', '--table', 'clicks', '--report', 'product_id', stdout=out)
+        self.assertIn('Archived 3 rows from clicks', out.getvalue())
+        self.assertIn(f'{self.offer.product_id}: 3', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('archive_clicks', '--days', '0', stdout=out)
+
+
+class ClickInterningTests(TestCase):
+    """Click user agents and referrers are stored once and referenced by id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         base_price=Decimal('100'), is_approved=True)
+        merchant = Merchant.objects.create(name='Daraz', slug='daraz', website_url='https://daraz.pk')
+        cls.offer = ProductMerchant.objects.create(product=product, merchant=merchant, price=Decimal('100'),
+                                                   affiliate_link='https://daraz.pk/a',
+                                                   product_url='https://daraz.pk/p')
+
+    def setUp(self):
+        # Cached ids do not survive the rollback after each test
+        tracking._user_agents.clear()
+        tracking._referrers.clear()
+
+    def test_values_are_stored_once(self):
+        first = tracking.intern_user_agent('Mozilla/5.0')
+        with self.assertNumQueries(0):
+            self.assertEqual(tracking.intern_user_agent('Mozilla/5.0'), first)
+            self.assertIsNone(tracking.intern_user_agent(''))
+        tracking._user_agents.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(tracking.intern_user_agent('Mozilla/5.0'), first)
+        self.assertEqual(UserAgent.objects.get().value, 'Mozilla/5.0')
+
+        # Each kind of string has its own dictionary
+        referrer = tracking.intern_referrer('Mozilla/5.0')
+        self.assertEqual(Referrer.objects.get(pk=referrer).value, 'Mozilla/5.0')
+        self.assertEqual(UserAgent.objects.count(), 1)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        lru = tracking.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c'), len(lru)), (1, None, 3, 2))
+
+    def test_clicks_reference_interned_values(self):
+        url = reverse('shoplio_app:track_click', args=[self.offer.pk])
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            self.client.get(url, REMOTE_ADDR=ip, HTTP_USER_AGENT='Interning browser',
+                            HTTP_REFERER='https://search.example/?q=phone')
+        self.client.get(url, REMOTE_ADDR='10.0.0.3')
+
+        clicks = ClickTracking.objects.select_related('user_agent', 'referrer').order_by('ip_address')
+        self.assertEqual([(click.user_agent and click.user_agent.value, click.referrer and click.referrer.value)
+                          for click in clicks],
+                         [('Interning browser', 'https://search.example/?q=phone')] * 2 + [(None, None)])
+        self.assertEqual((UserAgent.objects.count(), Referrer.objects.count()), (1, 1))
+
+        out = io.StringIO()
+        call_command('click_dictionary_report', stdout=out)
+        self.assertIn('distinct values: 1', out.getvalue())
+        self.assertIn('click references: 2', out.getvalue())
+
+
+class ClickDeduplicatorTests(TestCase):
+    """Repeat hits inside the sliding window are suppressed, with bounded memory"""
+
+    def test_window(self):
+        dedup = tracking.ClickDeduplicator(30, buckets=6)
+        self.assertFalse(dedup.is_duplicate('visitor|a', now=100))
+        self.assertTrue(dedup.is_duplicate('visitor|a', now=110))
+        self.assertFalse(dedup.is_duplicate('visitor|b', now=110))
+        # Buckets are 5 seconds wide and expire whole: a hit stays remembered
+        # for between 25 and 30 seconds
+        self.assertTrue(dedup.is_duplicate('visitor|a', now=129.9))
+        self.assertFalse(dedup.is_duplicate('visitor|a', now=130))
+        self.assertTrue(dedup.is_duplicate('visitor|a', now=131))
+        self.assertEqual(dedup.stats(), {'window_seconds': 30, 'tracked_keys': 2, 'checked': 6, 'suppressed': 3,
+                                         'overflowed': 0})
+
+    def test_disabled_window(self):
+        dedup = tracking.ClickDeduplicator(0)
+        self.assertFalse(dedup.is_duplicate('visitor|a', now=100))
+        self.assertFalse(dedup.is_duplicate('visitor|a', now=100))
+
+    def test_full_deduplicator_lets_new_keys_through(self):
+        dedup = tracking.ClickDeduplicator(30, max_keys=2)
+        self.assertFalse(dedup.is_duplicate('a', now=100))
+        self.assertFalse(dedup.is_duplicate('b', now=100))
+        self.assertFalse(dedup.is_duplicate('c', now=101))
+        self.assertFalse(dedup.is_duplicate('c', now=102))
+        self.assertTrue(dedup.is_duplicate('a', now=102))
+        self.assertEqual(dedup.stats()['overflowed'], 2)
+        # Expired buckets free room again
+        self.assertFalse(dedup.is_duplicate('c', now=200))
+        self.assertTrue(dedup.is_duplicate('c', now=201))
+
+    def test_visitors_are_told_apart(self):
+        def request(ip, user_agent):
+            return RequestFactory().get('/', REMOTE_ADDR=ip, HTTP_USER_AGENT=user_agent)
+
+        target = f'test:{self._testMethodName}'
+        self.assertFalse(tracking.is_duplicate_click(request('10.0.0.1', 'Browser'), target))
+        self.assertTrue(tracking.is_duplicate_click(request('10.0.0.1', 'Browser'), target))
+        self.assertFalse(tracking.is_duplicate_click(request('10.0.0.2', 'Browser'), target))
+        self.assertFalse(tracking.is_duplicate_click(request('10.0.0.1', 'Other browser'), target))
+        self.assertFalse(tracking.is_duplicate_click(request('10.0.0.1', 'Browser'), target + ':other'))
+
+
+class ProductImportTests(TestCase):
+    """Bulk imports give every product a unique slug, checked in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.seller = Seller.objects.create(user=User.objects.create(username='seller'), company_name='Seller')
+        for slug in ('phone', 'phone-1', 'phone-case', 'phone-x'):
+            Product.objects.create(name=slug, slug=slug, description='-', category=cls.category,
+                                   base_price=Decimal('10'))
+
+    def test_allocate_slugs(self):
+        with mock.patch.object(product_import, 'SLUG_QUERY_BATCH', 2), self.assertNumQueries(2):
+            slugs = product_import.allocate_slugs(['Phone', 'Phone', 'Tablet', 'phone!', 'Phone Case'])
+        self.assertEqual(slugs, ['phone-2', 'phone-3', 'tablet', 'phone-4', 'phone-case-1'])
+
+        long_name = 'x' * 400
+        slug = product_import.allocate_slugs([long_name])[0]
+        self.assertEqual(slug, 'x' * product_import.SLUG_BASE_LENGTH)
+        Product.objects.create(name=long_name[:300], slug=slug, description='-', category=self.category,
+                               base_price=Decimal('10'))
+        self.assertEqual(product_import.allocate_slugs([long_name]), [slug + '-1'])
+
+    def test_import_reports_bad_rows_and_dedupes_across_chunks(self):
+        data = io.StringIO(
+            'name,description,category,base_price\n'
+            'Phone,A phone,phones,100\n'
+            'Phone,Another phone,Phones,\n'
+            'Phone,Same phone again,phones,"1,200"\n'
+            'Tablet,A tablet,tablets,300\n'
+            '!!!,Nameless,phones,10\n'
+            'Phone,Last phone,%s,50\n' % self.category.pk
+        )
+        result = product_import.import_products(data, self.seller, 'csv', chunk_size=2)
+        self.assertEqual((result.rows, result.created, result.error_count), (6, 3, 3))
+        self.assertEqual([line for line, _ in result.errors], [3, 5, 6])
+        self.assertEqual(sorted(Product.objects.filter(seller=self.seller).values_list('slug', 'base_price')),
+                         [('phone-2', Decimal('100')), ('phone-3', Decimal('1200')), ('phone-4', Decimal('50'))])
+        self.assertFalse(Product.objects.filter(seller=self.seller, is_approved=True).exists())
+        self.assertEqual(Task.objects.filter(name='match_products').count(), 3)  # one per chunk
+
+    def test_slug_taken_concurrently_is_allocated_again(self):
+        lookups = [set(), {'phone', 'phone-1'}]
+        with mock.patch.object(product_import, '_taken_slugs', side_effect=lambda bases: lookups.pop(0)):
+            result = product_import.import_products(io.StringIO(
+                'name,description,category,base_price\nPhone,A phone,phones,100\n'
+            ), self.seller, 'csv')
+        self.assertEqual((result.created, result.error_count), (1, 0))
+        self.assertEqual(Product.objects.get(seller=self.seller).slug, 'phone-2')
+
+
+class ProductStatsTests(TestCase):
+    """Seller analytics counters are bumped with one UPDATE and count each order once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                           base_price=Decimal('100'), is_approved=True)
+        cls.case = Product.objects.create(name='Case', slug='case', description='-', category=category,
+                                          base_price=Decimal('5'), is_approved=True)
+
+    def test_increment(self):
+        analytics.increment(self.phone.pk, detail_views=1)
+        with self.assertNumQueries(1):
+            analytics.increment(self.phone.pk, detail_views=2, merchant_clicks=1)
+        stats = ProductStats.objects.get(product=self.phone)
+        self.assertEqual((stats.detail_views, stats.merchant_clicks, stats.orders), (3, 1, 0))
+
+    def test_row_created_by_a_concurrent_request(self):
+        update = ProductStats.objects.none().update.__func__
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            if not raced:
+                # Another request creates the row between our UPDATE and INSERT
+                raced.append(True)
+                ProductStats.objects.create(product=self.phone, merchant_clicks=1)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch('django.db.models.QuerySet.update', autospec=True, side_effect=racing_update):
+            analytics.increment(self.phone.pk, merchant_clicks=1)
+        self.assertEqual(ProductStats.objects.get(product=self.phone).merchant_clicks, 2)
+
+    def test_record_order_counts_once(self):
+        order = Order.objects.create(full_name='Customer', email='customer@example.com', phone='1', address='Street',
+                                     city='Lahore', total_amount=Decimal('215'))
+        OrderItem.objects.create(order=order, product=self.phone, price=Decimal('100'), quantity=2)
+        OrderItem.objects.create(order=order, product=self.case, price=Decimal('5'), quantity=1)
+        OrderItem.objects.create(order=order, product=self.case, price=Decimal('5'), quantity=2)
+
+        self.assertTrue(analytics.record_order(order))
+        self.assertFalse(analytics.record_order(order))
+        self.assertEqual(
+            sorted(ProductStats.objects.values_list('product__slug', 'orders', 'units_sold', 'revenue')),
+            [('case', 1, 3, Decimal('15')), ('phone', 1, 2, Decimal('200'))],
+        )
+
+    def test_detail_views_ignore_reloads(self):
+        def view(ip):
+            request = RequestFactory().get('/', REMOTE_ADDR=ip, HTTP_USER_AGENT=self._testMethodName)
+            analytics.record_detail_view(request, self.phone)
+
+        clicks_checked = tracking.dedup_stats()['checked']
+        view('10.0.0.1')
+        view('10.0.0.1')
+        view('10.0.0.2')
+        self.assertEqual(ProductStats.objects.get(product=self.phone).detail_views, 2)
+        # Views have their own deduplicator
+        self.assertEqual(tracking.dedup_stats()['checked'], clicks_checked)
+
+
+def _increment_and_close(product_id):
+    try:
+        for _ in range(25):
+            analytics.increment(product_id, merchant_clicks=1)
+    finally:
+        connection.close()
+
+
+class ConcurrentProductStatsTests(TransactionTestCase):
+    """Counters bumped from several threads at once lose no increments"""
+
+    def test_concurrent_increments(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        product = Product.objects.create(name='Phone', slug='phone', description='-', category=category,
+                                         base_price=Decimal('100'))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(_increment_and_close, [product.pk] * 4))
+        self.assertEqual(ProductStats.objects.get(product=product).merchant_clicks, 100)
@@ -0,0 +1,179 @@
+"""
+Click ingest helpers.
+
+User agents and referrers repeat heavily across click rows, so they are stored
+once in the UserAgent / Referrer lookup tables and click rows only carry their
+ids. An in-process LRU maps string -> id so repeat visitors cost no lookup.
+
+Repeat hits from the same visitor on the same target (double-clicks,
+prefetchers, crawler bursts) are dropped by a sliding-window deduplicator
+before they reach the database.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+from .models import UserAgent, Referrer
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Small thread-safe least-recently-used mapping"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_user_agents = LRUCache(settings.CLICK_INTERN_CACHE_SIZE)
+_referrers = LRUCache(settings.CLICK_INTERN_CACHE_SIZE)
+
+
+def _intern(model, cache, value):
+    if not value:
+        return None
+    digest = hashlib.sha1(value.encode('utf-8')).hexdigest()
+    pk = cache.get(digest)
+    if pk is None:
+        pk = model.objects.get_or_create(digest=digest, defaults={'value': value})[0].pk
+        cache.set(digest, pk)
+    return pk
+
+
+def intern_user_agent(value):
+    """Return the UserAgent id for a header value, creating it if needed"""
+    return _intern(UserAgent, _user_agents, value)
+
+
+def intern_referrer(value):
+    """Return the Referrer id for a URL, creating it if needed"""
+    return _intern(Referrer, _referrers, value)
+
+
+def click_fields(request):
+    """Tracking columns for a click row built from the incoming request"""
+    return {
+        'ip_address': request.META.get('REMOTE_ADDR'),
+        'user_agent_id': intern_user_agent(request.META.get('HTTP_USER_AGENT', '')),
+        'referrer_id': intern_referrer(request.META.get('HTTP_REFERER', '')),
+    }
+
+
+class ClickDeduplicator:
+    """
+    Sliding-window duplicate detector with bounded memory.
+
+    The window is split into time buckets, each holding a set of 64-bit key
+    hashes; expired buckets are dropped whole. A key is a duplicate if any live
+    bucket holds it. Once `max_keys` hashes are held, new keys are let through
+    unrecorded rather than growing memory further.
+    """
+
+    def __init__(self, window, buckets=6, max_keys=100000):
+        self.window = window
+        self.buckets = buckets
+        self.span = window / buckets
+        self.max_keys = max_keys
+        self._slices = deque()  # (bucket index, set of hashes)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.suppressed = 0
+        self.overflowed = 0
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def is_duplicate(self, key, now=None):
+        """Record `key` and return True if it was already seen inside the window"""
+        if self.window <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        index = int(now // self.span)
+        digest = self._hash(key)
+
+        with self._lock:
+            self.checked += 1
+            while self._slices and self._slices[0][0] <= index - self.buckets:
+                self._size -= len(self._slices.popleft()[1])
+
+            if any(digest in hashes for _, hashes in self._slices):
+                self.suppressed += 1
+                return True
+
+            if self._size >= self.max_keys:
+                self.overflowed += 1
+                return False
+            if not self._slices or self._slices[-1][0] != index:
+                self._slices.append((index, set()))
+            self._slices[-1][1].add(digest)
+            self._size += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'window_seconds': self.window,
+                'tracked_keys': self._size,
+                'checked': self.checked,
+                'suppressed': self.suppressed,
+                'overflowed': self.overflowed,
+            }
+
+
+_deduplicator = ClickDeduplicator(
+    settings.CLICK_DEDUP_WINDOW_SECONDS,
+    max_keys=settings.CLICK_DEDUP_MAX_KEYS,
+)
+
+
+def visitor_key(request, target):
+    """Dedup key for one visitor (ip and user agent) hitting `target`"""
+    return '|'.join([
+        request.META.get('REMOTE_ADDR') or '',
+        request.META.get('HTTP_USER_AGENT', ''),
+        target,
+    ])
+
+
+def is_duplicate_click(request, target):
+    """True if this visitor already hit `target` within the dedup window"""
+    duplicate = _deduplicator.is_duplicate(visitor_key(request, target))
+    if duplicate:
+        logger.debug('Suppressed duplicate click on %s', target)
+    return duplicate
+
+
+def dedup_stats():
+    """Counters for the current process's click deduplicator"""
+    return _deduplicator.stats()
@@ -0,0 +1,174 @@
+"""
+Trending products from merchant and affiliate clicks.
+
+A click's weight halves every TRENDING_HALF_LIFE_HOURS. Rather than decaying
+every score as time passes, a click at time t adds 2 ** ((t - start) / half
+life), where start is the beginning of the current era (ERA_HALF_LIVES half
+lives long): later clicks simply weigh more, so scores of one era keep their
+order and a score is only written when its product is clicked. When an era
+ends, each row is scaled down once, on the first flush of the next era.
+
+Each process adds its clicks to a bounded buffer (record_click(), called from
+the click views) and writes the buffer to TrendingScore with one bulk update
+at least every TRENDING_FLUSH_SECONDS, or sooner once MAX_PENDING products are
+waiting. top() serves the best products overall or per category from
+leaderboards each process re-reads every TRENDING_REFRESH_SECONDS, so a page
+only slices a list already in memory.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, TrendingScore
+
+logger = logging.getLogger(__name__)
+
+ORIGIN = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+# Scores stay below 2 ** ERA_HALF_LIVES per click
+ERA_HALF_LIVES = 64
+# Rows decayed below this when their era ends are deleted
+MIN_SCORE = 0.001
+MAX_PENDING = 5000
+LEADERBOARD_SIZE = 50
+# Category leaderboards kept per process, least recently used dropped first
+MAX_LEADERBOARDS = 200
+BATCH_SIZE = 500
+
+
+def _half_life():
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600
+
+
+def era_of(moment):
+    return int((moment - ORIGIN).total_seconds() // (_half_life() * ERA_HALF_LIVES))
+
+
+def era_start(era):
+    return ORIGIN + datetime.timedelta(seconds=era * _half_life() * ERA_HALF_LIVES)
+
+
+def weight(moment, era):
+    """What a click at `moment` adds to a score of `era`"""
+    return 2.0 ** ((moment - era_start(era)).total_seconds() / _half_life())
+
+
+def decayed(score, era, now):
+    """A stored score in clicks as of `now`"""
+    return score * 2.0 ** (-(now - era_start(era)).total_seconds() / _half_life())
+
+
+# ---- Recording ---------------------------------------------------------
+
+_pending = {}  # product id -> summed weight relative to _pending_era
+_pending_era = None
+_flushed_at = time.monotonic()
+_lock = threading.Lock()
+
+
+def record_click(product_id, now=None):
+    """Count a click on a product; writes this process's buffer when it is due"""
+    global _pending, _pending_era, _flushed_at
+    now = now or timezone.now()
+    era = era_of(now)
+    batches = []
+    with _lock:
+        if _pending and era != _pending_era:
+            batches.append((_pending_era, _pending))
+            _pending = {}
+        _pending_era = era
+        _pending[product_id] = _pending.get(product_id, 0.0) + weight(now, era)
+        if len(_pending) >= MAX_PENDING or time.monotonic() - _flushed_at >= settings.TRENDING_FLUSH_SECONDS:
+            batches.append((era, _pending))
+            _pending = {}
+            _flushed_at = time.monotonic()
+    for batch_era, scores in batches:
+        try:
+            persist(batch_era, scores)
+        except DatabaseError:
+            # Trending is best effort; never fail the click over it
+            logger.exception('Could not save %d trending scores', len(scores))
+
+
+def flush():
+    """Write this process's buffered clicks now"""
+    global _pending, _flushed_at
+    with _lock:
+        era, scores = _pending_era, _pending
+        _pending = {}
+        _flushed_at = time.monotonic()
+    if scores:
+        persist(era, scores)
+
+
+def _rebase(era):
+    """Scale rows of earlier eras to `era`, dropping those that decayed away"""
+    for old in TrendingScore.objects.filter(era__lt=era).values_list('era', flat=True).distinct().order_by():
+        factor = 2.0 ** (-(era - old) * ERA_HALF_LIVES)
+        stale = TrendingScore.objects.filter(era=old)
+        if factor == 0:
+            stale.delete()
+            continue
+        stale.filter(score__lt=MIN_SCORE / factor).delete()
+        stale.update(era=era, score=F('score') * factor)
+
+
+def persist(era, scores):
+    """Add {product id: weight relative to `era`} to the stored scores"""
+    now = timezone.now()
+    pks = sorted(scores)
+    with transaction.atomic():
+        _rebase(era)
+        for start in range(0, len(pks), BATCH_SIZE):
+            categories = dict(
+                Product.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).values_list('pk', 'category_id')
+            )
+            TrendingScore.objects.bulk_create(
+                [TrendingScore(product_id=pk, category_id=category_id, era=era, score=0, updated_at=now)
+                 for pk, category_id in categories.items()],
+                ignore_conflicts=True,
+            )
+            TrendingScore.objects.bulk_update(
+                [TrendingScore(product_id=pk, category_id=category_id, score=F('score') + scores[pk], updated_at=now)
+                 for pk, category_id in categories.items()],
+                ['category', 'score', 'updated_at'],
+            )
+
+
+# ---- Serving -----------------------------------------------------------
+
+_leaderboards = OrderedDict()  # category id (None for overall) -> (loaded at, products)
+
+
+def _load(category_id):
+    now = timezone.now()
+    era = era_of(now)
+    scores = TrendingScore.objects.filter(era=era, product__is_active=True, product__is_approved=True)
+    if category_id is not None:
+        scores = scores.filter(category_id=category_id)
+    products = []
+    for row in scores.select_related('product').order_by('-score')[:LEADERBOARD_SIZE]:
+        row.product.trending_score = decayed(row.score, era, now)
+        products.append(row.product)
+    return products
+
+
+def top(category=None, limit=8):
+    """The `limit` products clicked most lately, overall or in `category`"""
+    key = category.pk if category is not None else None
+    entry = _leaderboards.get(key)
+    if entry is None or time.monotonic() - entry[0] >= settings.TRENDING_REFRESH_SECONDS:
+        entry = (time.monotonic(), _load(key))
+        with _lock:
+            _leaderboards[key] = entry
+            _leaderboards.move_to_end(key)
+            while len(_leaderboards) > MAX_LEADERBOARDS:
+                _leaderboards.popitem(last=False)
+    return entry[1][:limit]
@@ -9,14 +9,20 @@ urlpatterns = [
     path('products/<slug:slug>/', views.product_detail, name='product_detail'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
     path('merchant/<slug:slug>/', views.merchant_detail, name='merchant_detail'),
+    path('clickbank/', views.clickbank_product_list, name='clickbank_product_list'),
+    path('clickbank/<slug:slug>/', views.clickbank_product_detail, name='clickbank_product_detail'),
+    path('clickbank/<slug:slug>/go/', views.track_clickbank_click, name='track_clickbank_click'),
     path('track-click/<int:product_merchant_id>/', views.track_click, name='track_click'),
     path('chatbot-api/', views.chatbot_api, name='chatbot_api'),
+    path('search/suggest/', views.search_suggestions, name='search_suggestions'),
     path('robots.txt', views.robots_txt, name='robots_txt'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
     # Seller routes
     path('seller/register/', views.seller_register, name='seller_register'),
     path('seller/login/', views.seller_login_view, name='seller_login'),
     path('seller/dashboard/', views.seller_dashboard, name='seller_dashboard'),
     path('seller/add-product/', views.seller_add_product, name='seller_add_product'),
+    path('seller/import-products/', views.seller_import_products, name='seller_import_products'),
     path('checkout/<slug:slug>/', views.checkout_view, name='checkout'),
     path('order-confirmation/<str:order_id>/', views.order_confirmation, name='order_confirmation'),
     
@@ -1,16 +1,26 @@
+import datetime
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Q, Avg, Count
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.db import transaction
+from django.db.models import Q, Avg, Count, F, Sum
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseRedirect
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
-from .models import Product, Category, Merchant, ProductMerchant, Review, Seller, Banner, Order, OrderItem
+from .models import (Product, Category, Merchant, ProductMerchant, Review, Seller, Banner, Order, OrderItem, ProductStats,
+                     PriceSeries, ClickBankProduct)
+from . import (analytics, attribution, clickbank_ranking, conditional, facets, feeds, identity, ids, product_import,
+               sales_cube, spelling, suggest, tasks, tracking, trending)
 
 
 def home(request):
@@ -40,149 +50,171 @@ def home(request):
         'featured_products': featured_products,
         'categories': categories,
         'recent_products': recent_products,
+        'trending_products': trending.top(limit=6),
+        'top_offers': clickbank_ranking.top_offers(limit=4),
     }
     return render(request, 'shoplio_app/home.html', context)
 
 
 def product_list(request):
-    """List all products with filtering and search"""
-    try:
-        products = Product.objects.filter(is_active=True, is_approved=True)
-    except Exception:
-        products = Product.objects.none()
-    
-    # Search functionality
-    query = request.GET.get('q')
-    if query:
-        try:
-            products = products.filter(
+    """List all products with faceted filtering and search"""
+    def render_page():
+        index = facets.get_index()
+        within = None
+
+        # Search functionality
+        query = request.GET.get('q')
+        if query:
+            matching = Product.objects.filter(
                 Q(name__icontains=query) |
                 Q(description__icontains=query) |
                 Q(brand__icontains=query) |
                 Q(category__name__icontains=query)
-            )
-        except Exception:
-            pass
-    
-    # Category filter
-    category_slug = request.GET.get('category')
-    if category_slug:
-        try:
-            products = products.filter(category__slug=category_slug)
-        except Exception:
-            pass
-    
-    # Price range filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        try:
-            products = products.filter(base_price__gte=min_price)
-        except Exception:
-            pass
-    if max_price:
-        try:
-            products = products.filter(base_price__lte=max_price)
-        except Exception:
-            pass
-    
-    # Sorting
-    sort_by = request.GET.get('sort', 'newest')
-    try:
-        if sort_by == 'price_low':
-            products = products.order_by('base_price')
-        elif sort_by == 'price_high':
-            products = products.order_by('-base_price')
-        elif sort_by == 'rating':
-            products = products.order_by('-average_rating')
-        else:
-            products = products.order_by('-created_at')
-    except Exception:
-        products = products.order_by('-created_at')
-    
-    try:
-        categories = Category.objects.all()
-    except Exception:
-        categories = []
+            ).values_list('pk', flat=True).order_by()
+            within = facets.bitmap(matching)
+
+        # Price range filter
+        min_price = facets.parse_price(request.GET.get('min_price'))
+        max_price = facets.parse_price(request.GET.get('max_price'))
+        if min_price is not None or max_price is not None:
+            in_range = index.price_between(min_price, max_price)
+            within = in_range if within is None else within & in_range
+
+        result = index.search(facets.selection(index, request.GET), within)
+
+        # Offer a correction when a misspelled query finds nothing
+        did_you_mean = None
+        if query and not len(result):
+            corrected = spelling.get_corrector().correct(query)
+            if corrected != query.lower():
+                did_you_mean = corrected
+
+        # Sorting
+        sort_by = request.GET.get('sort', 'newest')
+        paginator = Paginator(result.ordered_ids(sort_by), 24)
+        page = paginator.get_page(request.GET.get('page'))
+        products = Product.objects.in_bulk(page.object_list)
+        products = [products[pk] for pk in page.object_list if pk in products]
+
+        query_string = request.GET.copy()
+        query_string.pop('page', None)
+        sort_query = query_string.copy()
+        sort_query.pop('sort', None)
+
+        context = {
+            'products': products,
+            'page_obj': page,
+            'result_count': paginator.count,
+            'facet_groups': result.groups(request.GET),
+            'query': query,
+            'did_you_mean': did_you_mean,
+            'sort_by': sort_by,
+            'query_string': query_string.urlencode(),
+            'sort_query': sort_query.urlencode(),
+        }
+        return render(request, 'shoplio_app/product_list.html', context)
     
-    context = {
-        'products': products,
-        'categories': categories,
-        'query': query,
-        'selected_category': category_slug,
-        'sort_by': sort_by,
-    }
-    return render(request, 'shoplio_app/product_list.html', context)
+    return conditional.respond(request, render_page, 'product_list')
 
 
 def product_detail(request, slug):
     """Product detail page with price comparison"""
     product = get_object_or_404(Product, slug=slug, is_active=True, is_approved=True)
+    analytics.record_detail_view(request, product)
     
-    try:
-        merchant_links = ProductMerchant.objects.filter(
-            product=product, 
-            is_active=True
-        ).select_related('merchant').order_by('price')
-    except Exception:
-        merchant_links = []
+    def render_page():
+        try:
+            merchant_links = ProductMerchant.objects.filter(
+                product=product, 
+                is_active=True
+            ).select_related('merchant').order_by('price')
+        except Exception:
+            merchant_links = []
     
-    try:
-        reviews = Review.objects.filter(product=product, is_approved=True).order_by('-created_at')[:10]
-    except Exception:
-        reviews = []
+        try:
+            reviews = Review.objects.filter(product=product, is_approved=True).order_by('-created_at')[:10]
+        except Exception:
+            reviews = []
     
-    # Related products
-    try:
-        related_products = Product.objects.filter(
-            category=product.category,
-            is_active=True
-        ).exclude(id=product.id)[:4]
-    except Exception:
-        related_products = []
+        # Related products
+        try:
+            related_products = Product.objects.filter(
+                category=product.category,
+                is_active=True
+            ).exclude(id=product.id)[:4]
+        except Exception:
+            related_products = []
+    
+        # Trend chart and badge come from the precomputed series, not the history table
+        price_series = PriceSeries.objects.filter(product=product).first()
+        lowest_price = merchant_links[0].price if merchant_links else None
+        # Only a drop counts: a price that never changed is not a "lowest"
+        is_lowest_in_90_days = False
+        if price_series is not None and lowest_price is not None:
+            range_90_days = price_series.range_since(timezone.localdate() - datetime.timedelta(days=90))
+            if range_90_days is not None:
+                low_90_days, high_90_days = range_90_days
+                is_lowest_in_90_days = low_90_days < high_90_days and lowest_price <= low_90_days
+    
+        context = {
+            'product': product,
+            'merchant_links': merchant_links,
+            'reviews': reviews,
+            'related_products': related_products,
+            'price_series': price_series,
+            'lowest_price': lowest_price,
+            'is_lowest_in_90_days': is_lowest_in_90_days,
+        }
+        return render(request, 'shoplio_app/product_detail.html', context)
     
-    context = {
-        'product': product,
-        'merchant_links': merchant_links,
-        'reviews': reviews,
-        'related_products': related_products,
-    }
-    return render(request, 'shoplio_app/product_detail.html', context)
+    return conditional.respond(request, render_page, 'product_detail', product.pk, updated_at=[product.updated_at])
 
 
 def category_detail(request, slug):
     """Category page showing all products in a category"""
     category = get_object_or_404(Category, slug=slug)
+    trending_products = trending.top(category, limit=4)
     
-    try:
-        products = Product.objects.filter(category=category, is_active=True, is_approved=True).order_by('-created_at')
-    except Exception:
-        products = Product.objects.none()
+    def render_page():
+        try:
+            products = Product.objects.filter(category=category, is_active=True, is_approved=True).order_by('-created_at')
+        except Exception:
+            products = Product.objects.none()
     
-    context = {
-        'category': category,
-        'products': products,
-    }
-    return render(request, 'shoplio_app/category_detail.html', context)
+        context = {
+            'category': category,
+            'products': products,
+            'trending_products': trending_products,
+            'top_offers': clickbank_ranking.top_offers(category, limit=4),
+        }
+        return render(request, 'shoplio_app/category_detail.html', context)
+    
+    # Trending changes without the catalog version moving
+    trending_ids = tuple(product.pk for product in trending_products)
+    return conditional.respond(request, render_page, 'category_detail', category.pk, trending_ids,
+                               updated_at=[category.updated_at])
 
 
 def merchant_detail(request, slug):
     """Merchant page showing all products from a merchant"""
     merchant = get_object_or_404(Merchant, slug=slug, is_active=True)
     
-    try:
-        product_merchants = ProductMerchant.objects.filter(
-            merchant=merchant,
-            is_active=True
-        ).select_related('product').order_by('-product__created_at')
-    except Exception:
-        product_merchants = []
+    def render_page():
+        try:
+            product_merchants = ProductMerchant.objects.filter(
+                merchant=merchant,
+                is_active=True
+            ).select_related('product', 'merchant').order_by('-product__created_at')
+        except Exception:
+            product_merchants = []
     
-    context = {
-        'merchant': merchant,
-        'product_merchants': product_merchants,
-    }
-    return render(request, 'shoplio_app/merchant_detail.html', context)
+        context = {
+            'merchant': merchant,
+            'product_merchants': product_merchants,
+        }
+        return render(request, 'shoplio_app/merchant_detail.html', context)
+    
+    return conditional.respond(request, render_page, 'merchant_detail', merchant.pk, updated_at=[merchant.updated_at])
 
 
 @require_http_methods(["GET"])
@@ -190,21 +222,16 @@ def track_click(request, product_merchant_id):
     """Track affiliate link clicks"""
     product_merchant = get_object_or_404(ProductMerchant, id=product_merchant_id)
     
-    # Get user info for tracking
-    ip_address = request.META.get('REMOTE_ADDR')
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    referrer = request.META.get('HTTP_REFERER', '')
-    
-    # Record the click with tracking info
-    from .models import ClickTracking
-    product_merchant.click_count += 1
-    product_merchant.save()
-    ClickTracking.objects.create(
-        product_merchant=product_merchant,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        referrer=referrer
-    )
+    # Record the click with tracking info, ignoring repeat hits
+    if not tracking.is_duplicate_click(request, f'merchant-link:{product_merchant.pk}'):
+        from .models import ClickTracking
+        ProductMerchant.objects.filter(pk=product_merchant.pk).update(click_count=F('click_count') + 1)
+        analytics.record_merchant_click(product_merchant.product_id)
+        trending.record_click(product_merchant.product_id)
+        ClickTracking.objects.create(
+            product_merchant=product_merchant,
+            **tracking.click_fields(request)
+        )
     
     # Determine redirect URL - use affiliate_link if valid, otherwise use merchant website or product_url
     redirect_url = product_merchant.affiliate_link
@@ -224,6 +251,122 @@ def track_click(request, product_merchant_id):
     return HttpResponseRedirect(redirect_url)
 
 
+# Sort options for the ClickBank listing: query value -> ordering
+CLICKBANK_SORTS = {
+    'featured': ('-is_featured', '-created_at'),
+    'newest': ('-created_at',),
+    'commission': ('-estimated_commission', '-created_at'),
+    'popular': ('-click_count', '-created_at'),
+    'price_low': ('price', '-created_at'),
+    'price_high': ('-price', '-created_at'),
+}
+CLICKBANK_SORT_LABELS = [
+    ('featured', 'Featured'),
+    ('commission', 'Highest Commission'),
+    ('popular', 'Most Popular'),
+    ('newest', 'Newest'),
+    ('price_low', 'Price: Low to High'),
+    ('price_high', 'Price: High to Low'),
+]
+
+
+def clickbank_product_list(request):
+    """Active ClickBank offers, optionally in one category, with paging"""
+    def render_page():
+        offers = ClickBankProduct.objects.filter(is_active=True)
+        category = None
+        category_slug = request.GET.get('category')
+        if category_slug:
+            category = Category.objects.filter(slug=category_slug).first()
+            offers = offers.filter(category=category) if category else offers.none()
+
+        sort_by = request.GET.get('sort', 'featured')
+        if sort_by not in CLICKBANK_SORTS:
+            sort_by = 'featured'
+        paginator = Paginator(offers.select_related('category').order_by(*CLICKBANK_SORTS[sort_by]), 24)
+        page = paginator.get_page(request.GET.get('page'))
+
+        query_string = request.GET.copy()
+        query_string.pop('page', None)
+        sort_query = query_string.copy()
+        sort_query.pop('sort', None)
+        context = {
+            'offers': page.object_list,
+            'page_obj': page,
+            'result_count': paginator.count,
+            'category': category,
+            'categories': Category.objects.filter(
+                pk__in=ClickBankProduct.objects.filter(is_active=True).values('category_id')
+            ).order_by('name'),
+            'sort_by': sort_by,
+            'sort_options': CLICKBANK_SORT_LABELS,
+            'query_string': query_string.urlencode(),
+            'sort_query': sort_query.urlencode(),
+        }
+        return render(request, 'shoplio_app/clickbank_product_list.html', context)
+
+    return conditional.respond(request, render_page, 'clickbank_product_list')
+
+
+def clickbank_product_detail(request, slug):
+    """A ClickBank offer with others from its category"""
+    offer = get_object_or_404(ClickBankProduct.objects.select_related('category'), slug=slug, is_active=True)
+
+    def render_page():
+        related = ClickBankProduct.objects.filter(
+            category_id=offer.category_id, is_active=True
+        ).exclude(pk=offer.pk).order_by('-is_featured', '-click_count')[:4]
+        context = {
+            'offer': offer,
+            'related_offers': related,
+        }
+        return render(request, 'shoplio_app/clickbank_product_detail.html', context)
+
+    return conditional.respond(request, render_page, 'clickbank_product_detail', offer.pk,
+                               updated_at=[offer.updated_at])
+
+
+@require_http_methods(["GET"])
+def track_clickbank_click(request, slug):
+    """Record a click on a ClickBank offer and send the visitor to its HopLink"""
+    offer = get_object_or_404(ClickBankProduct, slug=slug, is_active=True)
+    if not tracking.is_duplicate_click(request, f'clickbank-link:{offer.pk}'):
+        from .models import ClickBankClickTracking
+        ClickBankProduct.objects.filter(pk=offer.pk).update(click_count=F('click_count') + 1)
+        ClickBankClickTracking.objects.create(
+            clickbank_product=offer,
+            **tracking.click_fields(request)
+        )
+    return HttpResponseRedirect(offer.hoplink)
+
+
+def search_suggestions(request):
+    """Typeahead suggestions for the search box (JSON)"""
+    query = request.GET.get('q', '')[:100]
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), suggest.TOP_K)
+    except ValueError:
+        limit = 8
+    suggestions = [
+        {'label': label, 'kind': kind, 'url': suggest.url_for(kind, target)}
+        for label, kind, target in suggest.get_index().suggest(query, limit)
+    ]
+    response = JsonResponse({'query': query, 'suggestions': suggestions})
+    patch_cache_control(response, public=True, max_age=settings.SUGGEST_MAX_AGE)
+    return response
+
+
+@staff_member_required
+def sales_report(request):
+    """Sales cube sliced and grouped by the query parameters (JSON, staff only; see sales_cube.query_from)"""
+    try:
+        cells, group_by, limit = sales_cube.query_from(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows, totals = sales_cube.summarize(cells, group_by, limit)
+    return JsonResponse({'group_by': group_by, 'rows': rows, 'totals': totals})
+
+
 def robots_txt(request):
     """Generate robots.txt"""
     current_site = get_current_site(request)
@@ -249,7 +392,8 @@ def chatbot_api(request):
             'response': "Hi! 👋 I'm your SHOPLIO shopping assistant. I know all 28 products in our store! Ask me about:\n\n• Specific products (laptop, phone, shoes)\n• Categories (electronics, fashion, toys)\n• Price ranges (budget, premium)\n• Recommendations (best laptop, top rated)\n\nWhat can I help you find today?"
         })
     
-    message_lower = message.lower()
+    # Misspelled words ("samsng", "pents") are corrected before matching
+    message_lower = spelling.get_corrector().correct(message)
     
     # === GREETINGS ===
     greetings = ['hi', 'hello', 'hey', 'good morning', 'good evening']
@@ -738,6 +882,15 @@ def seller_login_view(request):
     return render(request, 'shoplio_app/seller_login.html')
 
 
+SELLER_PRODUCT_SORTS = {
+    'newest': ['-created_at', '-id'],
+    'views': [F('stats__detail_views').desc(nulls_last=True), '-id'],
+    'clicks': [F('stats__merchant_clicks').desc(nulls_last=True), '-id'],
+    'orders': [F('stats__orders').desc(nulls_last=True), '-id'],
+    'revenue': [F('stats__revenue').desc(nulls_last=True), '-id'],
+}
+
+
 @login_required
 def seller_dashboard(request):
     """Seller dashboard to manage products"""
@@ -747,19 +900,34 @@ def seller_dashboard(request):
         messages.error(request, 'You are not registered as a seller.')
         return redirect('shoplio_app:home')
     
-    products = Product.objects.filter(seller=seller).order_by('-created_at')
-    
-    # Statistics
-    total_products = products.count()
-    approved_products = products.filter(is_approved=True).count()
-    pending_products = products.filter(is_approved=False).count()
-    
+    products = Product.objects.filter(seller=seller)
+
+    # Statistics: one grouped query for the approval breakdown, one for the counters
+    by_state = dict(products.values_list('is_approved').annotate(count=Count('id')).order_by())
+    approved_products = by_state.get(True, 0)
+    pending_products = by_state.get(False, 0)
+    totals = ProductStats.objects.filter(product__seller=seller).aggregate(
+        views=Sum('detail_views'),
+        clicks=Sum('merchant_clicks'),
+        orders=Sum('orders'),
+        revenue=Sum('revenue'),
+    )
+
+    sort = request.GET.get('sort', 'newest')
+    ordering = SELLER_PRODUCT_SORTS.get(sort, SELLER_PRODUCT_SORTS['newest'])
+    paginator = Paginator(products.select_related('category', 'stats').order_by(*ordering), 25)
+    paginator.count = approved_products + pending_products  # already counted above
+    page_obj = paginator.get_page(request.GET.get('page'))
+
     context = {
         'seller': seller,
-        'products': products,
-        'total_products': total_products,
+        'products': page_obj,
+        'page_obj': page_obj,
+        'sort': sort,
+        'total_products': approved_products + pending_products,
         'approved_products': approved_products,
         'pending_products': pending_products,
+        'totals': totals,
     }
     return render(request, 'shoplio_app/seller_dashboard.html', context)
 
@@ -774,8 +942,6 @@ def seller_add_product(request):
         return redirect('shoplio_app:home')
     
     if request.method == 'POST':
-        from django.utils.text import slugify
-        
         name = request.POST.get('name')
         description = request.POST.get('description')
         category_id = request.POST.get('category')
@@ -786,13 +952,7 @@ def seller_add_product(request):
         
         try:
             category = Category.objects.get(id=category_id)
-            slug = slugify(name)
-            # Ensure unique slug
-            counter = 1
-            original_slug = slug
-            while Product.objects.filter(slug=slug).exists():
-                slug = f"{original_slug}-{counter}"
-                counter += 1
+            slug = product_import.allocate_slugs([name])[0]
             
             product = Product.objects.create(
                 name=name,
@@ -806,6 +966,10 @@ def seller_add_product(request):
                 image=image,
                 is_approved=False,  # Requires admin approval
             )
+            if product.image:
+                tasks.enqueue('optimize_product_image', {'product_id': product.pk},
+                              key=f'optimize_product_image:{product.pk}')
+            tasks.enqueue('match_products', {'product_ids': [product.pk]})
             messages.success(request, 'Product submitted for admin review!')
             return redirect('shoplio_app:seller_dashboard')
         except Exception as e:
@@ -815,6 +979,38 @@ def seller_add_product(request):
     return render(request, 'shoplio_app/seller_add_product.html', {'categories': categories})
 
 
+@login_required
+def seller_import_products(request):
+    """Seller bulk product import from a CSV, JSON-lines or XML file"""
+    try:
+        seller = request.user.seller_profile
+    except Seller.DoesNotExist:
+        messages.error(request, 'You are not registered as a seller.')
+        return redirect('shoplio_app:home')
+
+    result = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, 'Please choose a file to import.')
+        else:
+            fmt = request.POST.get('format') or feeds.detect_format(upload.name)
+            try:
+                result = product_import.import_products(upload, seller, fmt)
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, f'Could not read file: {str(e)}')
+            else:
+                if result.created:
+                    messages.success(request, f'{result.created} products submitted for admin review!')
+                if result.error_count:
+                    messages.warning(request, f'{result.error_count} rows were skipped.')
+
+    return render(request, 'shoplio_app/seller_import_products.html', {
+        'result': result,
+        'formats': feeds.FORMATS,
+    })
+
+
 def checkout_view(request, slug):
     """Checkout page for a specific product"""
     product = get_object_or_404(Product, slug=slug)
@@ -830,67 +1026,36 @@ def checkout_view(request, slug):
         # Calculate total
         total_amount = product.base_price * quantity
         
-        # Check for affiliate cookie
-        affiliate = None
-        affiliate_code = request.COOKIES.get('affiliate_code')
-        if affiliate_code:
-            try:
-                from .models import Affiliate
-                affiliate = Affiliate.objects.get(affiliate_code=affiliate_code, is_active=True, is_approved=True)
-            except Affiliate.DoesNotExist:
-                pass
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            affiliate=affiliate,  # Link affiliate to order
-            full_name=full_name,
-            email=email,
-            phone=phone,
-            address=address,
-            city=city,
-            total_amount=total_amount,
-            status='pending'
-        )
+        # Attribute the sale to the affiliate click named by the signed cookie
+        click, affiliate = attribution.resolve(request)
         
-        # Create order item
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            price=product.base_price,
-            quantity=quantity
-        )
-        
-        # Create commission if affiliate exists
-        if affiliate:
-            from .models import Commission, AffiliateClick
-            
-            # Create commission
-            Commission.objects.create(
-                affiliate=affiliate,
-                order=order,
-                product_name=product.name,
-                product_price=total_amount,
-                commission_rate=affiliate.commission_rate,
+        # Write the order, its item and the conversion in one transaction;
+        # commission and affiliate statistics are handled by the worker
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=request.user if request.user.is_authenticated else None,
+                affiliate=affiliate,  # Link affiliate to order
+                full_name=full_name,
+                email=email,
+                phone=phone,
+                address=address,
+                city=city,
+                total_amount=total_amount,
                 status='pending'
             )
             
-            # Update affiliate sales count
-            affiliate.total_sales += 1
-            affiliate.save()
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                price=product.base_price,
+                quantity=quantity
+            )
             
             # Mark affiliate click as converted
-            recent_click = AffiliateClick.objects.filter(
-                affiliate=affiliate,
-                product=product,
-                converted=False
-            ).order_by('-clicked_at').first()
+            if click:
+                attribution.mark_converted(click, order)
             
-            if recent_click:
-                recent_click.converted = True
-                recent_click.order = order
-                recent_click.converted_at = timezone.now()
-                recent_click.save()
+            tasks.enqueue('order_placed', {'order_id': order.pk})
         
         messages.success(request, f'Order placed successfully! Order ID: {order.order_id}')
         return redirect('shoplio_app:order_confirmation', order_id=order.order_id)
@@ -900,7 +1065,9 @@ def checkout_view(request, slug):
 
 def order_confirmation(request, order_id):
     """Order confirmation page"""
-    order = get_object_or_404(Order, order_id=order_id)
+    order = ids.find(Order.objects.all(), 'order_id', order_id)
+    if order is None:
+        raise Http404('No order with that id')
     return render(request, 'shoplio_app/order_confirmation.html', {'order': order})
 
 
@@ -1041,9 +1208,8 @@ def track_affiliate_click(request, affiliate_code):
     """Track affiliate click and redirect"""
     from .models import Affiliate, AffiliateClick
     
-    try:
-        affiliate = Affiliate.objects.get(affiliate_code=affiliate_code, is_active=True, is_approved=True)
-    except Affiliate.DoesNotExist:
+    affiliate = ids.find(Affiliate.objects.filter(is_active=True, is_approved=True), 'affiliate_code', affiliate_code)
+    if affiliate is None:
         messages.error(request, 'Invalid affiliate link.')
         return redirect('shoplio_app:home')
     
@@ -1057,30 +1223,29 @@ def track_affiliate_click(request, affiliate_code):
         except Product.DoesNotExist:
             pass
     
-    # Get tracking info
-    ip_address = request.META.get('REMOTE_ADDR')
-    user_agent = request.META.get('HTTP_USER_AGENT', '')
-    referrer = request.META.get('HTTP_REFERER', '')
-    
-    # Record click
-    AffiliateClick.objects.create(
-        affiliate=affiliate,
-        product=product,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        referrer=referrer
-    )
-    
-    # Update affiliate click count
-    affiliate.total_clicks += 1
-    affiliate.save()
+    # Record click and update affiliate click count, ignoring repeat hits
+    click = None
+    target = f'affiliate:{affiliate.pk}:{product.pk if product else ""}'
+    if not tracking.is_duplicate_click(request, target):
+        click = AffiliateClick.objects.create(
+            affiliate=affiliate,
+            product=product,
+            **tracking.click_fields(request)
+        )
+        Affiliate.objects.filter(pk=affiliate.pk).update(total_clicks=F('total_clicks') + 1)
+        identity.forget(affiliate.user_id)
+        if product:
+            trending.record_click(product.pk)
     
-    # Set cookie with affiliate code (30 days)
+    # Set cookies with affiliate code and signed click id for the attribution window
     response = HttpResponseRedirect(
         reverse('shoplio_app:product_detail', kwargs={'slug': product.slug}) if product 
         else reverse('shoplio_app:home')
     )
-    response.set_cookie('affiliate_code', affiliate_code, max_age=30*24*60*60)  # 30 days
+    response.set_cookie(attribution.AFFILIATE_COOKIE, affiliate.affiliate_code,
+                        max_age=int(attribution.attribution_window().total_seconds()))
+    if click:
+        attribution.set_click_cookie(response, click)
     
     return response
 
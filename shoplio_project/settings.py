@@ -60,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shoplio_app.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'shoplio_project.urls'
@@ -91,10 +92,47 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than memory, so tests can fork processes that share it
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache: shared Redis when REDIS_URL is set (needs the redis package),
+# otherwise a per-process memory cache
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# With a shared cache, sessions are read from the cache and written through to
+# the database, and the logged-in user and their seller/affiliate profile are
+# cached for IDENTITY_CACHE_SECONDS (see shoplio_app/identity.py). A
+# per-process cache would miss invalidations made by other processes (the
+# worker updates affiliate counters), so without Redis both stay in the
+# database. ModelBackend stays listed so sessions it logged in remain valid
+if os.getenv('REDIS_URL'):
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = [
+        'shoplio_app.identity.CachedModelBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+IDENTITY_CACHE_SECONDS = int(os.getenv('IDENTITY_CACHE_SECONDS', '300'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -135,13 +173,104 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
-# WhiteNoise configuration for static files
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Static files are minified, hashed and pre-compressed (gzip and Brotli) by
+# collectstatic and served by WhiteNoise. Development and tests use the
+# plain storage so they work without running collectstatic.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'shoplio_app.storage.MinifiedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Click retention: rows older than this are moved to compressed archive files
+CLICK_RETENTION_DAYS = int(os.getenv('CLICK_RETENTION_DAYS', '90'))
+CLICK_ARCHIVE_BATCH_SIZE = int(os.getenv('CLICK_ARCHIVE_BATCH_SIZE', '5000'))
+CLICK_ARCHIVE_ROOT = os.getenv('CLICK_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive', 'clicks'))
+
+# Per-process string -> id cache for interned user agents and referrers
+CLICK_INTERN_CACHE_SIZE = int(os.getenv('CLICK_INTERN_CACHE_SIZE', '10000'))
+
+# Repeat clicks from the same ip/user agent on the same target inside this
+# window are dropped before they are recorded (0 disables)
+CLICK_DEDUP_WINDOW_SECONDS = int(os.getenv('CLICK_DEDUP_WINDOW_SECONDS', '30'))
+CLICK_DEDUP_MAX_KEYS = int(os.getenv('CLICK_DEDUP_MAX_KEYS', '100000'))
+
+# Orders placed within this many days of an affiliate click are attributed to it
+AFFILIATE_ATTRIBUTION_WINDOW_DAYS = int(os.getenv('AFFILIATE_ATTRIBUTION_WINDOW_DAYS', '30'))
+
+# Background task queue (see shoplio_app/tasks.py)
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '5'))
+TASK_VISIBILITY_TIMEOUT = int(os.getenv('TASK_VISIBILITY_TIMEOUT', '300'))
+TASK_RETRY_BASE_DELAY = int(os.getenv('TASK_RETRY_BASE_DELAY', '10'))
+TASK_RETRY_MAX_DELAY = int(os.getenv('TASK_RETRY_MAX_DELAY', '3600'))
+
+# Seller uploads larger than this (px, longest side) are downscaled by a task
+PRODUCT_IMAGE_MAX_SIZE = int(os.getenv('PRODUCT_IMAGE_MAX_SIZE', '1200'))
+
+# Price history (see shoplio_app/price_history.py): chart buckets stay daily
+# for PRICE_HISTORY_DAILY_DAYS, then weekly until PRICE_HISTORY_KEEP_DAYS;
+# raw PriceChange rows are pruned after PRICE_HISTORY_RAW_DAYS
+PRICE_HISTORY_DAILY_DAYS = int(os.getenv('PRICE_HISTORY_DAILY_DAYS', '90'))
+PRICE_HISTORY_KEEP_DAYS = int(os.getenv('PRICE_HISTORY_KEEP_DAYS', '730'))
+PRICE_HISTORY_RAW_DAYS = int(os.getenv('PRICE_HISTORY_RAW_DAYS', '400'))
+
+# Rendered product cards are cached this long; keys change whenever the
+# product or the card template does, so this only bounds memory use
+PRODUCT_CARD_CACHE_SECONDS = int(os.getenv('PRODUCT_CARD_CACHE_SECONDS', '86400'))
+
+# Public catalog pages answer conditional GETs (see shoplio_app/conditional.py).
+# RELEASE_VERSION should change on every deploy so template changes get new
+# ETags; browsers revalidate after CATALOG_MAX_AGE, shared caches after
+# CATALOG_PROXY_MAX_AGE seconds
+RELEASE_VERSION = os.getenv('RELEASE_VERSION', os.getenv('RENDER_GIT_COMMIT', ''))
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '0'))
+CATALOG_PROXY_MAX_AGE = int(os.getenv('CATALOG_PROXY_MAX_AGE', '60'))
+
+# Each process rebuilds its product facet index (shoplio_app/facets.py) from
+# scratch at least this often; in between it is refreshed incrementally
+FACET_INDEX_MAX_AGE = int(os.getenv('FACET_INDEX_MAX_AGE', '3600'))
+
+# Search box suggestions (shoplio_app/suggest.py): the index is rebuilt, with
+# fresh click counts, at least this often; responses are cached for
+# SUGGEST_MAX_AGE seconds
+SUGGEST_INDEX_MAX_AGE = int(os.getenv('SUGGEST_INDEX_MAX_AGE', '3600'))
+SUGGEST_MAX_AGE = int(os.getenv('SUGGEST_MAX_AGE', '60'))
+
+# Spelling correction for search and the chatbot (shoplio_app/spelling.py) is
+# rebuilt from the catalog at least this often
+SPELLING_INDEX_MAX_AGE = int(os.getenv('SPELLING_INDEX_MAX_AGE', '3600'))
+
+# ClickBank offer ranking (shoplio_app/clickbank_ranking.py): clicks from the
+# last CLICKBANK_RANKING_WINDOW_DAYS count, halving in weight every
+# CLICKBANK_HALF_LIFE_DAYS; EPC assumes CLICKBANK_CONVERSION_RATE of clicks
+# buy. The best CLICKBANK_RANKING_SIZE offers are kept overall and per category
+CLICKBANK_RANKING_WINDOW_DAYS = int(os.getenv('CLICKBANK_RANKING_WINDOW_DAYS', '30'))
+CLICKBANK_HALF_LIFE_DAYS = float(os.getenv('CLICKBANK_HALF_LIFE_DAYS', '3'))
+CLICKBANK_CONVERSION_RATE = float(os.getenv('CLICKBANK_CONVERSION_RATE', '0.01'))
+CLICKBANK_RANKING_SIZE = int(os.getenv('CLICKBANK_RANKING_SIZE', '20'))
+
+# Trending products (shoplio_app/trending.py): a click's weight halves every
+# TRENDING_HALF_LIFE_HOURS. Each process writes its clicks to the database at
+# least every TRENDING_FLUSH_SECONDS and re-reads the leaderboards every
+# TRENDING_REFRESH_SECONDS
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '12'))
+TRENDING_FLUSH_SECONDS = int(os.getenv('TRENDING_FLUSH_SECONDS', '30'))
+TRENDING_REFRESH_SECONDS = int(os.getenv('TRENDING_REFRESH_SECONDS', '60'))
+
+# Streaming exports (shoplio_app/exports.py) read and write this many rows at
+# a time
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
 # Production Security Settings
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -0,0 +1,105 @@
+// SHOPLIO Search Suggestions
+// Typeahead for the navbar search box, backed by /search/suggest/
+
+document.addEventListener('DOMContentLoaded', function () {
+    const input = document.querySelector('.search-input[data-suggest-url]');
+    const list = document.getElementById('search-suggestions');
+    if (!input || !list) {
+        return;
+    }
+
+    const KIND_LABELS = { product: 'Product', brand: 'Brand', category: 'Category' };
+    const cache = new Map();
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function close() {
+        list.hidden = true;
+        list.innerHTML = '';
+        input.setAttribute('aria-expanded', 'false');
+        active = -1;
+    }
+
+    function highlight(index) {
+        const items = list.querySelectorAll('li');
+        items.forEach((item, position) => item.setAttribute('aria-selected', position === index ? 'true' : 'false'));
+        active = index;
+    }
+
+    function show(suggestions) {
+        list.innerHTML = '';
+        if (!suggestions.length) {
+            close();
+            return;
+        }
+        suggestions.forEach((suggestion, position) => {
+            const item = document.createElement('li');
+            item.setAttribute('role', 'option');
+            item.id = `search-suggestion-${position}`;
+            const link = document.createElement('a');
+            link.href = suggestion.url;
+            link.textContent = suggestion.label;
+            const kind = document.createElement('span');
+            kind.className = 'search-suggestion-kind';
+            kind.textContent = KIND_LABELS[suggestion.kind] || '';
+            link.appendChild(kind);
+            item.appendChild(link);
+            item.addEventListener('mouseenter', () => highlight(position));
+            list.appendChild(item);
+        });
+        list.hidden = false;
+        input.setAttribute('aria-expanded', 'true');
+        active = -1;
+    }
+
+    function fetchSuggestions(query) {
+        if (cache.has(query)) {
+            show(cache.get(query));
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+            .then(response => response.ok ? response.json() : { suggestions: [] })
+            .then(data => {
+                cache.set(query, data.suggestions);
+                if (input.value.trim() === query) {
+                    show(data.suggestions);
+                }
+            })
+            .catch(() => {});
+    }
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            close();
+            return;
+        }
+        timer = setTimeout(() => fetchSuggestions(query), 120);
+    });
+
+    input.addEventListener('keydown', function (event) {
+        const items = list.querySelectorAll('li');
+        if (list.hidden || !items.length) {
+            return;
+        }
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            const step = event.key === 'ArrowDown' ? 1 : -1;
+            highlight((active + step + items.length) % items.length);
+            input.setAttribute('aria-activedescendant', items[active].id);
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            window.location.href = items[active].querySelector('a').href;
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    input.addEventListener('blur', () => setTimeout(close, 150));
+});